@@ -30,6 +30,7 @@ import argparse
 
 import modules.config as gc
 import modules.remote_server as remote_server
+import modules.remote_server_async as remote_server_async
 import modules.version_info as vinfo
 
 
@@ -92,7 +93,10 @@ class GsatServer(gc.EventQueueIf):
 
     def run(self):
         try:
-            server = remote_server.RemoteServerThread(None)
+            if gc.CONFIG_DATA.get('/remote/AsyncServer', False):
+                server = remote_server_async.RemoteServerAsyncThread(None)
+            else:
+                server = remote_server.RemoteServerThread(None)
 
             # wait for server events
             while True:
@@ -29,7 +29,6 @@
 import os
 import time
 import random
-import hashlib
 import queue
 from functools import partial
 # import threading
@@ -1600,7 +1599,7 @@ class RootWidget(Screen, gc.EventQueueIf):
         except queue.Empty:
             pass
         else:
-            if ev.event_id == gc.EV_DATA_STATUS:
+            if ev.event_id in [gc.EV_DATA_STATUS, gc.EV_MACHINE_STATE]:
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
                     self.logger.info("EV_DATA_STATUS")
 
@@ -1645,10 +1644,9 @@ class RootWidget(Screen, gc.EventQueueIf):
                     self.logger.info("EV_DATA_OUT")
 
                 # TODO: control this via config
-                if ev.data[-1:] != "\n":
-                    ev.data = "{}\n".format(ev.data)
-
-                self.append_text("> {}".format(ev.data))
+                # coalesced data can hold several lines
+                for line in ev.data.splitlines():
+                    self.append_text("> {}\n".format(line))
 
             elif ev.event_id == gc.EV_PC_UPDATE:
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
@@ -1738,6 +1736,7 @@ class RootWidget(Screen, gc.EventQueueIf):
                 if gc.gsatrc_remote_client is not None:
                     gc.gsatrc_remote_client.add_event(gc.EV_CMD_GET_SYSTEM_INFO)
                     gc.gsatrc_remote_client.add_event(gc.EV_CMD_GET_SW_STATE)
+                    gc.gsatrc_remote_client.add_event(gc.EV_CMD_GET_MACHINE_STATE)
                     gc.gsatrc_remote_client.add_event(gc.EV_CMD_GET_GCODE_MD5)
 
             elif ev.event_id == gc.EV_RMT_PORT_CLOSE:
@@ -1784,8 +1783,7 @@ class RootWidget(Screen, gc.EventQueueIf):
                 old_md5_hash = self.remote_gcode_md5
                 self.remote_gcode_md5 = ev.data
 
-                h = hashlib.md5(str([]).encode('utf-8')).hexdigest()
-                if h != ev.data and self.serial_port_open and gc.gsatrc_remote_client:
+                if gc.GCODE_EMPTY_DIGEST != ev.data and self.serial_port_open and gc.gsatrc_remote_client:
                     if old_md5_hash != ev.data:
                         gc.gsatrc_remote_client.add_event(gc.EV_CMD_GET_GCODE)
 
@@ -35,6 +35,7 @@ import modules.version_info as vinfo
 import modules.config as gc
 import modules.machif_progexec as mi_progexec
 import modules.remote_server as remote_server
+import modules.remote_server_async as remote_server_async
 import modules.remote_client as remote_client
 
 text_queue = queue.Queue()
@@ -109,6 +110,8 @@ class ConsoleApp(gc.EventQueueIf):
         self.remote_str = ""
         self.run_time = ""
         self.pc_str = ""
+        self.perf_stats_lines = []
+        self.perf_stats_time = 0
 
         self.init()
 
@@ -330,96 +333,108 @@ class ConsoleApp(gc.EventQueueIf):
         """ Handle events coming from main UI
         """
         # process events from queue
-        try:
-            e = self._eventQueue.get_nowait()
-        except queue.Empty:
-            pass
-        else:
+        events = self.get_events()
+        for e in events:
+            self.process_event(e)
 
-            self.lastEventID = e.event_id
+        # redraw status once per batch, not once per event
+        if events:
+            self.update_status()
 
-            if e.event_id == gc.EV_DATA_STATUS:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_DATA_STATUS from 0x{:x}".format(id(e.sender)))
+    def process_event(self, e):
+        """ Handle single event
+        """
+        self.lastEventID = e.event_id
 
-                self.update_status(e.data)
+        if e.event_id in [gc.EV_DATA_STATUS, gc.EV_MACHINE_STATE]:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_DATA_STATUS from 0x{:x}".format(id(e.sender)))
 
-            elif e.event_id == gc.EV_DATA_OUT:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_DATA_OUT")
+            self.update_status(e.data, redraw=False)
 
-                print("> {}".format(str(e.data).strip()))
+        elif e.event_id == gc.EV_DATA_OUT:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_DATA_OUT")
 
-            elif e.event_id == gc.EV_HELLO:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_HELLO from 0x{:x}".format(id(e.sender)))
+            # coalesced data can hold several lines
+            for line in str(e.data).splitlines():
+                print("> {}".format(line.strip()))
 
-            elif e.event_id == gc.EV_GOOD_BYE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_GOOD_BYE from 0x{:x}".format(id(e.sender)))
+        elif e.event_id == gc.EV_HELLO:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_HELLO from 0x{:x}".format(id(e.sender)))
 
-            elif e.event_id == gc.EV_SER_PORT_OPEN:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_SER_PORT_OPEN from 0x{:x} {}".format(id(e.sender), e.sender))
+        elif e.event_id == gc.EV_GOOD_BYE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_GOOD_BYE from 0x{:x}".format(id(e.sender)))
 
-                if self.remoteClient is not None:
-                    self.remoteClient.add_event(gc.EV_CMD_GET_STATUS)
-                    self.machif = self.remoteClient
-                elif self.machifProgExec:
-                    self.machif = self.machifProgExec
+        elif e.event_id == gc.EV_SER_PORT_OPEN:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_SER_PORT_OPEN from 0x{:x} {}".format(id(e.sender), e.sender))
 
-            elif e.event_id == gc.EV_SER_PORT_CLOSE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_SER_PORT_CLOSE from 0x{:x} {}".format(id(e.sender), e.sender))
+            if self.remoteClient is not None:
+                self.remoteClient.add_event(gc.EV_CMD_GET_STATUS)
+                self.machif = self.remoteClient
+            elif self.machifProgExec:
+                self.machif = self.machifProgExec
 
-                self.device_str = ""
-                self.machif = None
+        elif e.event_id == gc.EV_SER_PORT_CLOSE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_SER_PORT_CLOSE from 0x{:x} {}".format(id(e.sender), e.sender))
 
-            elif e.event_id == gc.EV_RMT_HELLO:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_RMT_HELLO from 0x{:x} {}".format(id(e.sender), e.sender))
+            self.device_str = ""
+            self.machif = None
 
-                print(e.data)
+        elif e.event_id == gc.EV_RMT_HELLO:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_RMT_HELLO from 0x{:x} {}".format(id(e.sender), e.sender))
 
-            elif e.event_id == gc.EV_RMT_GOOD_BYE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_RMT_HELLO from 0x{:x} {}".format(id(e.sender), e.sender))
+            print(e.data)
 
-                self.remote_str = ""
-                self.device_str = ""
+        elif e.event_id == gc.EV_RMT_GOOD_BYE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_RMT_HELLO from 0x{:x} {}".format(id(e.sender), e.sender))
 
-            elif e.event_id == gc.EV_RMT_PORT_OPEN:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_RMT_PORT_OPEN from 0x{:x} {}".format(id(e.sender), e.sender))
+            self.remote_str = ""
+            self.device_str = ""
 
-                print(e.data)
+        elif e.event_id == gc.EV_RMT_PORT_OPEN:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_RMT_PORT_OPEN from 0x{:x} {}".format(id(e.sender), e.sender))
 
-                if self.remoteClient is not None:
-                    self.remoteClient.add_event(gc.EV_CMD_GET_CONFIG)
-                    self.remoteClient.add_event(gc.EV_CMD_GET_SYSTEM_INFO)
-                    self.remoteClient.add_event(gc.EV_CMD_GET_SW_STATE)
+            print(e.data)
 
-                    # if self.configData.get('/remote/AutoGcodeRequest', False):
-                    #     self.machif.add_event(gc.EV_CMD_GET_GCODE)
+            if self.remoteClient is not None:
+                self.remoteClient.add_event(gc.EV_CMD_GET_CONFIG)
+                self.remoteClient.add_event(gc.EV_CMD_GET_SYSTEM_INFO)
+                self.remoteClient.add_event(gc.EV_CMD_GET_SW_STATE)
+                self.remoteClient.add_event(gc.EV_CMD_GET_MACHINE_STATE)
 
-            elif e.event_id == gc.EV_RMT_PORT_CLOSE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_RMT_PORT_CLOSE from 0x{:x} {}".format(id(e.sender), e.sender))
+                # if self.configData.get('/remote/AutoGcodeRequest', False):
+                #     self.machif.add_event(gc.EV_CMD_GET_GCODE)
 
-            elif e.event_id == gc.EV_EXIT:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.info("EV_EXIT from 0x{:x} {}".format(id(e.sender), e.sender))
+        elif e.event_id == gc.EV_RMT_PORT_CLOSE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_RMT_PORT_CLOSE from 0x{:x} {}".format(id(e.sender), e.sender))
 
-                self.remote_str = ""
-                self.device_str = ""
-                self.remoteClient = None
-                self.machifProgExec = None
+        elif e.event_id == gc.EV_PERF_STATS:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_PERF_STATS from 0x{:x} {}".format(id(e.sender), e.sender))
 
-            else:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
-                    self.logger.error("got unknown event!! [{}]".format(str(e.event_id)))
+            self.perf_stats_lines = gc.get_perf_stats_lines(e.data)
 
-            self.update_status()
+        elif e.event_id == gc.EV_EXIT:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.info("EV_EXIT from 0x{:x} {}".format(id(e.sender), e.sender))
+
+            self.remote_str = ""
+            self.device_str = ""
+            self.remoteClient = None
+            self.machifProgExec = None
+
+        else:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                self.logger.error("got unknown event!! [{}]".format(str(e.event_id)))
 
     def process_text_queue(self):
         # process text from queue
@@ -479,7 +494,10 @@ class ConsoleApp(gc.EventQueueIf):
             self.logger = logging.getLogger()
 
             if self.cmd_line_options.server:
-                self.remoteServer = remote_server.RemoteServerThread(None)
+                if gc.CONFIG_DATA.get('/remote/AsyncServer', False):
+                    self.remoteServer = remote_server_async.RemoteServerAsyncThread(None)
+                else:
+                    self.remoteServer = remote_server.RemoteServerThread(None)
                 time.sleep(1)
                 self.remoteClient = remote_client.RemoteClientThread(self, host='localhost')
 
@@ -514,7 +532,10 @@ class ConsoleApp(gc.EventQueueIf):
                 self.process_text_queue()
                 self.process_queue()
                 self.process_keypad()
-                time.sleep(0.010)
+                self.request_perf_stats()
+
+                # wake up on new events, keypad is polled
+                self.wait_for_event(0.010)
 
         finally:
             if self.remoteServer is not None:
@@ -529,7 +550,18 @@ class ConsoleApp(gc.EventQueueIf):
             if (self.cmd_line_options.no_curses is False):
                 sys.stdout = self.org_sys_stdout
 
-    def update_status(self, data=None):
+    def request_perf_stats(self):
+        """ Periodically request pipeline performance counters
+        """
+        if self.machif is None:
+            return
+
+        time_now = time.time()
+        if time_now - self.perf_stats_time >= gc.PERF_STATS_POLL_PERIOD:
+            self.perf_stats_time = time_now
+            self.machif.add_event(gc.EV_CMD_GET_PERF_STATS)
+
+    def update_status(self, data=None, redraw=True):
 
         if data:
             if 'sr' in data:
@@ -590,7 +622,7 @@ class ConsoleApp(gc.EventQueueIf):
                 rx_data = str(data['rx_data']).strip()
                 print("{}".format(rx_data))
 
-        if (self.cmd_line_options.no_curses is False):
+        if redraw and self.cmd_line_options.no_curses is False:
             self.sta_box.erase()
             # self.sta_box.clear()
             self.sta_box.box()
@@ -641,6 +673,11 @@ class ConsoleApp(gc.EventQueueIf):
             self.sta_box.addstr(11, 43, "F11:Cycle Start")
             self.sta_box.addstr(11, 63, "F12:Hold")
 
+            # pipeline performance counters
+            perf_width = max(self.sta_width - 6, 0)
+            for row, line in enumerate(self.perf_stats_lines[:self.sta_height - 13]):
+                self.sta_box.addstr(12 + row, 3, line[:perf_width])
+
             # self.sta_box.touchwin()
             self.sta_box.refresh()
             # self.stdout_box.refresh()
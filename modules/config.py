@@ -23,11 +23,19 @@
 
 ----------------------------------------------------------------------------"""
 import os
+import io
+import math
 import time
+import hashlib
 import queue
+import threading
 import json
+import struct
+import pickle
+import zlib
 import logging
 from logging import Formatter
+from collections import OrderedDict
 
 """----------------------------------------------------------------------------
     Globals:
@@ -51,6 +59,38 @@ STATE_DATA = None
 SOCK_HEADER_SIZE = 10
 SOCK_DATA_SIZE = 2048
 
+GCODE_DIGEST_CHUNK_SIZE = 1024
+
+# G-code chunks kept by remote peers to only transfer chunks that changed
+GCODE_CHUNK_CACHE_MAX_LINES = 512 * 1024
+
+# remote message binary format version, 0 is pickle only (legacy peers)
+REMOTE_WIRE_VERSION = 1
+
+# remote messages this size and up are compressed (if peer handles it),
+# zlib level, and max size of a decompressed message
+REMOTE_COMPRESS_MIN_SIZE = 1024
+REMOTE_COMPRESS_LEVEL = 3
+REMOTE_MSG_MAX_SIZE = 256 * 1024 * 1024
+
+# remote clients with more than this waiting to be sent are disconnected
+REMOTE_CLIENT_QUEUE_MAX_BYTES = 8 * 1024 * 1024
+
+# remote server pending connections, pendants tend to (re)connect together
+REMOTE_LISTEN_BACKLOG = 64
+
+# max events handled by a thread loop in one pass, and max wait for events
+EVENT_QUEUE_DRAIN_MAX = 100
+EVENT_QUEUE_WAIT_TIMEOUT = 0.5
+
+# how often UIs request performance counters while connected, in seconds
+PERF_STATS_POLL_PERIOD = 1.0
+
+# max EV_DATA_STATUS/EV_DATA_OUT deliveries per second to each listener of
+# the exec thread, and listener queue depth above which they are held back
+STATUS_MAX_RATE = 20
+STATUS_COALESCE_MAX_DEPTH = 8
+
 # --------------------------------------------------------------------------
 # device commands
 # --------------------------------------------------------------------------
@@ -154,7 +194,10 @@ EV_CMD_GET_SW_STATE = 1074
 EV_CMD_GET_GCODE = 1075
 EV_CMD_GET_GCODE_MD5 = 1076
 EV_CMD_GET_BRK_PT = 1077
+EV_CMD_GET_PERF_STATS = 1078
+EV_CMD_GET_MACHINE_STATE = 1079
 EV_CMD_TXDATA = 1080
+EV_CMD_GET_GCODE_CHUNKS = 1081
 EV_CMD_CYCLE_START = 1090
 EV_CMD_FEED_HOLD = 1100
 EV_CMD_QUEUE_FLUSH = 1110
@@ -210,6 +253,10 @@ EV_RMT_CONFIG_DATA = 2250
 EV_RMT_SERIAL_PORTS = 2260
 EV_RMT_PING = 2270
 EV_RMT_PONG = 2280
+EV_PERF_STATS = 2290
+EV_MACHINE_STATE = 2300
+EV_RMT_CONFIG_CHANGES = 2310
+EV_GCODE_CHUNKS = 2320
 
 # --------------------------------------------------------------------------
 # VERBOSE MASK
@@ -414,12 +461,42 @@ class gsatStateData():
         self.fileIsOpen = False
         self.gcodeFileName = ""
         self.gcodeFileLines = []
+        self.gcodeFileDigest = GcodeDigest()
+
+
+def get_config_diff(old, new, key_path=""):
+    """
+    Get leaf values of new that are missing or different in old, as a
+    dictionary of key path to value. Keys only in old are not reported
+
+    """
+    changes = dict()
+
+    for key, value in new.items():
+        path = "{}/{}".format(key_path, key)
+
+        if isinstance(value, dict):
+            old_value = old.get(key) if isinstance(old, dict) else None
+            changes.update(get_config_diff(old_value if isinstance(old_value, dict) else {}, value, path))
+
+        elif not isinstance(old, dict) or key not in old or old[key] != value:
+            changes[path] = value
+
+    return changes
 
 
 class ConfigData(object):
     """
     Provides various data information
 
+    Lookups by key path string are cached (read-through), the cache is
+    cleared on every add/set/update/load. Code that modifies nodes
+    returned by get() directly must call changed().
+
+    Changes are published to subscribers by key path prefix, as a
+    dictionary of changed leaf key paths to their new value, version is
+    bumped on every change.
+
     """
     def __init__(self, config_fname=None):
 
@@ -427,18 +504,45 @@ class ConfigData(object):
 
         self.datastore = dict()
 
-    def add(self, key_path, val):
+        # key path -> (found, value), generation is bumped on every
+        # invalidation so lookups racing a change don't store stale values
+        self.keyCache = dict()
+        self.cacheGeneration = 0
+        self.version = 0
+
+        # (prefix, callback) list, replaced (not modified) when it changes
+        # so other threads can walk it while publishing
+        self.subscribers = []
+
+    def __getstate__(self):
+        # cache is rebuilt on demand and subscribers are local, don't send
+        # them over remote links
+        state = self.__dict__.copy()
+        state['keyCache'] = dict()
+        state['subscribers'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('keyCache', dict())
+        self.__dict__.setdefault('cacheGeneration', 0)
+        self.__dict__.setdefault('version', 0)
+        self.__dict__.setdefault('subscribers', [])
+
+    def _add(self, key_list, val):
         """
-        Add new key value pair
+        Add value, return dictionary of changed leaf key paths
 
         """
-        if type(key_path) is list:
-            key_list = key_path
-        else:
-            key_list = key_path.split("/")
+        key_path = "/{}".format("/".join(key_list))
+        old_val = self.get(key_list, self)
 
-            if key_list[0] == "":
-                key_list.pop(0)
+        if isinstance(val, dict) or isinstance(old_val, dict):
+            changes = get_config_diff(old_val, val, key_path)
+        elif old_val is self or old_val != val:
+            changes = {key_path: val}
+        else:
+            changes = {}
 
         node = self.get(key_list[:-1])
 
@@ -454,11 +558,78 @@ class ConfigData(object):
 
         node[key_list[-1:][0]] = val
 
+        return changes
+
+    def add(self, key_path, val):
+        """
+        Add new key value pair
+
+        """
+        if type(key_path) is list:
+            key_list = key_path
+        else:
+            key_list = key_path.split("/")
+
+            if key_list[0] == "":
+                key_list.pop(0)
+
+        changes = self._add(key_list, val)
+
+        self.changed(changes)
+
+    def changed(self, changes=None):
+        """
+        Data changed, drop cached lookups and publish changes
+
+        """
+        # bump before clearing, see get()
+        self.cacheGeneration += 1
+        self.keyCache.clear()
+
+        if changes:
+            self.version += 1
+
+            for prefix, callback in self.subscribers:
+                if prefix in ["", "/"]:
+                    subset = changes
+                else:
+                    subset = {k: v for k, v in changes.items() if k == prefix or k.startswith(prefix + "/")}
+
+                if subset:
+                    callback(subset)
+
     def get(self, key_path, default_rv=None):
         """
         Get value for a given key
 
         """
+        if type(key_path) is str:
+            cached = self.keyCache.get(key_path)
+
+            if cached is None:
+                generation = self.cacheGeneration
+                key_list = key_path.split("/")
+
+                if key_list[0] == "":
+                    key_list.pop(0)
+
+                # self as default marks key not found
+                return_val = self.get(key_list, self)
+                cached = (return_val is not self, return_val)
+
+                # don't cache a value looked up before a change, check
+                # again after storing in case changed() ran in between
+                if generation == self.cacheGeneration:
+                    self.keyCache[key_path] = cached
+
+                    if generation != self.cacheGeneration:
+                        self.keyCache.pop(key_path, None)
+
+            if cached[0]:
+                return cached[1]
+
+            return default_rv
+
         return_val = default_rv
 
         if type(key_path) is list:
@@ -485,6 +656,13 @@ class ConfigData(object):
 
         return return_val
 
+    def get_diff(self, other):
+        """
+        Get changes (key path to value) that make this config like other
+
+        """
+        return get_config_diff(self.datastore, other.datastore)
+
     def set(self, key_path, val):
         """
         Set value for a given key
@@ -492,6 +670,36 @@ class ConfigData(object):
         """
         self.add(key_path, val)
 
+    def subscribe(self, prefix, callback):
+        """
+        Call callback(changes) when keys under prefix ("/machine", "/" for
+        all) change. Callback runs in the thread making the change, post an
+        event to the owner thread if needed
+
+        """
+        self.subscribers = self.subscribers + [(prefix.rstrip("/"), callback)]
+
+    def unsubscribe(self, callback):
+        self.subscribers = [s for s in self.subscribers if s[1] != callback]
+
+    def update(self, changes):
+        """
+        Set several key paths at once (i.e. changes from another config),
+        subscribers are called once
+
+        """
+        all_changes = dict()
+
+        for key_path, val in changes.items():
+            key_list = key_path.split("/")
+
+            if key_list[0] == "":
+                key_list.pop(0)
+
+            all_changes.update(self._add(key_list, val))
+
+        self.changed(all_changes)
+
     def load(self):
         """
         Load data from config file
@@ -514,24 +722,26 @@ class ConfigData(object):
                         else:
                             destination_dict[key] = source_dict[key]
 
+                changes = get_config_diff(self.datastore, datastore)
+
                 deep_update(self.datastore, datastore)
 
+                self.changed(changes)
+
     def save(self):
         """
         Save data to config file
 
         """
         if self.configFileName is not None:
-            temp_store = None
-            if 'temp' in self.datastore:
-                temp_store = self.datastore
-                del self.datastore['temp']
+            # temp data is not saved
+            temp_store = self.datastore.pop('temp', None)
 
             with open(self.configFileName, 'w') as f:
                 json.dump(self.datastore, f, indent=3, sort_keys=True)
 
             if temp_store is not None:
-                self.datastore = temp_store
+                self.datastore['temp'] = temp_store
 
     def dump(self):
         """
@@ -655,6 +865,8 @@ class gsatConfigData(ConfigData):
                 }
             },
             "Port": "",
+            "StatusMaxRate": STATUS_MAX_RATE,
+            "StreamingEnable": False,
             "Probe": {
                 "X": {
                     "FeedRate": 100,
@@ -723,7 +935,9 @@ class gsatConfigData(ConfigData):
             "TcpPort": 61801,
             "UdpPort": 61802,
             "UdpBroadcast": False,
-            "AutoGcodeRequest": False
+            "AutoGcodeRequest": False,
+            "CompressMinSize": REMOTE_COMPRESS_MIN_SIZE,
+            "AsyncServer": False
         }
     }
 
@@ -765,15 +979,78 @@ class EventQueueIf(object):
     def __init__(self):
         self._eventListeners = dict()
         self._eventQueue = queue.Queue()
+        self._eventCondition = threading.Condition()
+        self._eventWakeup = False
+        self._eventQueueMaxDepth = 0
+        self._eventQueueDwell = LatencyHistogram("event queue dwell")
 
     def add_event_listener(self, listener):
         self._eventListeners[id(listener)] = listener
 
     def add_event(self, event_id, event_data=None, sender=None):
         if type(event_id) is SimpleEvent:
-            self._eventQueue.put(event_id)
+            e = event_id
         else:
-            self._eventQueue.put(SimpleEvent(event_id, event_data, sender))
+            e = SimpleEvent(event_id, event_data, sender)
+
+        e.queueTime = time.perf_counter()
+        self._eventQueue.put(e)
+        self.wakeup()
+
+    def get_event(self):
+        """
+        Get next event without waiting, None if queue is empty
+
+        """
+        events = self.get_events(1)
+
+        if events:
+            return events[0]
+
+        return None
+
+    def get_events(self, max_events=EVENT_QUEUE_DRAIN_MAX):
+        """
+        Get up to max_events pending events without waiting
+
+        """
+        events = []
+
+        depth = self._eventQueue.qsize()
+        if not depth:
+            return events
+
+        if depth > self._eventQueueMaxDepth:
+            self._eventQueueMaxDepth = depth
+
+        time_now = time.perf_counter()
+
+        while len(events) < max_events:
+            try:
+                e = self._eventQueue.get_nowait()
+            except queue.Empty:
+                break
+
+            events.append(e)
+            self._eventQueueDwell.add(time_now - getattr(e, 'queueTime', time_now))
+
+        return events
+
+    def get_event_queue_depth(self):
+        return self._eventQueue.qsize()
+
+    def get_event_queue_stats(self):
+        """
+        Get queue depth now, max depth seen and dwell time summary
+
+        """
+        stats = {
+            'depth': self._eventQueue.qsize(),
+            'max_depth': self._eventQueueMaxDepth,
+            'dwell': self._eventQueueDwell.get_summary(),
+        }
+
+        return stats
 
     def notify_event_listeners(self, event_id, data=None):
         for listener in self._eventListeners.keys():
@@ -789,6 +1066,30 @@ class EventQueueIf(object):
         else:
             other.add_event(event_id, event_data, self)
 
+    def wait_for_event(self, timeout=EVENT_QUEUE_WAIT_TIMEOUT):
+        """
+        Wait until there are events in the queue, wakeup() is called or
+        timeout, return True if there are events pending
+
+        """
+        with self._eventCondition:
+            if self._eventQueue.empty() and not self._eventWakeup:
+                self._eventCondition.wait(timeout)
+
+            self._eventWakeup = False
+
+        return not self._eventQueue.empty()
+
+    def wakeup(self):
+        """
+        Wake up thread waiting in wait_for_event, threads waiting on other
+        I/O override this
+
+        """
+        with self._eventCondition:
+            self._eventWakeup = True
+            self._eventCondition.notify_all()
+
 
 class TimeOut(object):
     """
@@ -829,3 +1130,1089 @@ class TimeOut(object):
             rcVal = True
 
         return rcVal
+
+
+class GcodeDigest(object):
+    """
+    Program identity, hash tree of the G-code lines. Lines are hashed in
+    chunks and the digest is the hash of all chunk hashes. Every update is
+    a full O(n) pass, each chunk is compared with the lines of the last
+    update (kept as a copy, so lists modified in place are seen too) and
+    only chunks that changed are hashed again.
+
+    """
+
+    def __init__(self, lines=None, chunk_size=GCODE_DIGEST_CHUNK_SIZE):
+        self.chunkSize = chunk_size
+        self.lines = None
+        self.chunkDigests = []
+        self.digest = None
+
+        if lines is None:
+            lines = []
+
+        self.update(lines)
+
+    def get_chunk_digests(self):
+        return self.chunkDigests
+
+    def get_digest(self):
+        return self.digest
+
+    def update(self, lines):
+        """
+        Update hash tree with new lines, return new digest
+
+        """
+        old_lines = self.lines if self.lines is not None else []
+        old_chunk_digests = self.chunkDigests
+        chunk_digests = []
+
+        for index, start in enumerate(range(0, len(lines), self.chunkSize)):
+            end = start + self.chunkSize
+            chunk = lines[start:end]
+
+            if index < len(old_chunk_digests) and chunk == old_lines[start:end]:
+                chunk_digests.append(old_chunk_digests[index])
+            else:
+                chunk_digests.append(get_gcode_chunk_digest(chunk))
+
+        h = hashlib.md5(str(len(lines)).encode('utf-8'))
+        for chunk_digest in chunk_digests:
+            h.update(chunk_digest)
+
+        self.lines = list(lines)
+        self.chunkDigests = chunk_digests
+        self.digest = h.hexdigest()
+
+        return self.digest
+
+
+def get_gcode_chunk_digest(chunk):
+    """
+    Digest of a chunk of G-code lines, also its key in GcodeChunkCache
+
+    """
+    return hashlib.md5("\0".join(chunk).encode('utf-8')).digest()
+
+
+def get_gcode_digest(lines):
+    """
+    Digest of G-code lines, for one time use, keep a GcodeDigest object
+    to get incremental updates
+
+    """
+    return GcodeDigest(lines).digest
+
+
+GCODE_EMPTY_DIGEST = get_gcode_digest([])
+
+
+class GcodeChunkCache(object):
+    """
+    G-code chunks by digest, used by remote peers to send a program as a
+    list of chunk digests (manifest) plus only the chunks the other side
+    doesn't have. Least recently used chunks are dropped when the cache
+    holds more than max_lines lines, except chunks of the current program
+    (last manifest added or unpacked), these are pinned and kept even if
+    the program is bigger than the cache. A cache can be shared by threads.
+
+    """
+
+    def __init__(self, max_lines=GCODE_CHUNK_CACHE_MAX_LINES):
+        self.chunks = OrderedDict()
+        self.pinned = set()
+        self.lineCount = 0
+        self.maxLines = max_lines
+        self.lock = threading.RLock()
+
+    def __contains__(self, digest):
+        return digest in self.chunks
+
+    def add(self, digest, chunk):
+        with self.lock:
+            if digest in self.chunks:
+                self.chunks.move_to_end(digest)
+                return
+
+            self.chunks[digest] = chunk
+            self.lineCount += len(chunk)
+
+            while self.lineCount > self.maxLines:
+                old_digest = next((d for d in self.chunks if d not in self.pinned and d != digest), None)
+
+                if old_digest is None:
+                    # only current program left
+                    break
+
+                self.lineCount -= len(self.chunks.pop(old_digest))
+
+    def add_chunk_data(self, chunk_data):
+        """
+        Add chunks received from a peer, chunks that don't match their
+        digest are dropped. Return number of chunks dropped, raises
+        ValueError if chunk_data is not a dictionary
+
+        """
+        if type(chunk_data) is not dict:
+            raise ValueError("G-code chunk data must be a dictionary")
+
+        dropped = 0
+
+        for digest, chunk in chunk_data.items():
+            try:
+                valid = isinstance(chunk, list) and get_gcode_chunk_digest(chunk) == digest
+            except TypeError:
+                valid = False
+
+            if valid:
+                self.add(digest, chunk)
+            else:
+                dropped += 1
+
+        return dropped
+
+    def add_lines(self, gcode_digest):
+        """
+        Add chunks of GcodeDigest lines, return manifest
+
+        """
+        lines = gcode_digest.lines
+        chunk_size = gcode_digest.chunkSize
+        manifest = gcode_digest.get_chunk_digests()
+
+        with self.lock:
+            self.pin(manifest)
+
+            for index, digest in enumerate(manifest):
+                if digest in self.chunks:
+                    self.chunks.move_to_end(digest)
+                else:
+                    self.add(digest, lines[index * chunk_size:(index + 1) * chunk_size])
+
+        return list(manifest)
+
+    def get_chunk_data(self, digests):
+        """
+        Get chunks by digest, return (chunk data, missing digests), raises
+        ValueError if digests is not a collection of digest strings
+
+        """
+        self.check_digests(digests)
+
+        with self.lock:
+            chunk_data = {d: self.chunks[d] for d in digests if d in self.chunks}
+
+        missing = set(digests) - set(chunk_data)
+
+        return chunk_data, missing
+
+    def pack(self, gcode_dict, gcode_digest, peer_chunks):
+        """
+        Copy of G-code dictionary with 'gcodeLines' replaced by the
+        manifest ('gcodeChunks') and the chunks not in peer_chunks
+        ('gcodeChunkData'), peer_chunks (digests the peer has) is updated
+
+        """
+        gcode_dict = dict(gcode_dict)
+        gcode_digest.update(gcode_dict.pop('gcodeLines'))
+        manifest = self.add_lines(gcode_digest)
+
+        # peer cache may drop chunks too, forget everything once in a while
+        if len(peer_chunks) > 2 * self.maxLines // gcode_digest.chunkSize:
+            peer_chunks.clear()
+
+        # nothing known about peer (new connection), its cache may have all
+        # chunks already, send manifest only and let it ask for the rest
+        gcode_dict['gcodeChunks'] = manifest
+        if peer_chunks:
+            gcode_dict['gcodeChunkData'], missing = self.get_chunk_data(set(manifest) - peer_chunks)
+        else:
+            gcode_dict['gcodeChunkData'] = {}
+
+        peer_chunks.update(manifest)
+
+        return gcode_dict
+
+    def unpack(self, gcode_dict, peer_chunks):
+        """
+        Copy of packed G-code dictionary with 'gcodeLines', return
+        (dictionary, missing digests), dictionary is None if chunks are
+        missing. Raises ValueError if manifest or chunk data are malformed
+        (they come from the peer)
+
+        """
+        manifest = gcode_dict['gcodeChunks']
+        chunk_data = gcode_dict.get('gcodeChunkData', {})
+
+        if type(manifest) is not list:
+            raise ValueError("G-code chunk manifest must be a list")
+
+        self.check_digests(manifest)
+
+        if type(chunk_data) is not dict:
+            raise ValueError("G-code chunk data must be a dictionary")
+
+        with self.lock:
+            # new program, don't let its own chunks push each other out
+            self.pin(manifest)
+            self.add_chunk_data(chunk_data)
+
+        lines, missing = self.get_lines(manifest)
+
+        if lines is None:
+            return None, missing
+
+        peer_chunks.update(manifest)
+
+        gcode_dict = dict(gcode_dict)
+        del gcode_dict['gcodeChunks']
+        gcode_dict.pop('gcodeChunkData', None)
+        gcode_dict['gcodeLines'] = lines
+
+        return gcode_dict, missing
+
+    @staticmethod
+    def check_digests(digests):
+        """
+        Raise ValueError unless digests is a list, tuple or set of digests
+        (bytes)
+
+        """
+        if type(digests) not in (list, tuple, set, frozenset) or \
+           not all(type(d) is bytes for d in digests):
+            raise ValueError("G-code chunk digests must be a list of bytes")
+
+    def pin(self, manifest):
+        """
+        Keep chunks of manifest (current program), replaces previous pins
+
+        """
+        with self.lock:
+            self.pinned = set(manifest)
+
+    def get_lines(self, manifest):
+        """
+        Build lines from manifest, return (lines, missing digests), lines
+        is None if any chunk is missing
+
+        """
+        with self.lock:
+            missing = [d for d in manifest if d not in self.chunks]
+
+            if missing:
+                return None, missing
+
+            lines = []
+            for digest in manifest:
+                lines.extend(self.chunks[digest])
+
+        return lines, missing
+
+
+class LatencyHistogram(object):
+    """
+    Latency histogram, samples are counted in power of two buckets of
+    microseconds, bucket n holds samples below 2^n us
+
+    """
+
+    def __init__(self, name="", bucket_count=32):
+        self.name = name
+        self.bucketCount = bucket_count
+        self.reset()
+
+    def add(self, latency):
+        """
+        Add latency sample in seconds
+
+        """
+        us = int(latency * 1000000)
+        index = min(us.bit_length(), self.bucketCount - 1)
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += latency
+
+        if self.min is None or latency < self.min:
+            self.min = latency
+
+        if latency > self.max:
+            self.max = latency
+
+    def get_percentile(self, percentile):
+        """
+        Get upper bound in seconds of the bucket holding the percentile
+
+        """
+        if not self.count:
+            return 0.0
+
+        target = self.count * percentile / 100.0
+        running = 0
+
+        for index, count in enumerate(self.buckets):
+            running += count
+            if running >= target:
+                return min((1 << index) / 1000000.0, self.max)
+
+        return self.max
+
+    def get_report(self):
+        """
+        Get histogram as list of text lines
+
+        """
+        report = []
+        summary = self.get_summary()
+        report.append(
+            f"{self.name} count:{summary['count']} avg:{summary['avg']*1000:.3f}ms "
+            f"min:{summary['min']*1000:.3f}ms max:{summary['max']*1000:.3f}ms "
+            f"p50:{summary['p50']*1000:.3f}ms p99:{summary['p99']*1000:.3f}ms")
+
+        for index, count in enumerate(self.buckets):
+            if count:
+                report.append(f"  < {1 << index:>10}us: {count}")
+
+        return report
+
+    def get_summary(self):
+        summary = {
+            'count': self.count,
+            'avg': self.total / self.count if self.count else 0.0,
+            'min': self.min if self.min is not None else 0.0,
+            'max': self.max,
+            'p50': self.get_percentile(50),
+            'p90': self.get_percentile(90),
+            'p99': self.get_percentile(99),
+        }
+
+        return summary
+
+    def reset(self):
+        self.buckets = [0] * self.bucketCount
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+
+class PerfCounters(object):
+    """
+    Named counters, value statistics and latency timers, always on. Only
+    the owner thread updates them, other threads read snapshots with
+    get_stats()
+
+    """
+
+    def __init__(self, name=""):
+        self.name = name
+        self.reset()
+
+    def add_time(self, key, latency):
+        """
+        Add latency sample in seconds to timer
+
+        """
+        timer = self.timers.get(key)
+
+        if timer is None:
+            timer = self.get_timer(key)
+
+        timer.add(latency)
+
+    def add_value(self, key, value):
+        """
+        Add sample to value statistics (count, avg, min, max, last)
+
+        """
+        stats = self.values.get(key)
+
+        if stats is None:
+            self.values[key] = [1, value, value, value, value]
+        else:
+            stats[0] += 1
+            stats[1] += value
+            if value < stats[2]:
+                stats[2] = value
+            if value > stats[3]:
+                stats[3] = value
+            stats[4] = value
+
+    def get_stats(self):
+        """
+        Get snapshot of all data, plain types only (safe to pickle)
+
+        """
+        values = dict()
+        for key, stats in list(self.values.items()):
+            count, total, vmin, vmax, last = stats
+            values[key] = {'count': count, 'avg': total / count, 'min': vmin, 'max': vmax, 'last': last}
+
+        timers = dict()
+        for key, timer in list(self.timers.items()):
+            timers[key] = timer.get_summary()
+
+        stats = {
+            'counters': dict(self.counters),
+            'values': values,
+            'timers': timers,
+        }
+
+        return stats
+
+    def get_timer(self, key):
+        """
+        Get (create) timer histogram
+
+        """
+        timer = self.timers.get(key)
+
+        if timer is None:
+            timer = LatencyHistogram(key)
+            self.timers[key] = timer
+
+        return timer
+
+    def incr(self, key, count=1):
+        self.counters[key] = self.counters.get(key, 0) + count
+
+    def reset(self):
+        self.counters = dict()
+        self.values = dict()
+        self.timers = dict()
+
+
+def get_perf_stats_lines(perf_stats):
+    """
+    Format EV_PERF_STATS data as short text lines for status displays
+
+    """
+    lines = []
+
+    machif = perf_stats.get('machif', {})
+    counters = machif.get('counters', {})
+    lines.append("Lines sent/ack/err: {}/{}/{}".format(
+        counters.get('lines_sent', 0), counters.get('lines_acked', 0), counters.get('lines_errored', 0)))
+
+    timer = machif.get('timers', {}).get('write_to_ack')
+    if timer is not None:
+        lines.append("Write to ack: p50 {:.1f}ms p99 {:.1f}ms".format(timer['p50'] * 1000, timer['p99'] * 1000))
+
+    timer = perf_stats.get('serial', {}).get('timers', {}).get('queue_to_write')
+    if timer is not None:
+        lines.append("Queue to write: p50 {:.2f}ms p99 {:.2f}ms".format(timer['p50'] * 1000, timer['p99'] * 1000))
+
+    if counters.get('status_polls'):
+        lines.append("Status polls: {} ({} bytes rx)".format(
+            counters['status_polls'], counters.get('status_rx_bytes', 0)))
+
+    buffer = machif.get('values', {}).get('buffer_prcnt')
+    if buffer is not None:
+        lines.append("Device buffer: avg {:.0f}% max {:.0f}%".format(buffer['avg'], buffer['max']))
+
+    for name, label in [('remote', "Server"), ('remote_client', "Client")]:
+        counters = perf_stats.get(name, {}).get('counters', {})
+        if counters.get('tx_msgs') or counters.get('rx_msgs'):
+            lines.append("{} tx/rx: {:.1f}/{:.1f}KB (raw {:.1f}/{:.1f}KB)".format(
+                label, counters.get('tx_bytes', 0) / 1024, counters.get('rx_bytes', 0) / 1024,
+                counters.get('tx_raw_bytes', 0) / 1024, counters.get('rx_raw_bytes', 0) / 1024))
+
+    queues = []
+    for name in ['exec', 'machif', 'serial', 'remote']:
+        queue_stats = perf_stats.get(name, {}).get('queue')
+        if queue_stats is not None:
+            queues.append("{} {}/{}".format(name, queue_stats['depth'], queue_stats['max_depth']))
+
+    if queues:
+        lines.append("Queues (depth/max): {}".format(", ".join(queues)))
+
+    return lines
+
+
+# machine state fields, same names as status report (sr) keys
+MACHINE_STATE_FIELDS = (
+    'posx', 'posy', 'posz', 'posa', 'posb', 'posc', 'vel', 'stat', 'ib', 'ov', 'wco', 'fb', 'fv', 'machif', 'prcnt',
+    'rtime', 'pc', 'swstate')
+MACHINE_STATE_FIELDS_SET = frozenset(MACHINE_STATE_FIELDS)
+
+
+class MachineState(object):
+    """
+    Machine state owned by the exec thread. Status reports are applied as
+    they arrive, apply() returns a change-set with only the fields that
+    changed and bumps the version. Listeners get change-sets, a listener
+    that fell behind (or just connected) can ask for a snapshot and
+    continue from its version.
+
+    Fields not in MACHINE_STATE_FIELDS (device specific status) are kept in
+    "other".
+
+    """
+
+    __slots__ = MACHINE_STATE_FIELDS + ('other', 'version')
+
+    def __init__(self):
+        self.version = 0
+        self.reset()
+
+    def apply(self, *data_list):
+        """
+        Apply status dictionaries, return dictionary of changed fields
+
+        """
+        changes = {}
+
+        for data in data_list:
+            if not data:
+                continue
+
+            for key, value in data.items():
+                if key in MACHINE_STATE_FIELDS_SET:
+                    if getattr(self, key) != value:
+                        setattr(self, key, value)
+                        changes[key] = value
+
+                elif key not in self.other or self.other[key] != value:
+                    self.other[key] = value
+                    changes[key] = value
+
+        if changes:
+            self.version += 1
+
+        return changes
+
+    def get_snapshot(self):
+        """
+        Get all known fields
+
+        """
+        snapshot = dict(self.other)
+
+        for key in MACHINE_STATE_FIELDS:
+            value = getattr(self, key)
+            if value is not None:
+                snapshot[key] = value
+
+        return snapshot
+
+    def get_status_data(self, fields):
+        """
+        Format change-set or snapshot as EV_DATA_STATUS data, program
+        counter and sw state at top level and machine status in "sr",
+        fields dictionary is reused
+
+        """
+        data = {'ver': self.version}
+
+        for key in ['pc', 'swstate']:
+            if key in fields:
+                data[key] = fields.pop(key)
+
+        if fields:
+            data['sr'] = fields
+
+        return data
+
+    def reset(self):
+        for key in MACHINE_STATE_FIELDS:
+            setattr(self, key, None)
+
+        self.other = {}
+        self.version += 1
+
+
+class EventCoalescer(object):
+    """
+    Coalesce EV_DATA_STATUS and EV_DATA_OUT for one listener. Status data
+    is merged, the latest value of every field wins, while rx text and
+    sent lines are kept in arrival order so no acknowledge or error is
+    lost and each shows after the line it belongs to.
+
+    Merged data is delivered at most max_rate times per second and held
+    back while the listener queue is deeper than STATUS_COALESCE_MAX_DEPTH,
+    the listener queue stays bounded whatever the device traffic rate.
+
+    """
+
+    def __init__(self, listener, max_rate=STATUS_MAX_RATE):
+        self.listener = listener
+        self.status = None
+        self.statusOwned = False
+        # (EV_DATA_OUT, sent line) or (EV_DATA_STATUS, rx text) in order
+        self.textData = []
+        self.timeLastFlush = 0
+        self.eventsIn = 0
+        self.eventsOut = 0
+        self.set_max_rate(max_rate)
+
+    def add(self, event_id, data):
+        """
+        Add event data, data objects are shared with other listeners and
+        only copied once a second event has to be merged in
+
+        """
+        self.eventsIn += 1
+
+        if self.status is not None and not self.statusOwned:
+            # status was first and alone, copy it and move its rx text to
+            # the text list so it keeps its place
+            status = dict(self.status)
+
+            for key in ['sr', 'r']:
+                if key in status:
+                    status[key] = dict(status[key])
+
+            if 'rx_data' in status:
+                self.textData.append((EV_DATA_STATUS, status.pop('rx_data')))
+
+            self.status = status
+            self.statusOwned = True
+
+        if event_id == EV_DATA_OUT:
+            self.textData.append((EV_DATA_OUT, data))
+
+        elif self.status is None and not self.textData:
+            self.status = data
+
+        else:
+            if self.status is None:
+                self.status = dict()
+                self.statusOwned = True
+
+            status = self.status
+
+            for key, value in data.items():
+                if key == 'rx_data':
+                    self.textData.append((EV_DATA_STATUS, value))
+                elif key in ['sr', 'r'] and key in status:
+                    status[key].update(value)
+                elif key in ['sr', 'r']:
+                    status[key] = dict(value)
+                else:
+                    status[key] = value
+
+    def flush(self, sender, force=False):
+        """
+        Deliver pending data if rate and listener queue depth allow it,
+        force ignores both (used to keep order with other events). Return
+        True if data was delivered
+
+        """
+        if self.status is None and not self.textData:
+            return False
+
+        time_now = time.perf_counter()
+
+        if not force:
+            if time_now - self.timeLastFlush < self.period:
+                return False
+
+            if self.listener.get_event_queue_depth() > STATUS_COALESCE_MAX_DEPTH:
+                return False
+
+        status = self.status
+
+        # consecutive pieces of the same kind go out as one event, status
+        # goes with the last rx text (or after the last sent lines)
+        runs = []
+        for event_id, text in self.textData:
+            if runs and runs[-1][0] == event_id:
+                runs[-1][1].append(text)
+            else:
+                runs.append((event_id, [text]))
+
+        for index, (event_id, texts) in enumerate(runs):
+            if event_id == EV_DATA_OUT:
+                if len(texts) == 1:
+                    tx_data = texts[0]
+                else:
+                    tx_data = "".join([d if d.endswith("\n") else "{}\n".format(d) for d in texts])
+
+                self.listener.add_event(EV_DATA_OUT, tx_data, sender)
+
+            elif index == len(runs) - 1:
+                status['rx_data'] = "".join(texts)
+                self.listener.add_event(EV_DATA_STATUS, status, sender)
+                status = None
+
+            else:
+                self.listener.add_event(EV_DATA_STATUS, {'rx_data': "".join(texts)}, sender)
+
+            self.eventsOut += 1
+
+        if status:
+            self.listener.add_event(EV_DATA_STATUS, status, sender)
+            self.eventsOut += 1
+
+        self.textData = []
+        self.status = None
+        self.statusOwned = False
+        self.timeLastFlush = time_now
+
+        return True
+
+    def set_max_rate(self, max_rate):
+        if max_rate:
+            self.period = 1.0 / max_rate
+        else:
+            self.period = 0
+
+
+"""----------------------------------------------------------------------------
+    Remote message wire format:
+
+    Messages are framed with a SOCK_HEADER_SIZE ASCII length header. The
+    hot events (REMOTE_WIRE_EVENTS) are encoded in a binary format, every
+    other event (and any hot event the binary format can't carry) is
+    pickled. Receivers tell them apart by the first payload byte, pickle
+    protocol 2 and up always starts with 0x80. Large payloads of either
+    kind can be compressed, REMOTE_ZLIB_MAGIC followed by zlib data.
+
+    Binary payload:
+        magic (u8), version (u8), event_id (u16), sender (value),
+        data (value)
+
+    Values are a type tag (u8) followed by the value, dictionary keys are
+    a field id (u8) from REMOTE_WIRE_FIELD_IDS, or 0 followed by the key
+    as a string value. Numbers are little endian. Field ids are part of
+    the format, never renumber them only append new ones.
+----------------------------------------------------------------------------"""
+REMOTE_WIRE_MAGIC = 0xA7
+REMOTE_ZLIB_MAGIC = 0xA8
+REMOTE_WIRE_MAX_DEPTH = 16
+
+REMOTE_WIRE_EVENTS = frozenset([
+    EV_DATA_STATUS, EV_DATA_OUT, EV_DATA_IN, EV_PC_UPDATE, EV_SW_STATE, EV_MACHINE_STATE])
+
+REMOTE_WIRE_FIELD_IDS = {
+    'posx': 1, 'posy': 2, 'posz': 3, 'posa': 4, 'posb': 5, 'posc': 6, 'vel': 7, 'stat': 8, 'ib': 9, 'ov': 10,
+    'wco': 11, 'fb': 12, 'fv': 13, 'machif': 14, 'prcnt': 15, 'rtime': 16, 'pc': 17, 'swstate': 18, 'ver': 19,
+    'rx_data': 20, 'r': 21, 'sr': 22, 'f': 23, 'init': 24, 'sys': 25,
+}
+REMOTE_WIRE_FIELD_NAMES = {v: k for k, v in REMOTE_WIRE_FIELD_IDS.items()}
+
+# classes pickled events may carry (plain types need no lookup with
+# protocol 4 and up, older protocols pickle set and frozenset by name)
+REMOTE_PICKLE_CLASSES = frozenset([
+    (__name__, 'SimpleEvent'), (__name__, 'ConfigData'), (__name__, 'gsatConfigData'),
+    ('builtins', 'set'), ('builtins', 'frozenset'), ('__builtin__', 'set'), ('__builtin__', 'frozenset'),
+    ('collections', 'OrderedDict'),
+])
+
+# value type tags
+WIRE_NONE = 0
+WIRE_TRUE = 1
+WIRE_FALSE = 2
+WIRE_INT8 = 3
+WIRE_INT32 = 4
+WIRE_INT64 = 5
+WIRE_FLOAT = 6
+WIRE_MILLI = 7      # float with 3 or fewer decimals (positions), int32 * 0.001
+WIRE_STR8 = 8
+WIRE_STR32 = 9
+WIRE_LIST = 10
+WIRE_DICT = 11
+
+wire_header = struct.Struct('<BBH')
+wire_u8 = struct.Struct('<B')
+wire_u16 = struct.Struct('<H')
+wire_u32 = struct.Struct('<I')
+wire_int8 = struct.Struct('<Bb')
+wire_int32 = struct.Struct('<Bi')
+wire_int64 = struct.Struct('<Bq')
+wire_float = struct.Struct('<Bd')
+wire_tag_u8 = struct.Struct('<BB')
+wire_tag_u16 = struct.Struct('<BH')
+wire_tag_u32 = struct.Struct('<BI')
+
+
+def wire_encode_value(buf, value, depth=0):
+    """
+    Append value to bytearray, raises TypeError for types the format
+    can't carry
+
+    """
+    if depth > REMOTE_WIRE_MAX_DEPTH:
+        raise ValueError("remote wire value nested too deep")
+
+    value_type = type(value)
+
+    if value_type is float:
+        milli = round(value * 1000) if math.isfinite(value) else None
+        if milli is not None and -0x80000000 <= milli <= 0x7FFFFFFF and milli / 1000 == value:
+            buf += wire_int32.pack(WIRE_MILLI, milli)
+        else:
+            buf += wire_float.pack(WIRE_FLOAT, value)
+
+    elif value_type is str:
+        data = value.encode('utf-8')
+        if len(data) <= 0xFF:
+            buf += wire_tag_u8.pack(WIRE_STR8, len(data))
+        else:
+            buf += wire_tag_u32.pack(WIRE_STR32, len(data))
+        buf += data
+
+    elif value_type is bool:
+        buf.append(WIRE_TRUE if value else WIRE_FALSE)
+
+    elif value_type is int:
+        if -0x80 <= value <= 0x7F:
+            buf += wire_int8.pack(WIRE_INT8, value)
+        elif -0x80000000 <= value <= 0x7FFFFFFF:
+            buf += wire_int32.pack(WIRE_INT32, value)
+        else:
+            # raises struct.error beyond 64 bits
+            buf += wire_int64.pack(WIRE_INT64, value)
+
+    elif value is None:
+        buf.append(WIRE_NONE)
+
+    elif value_type is dict:
+        if len(value) > 0xFFFF:
+            raise ValueError("remote wire dictionary too large")
+
+        buf += wire_tag_u16.pack(WIRE_DICT, len(value))
+        for key, item in value.items():
+            field_id = REMOTE_WIRE_FIELD_IDS.get(key)
+            if field_id is not None:
+                buf.append(field_id)
+            elif type(key) is str:
+                buf.append(0)
+                wire_encode_value(buf, key, depth + 1)
+            else:
+                raise TypeError("remote wire dictionary key must be str")
+
+            if type(item) is float and math.isfinite(item):
+                # status fields are mostly positions, inline them
+                milli = round(item * 1000)
+                if -0x80000000 <= milli <= 0x7FFFFFFF and milli / 1000 == item:
+                    buf += wire_int32.pack(WIRE_MILLI, milli)
+                    continue
+
+            wire_encode_value(buf, item, depth + 1)
+
+    elif value_type is list or value_type is tuple:
+        if len(value) > 0xFFFF:
+            raise ValueError("remote wire list too large")
+
+        buf += wire_tag_u16.pack(WIRE_LIST, len(value))
+        for item in value:
+            wire_encode_value(buf, item, depth + 1)
+
+    else:
+        raise TypeError("remote wire can't encode {}".format(value_type.__name__))
+
+
+def wire_decode_value(data, offset, depth=0):
+    """
+    Decode value at offset, return (value, next offset). Raises
+    ValueError on malformed data, IndexError or struct.error if data is
+    short
+
+    """
+    if depth > REMOTE_WIRE_MAX_DEPTH:
+        raise ValueError("remote wire value nested too deep")
+
+    tag = data[offset]
+    offset += 1
+
+    if tag == WIRE_MILLI:
+        return wire_int32.unpack_from(data, offset - 1)[1] / 1000, offset + 4
+
+    elif tag == WIRE_STR8 or tag == WIRE_STR32:
+        if tag == WIRE_STR8:
+            length = data[offset]
+            offset += 1
+        else:
+            length = wire_u32.unpack_from(data, offset)[0]
+            offset += 4
+
+        end = offset + length
+        if end > len(data):
+            raise ValueError("remote wire string past end of message")
+
+        return str(data[offset:end], 'utf-8'), end
+
+    elif tag == WIRE_INT8:
+        return wire_int8.unpack_from(data, offset - 1)[1], offset + 1
+
+    elif tag == WIRE_INT32:
+        return wire_int32.unpack_from(data, offset - 1)[1], offset + 4
+
+    elif tag == WIRE_INT64:
+        return wire_int64.unpack_from(data, offset - 1)[1], offset + 8
+
+    elif tag == WIRE_FLOAT:
+        return wire_float.unpack_from(data, offset - 1)[1], offset + 8
+
+    elif tag == WIRE_DICT:
+        count = wire_u16.unpack_from(data, offset)[0]
+        offset += 2
+        value = {}
+
+        for i in range(count):
+            field_id = data[offset]
+            offset += 1
+
+            if field_id:
+                key = REMOTE_WIRE_FIELD_NAMES.get(field_id)
+                if key is None:
+                    raise ValueError("remote wire unknown field id {}".format(field_id))
+            else:
+                key, offset = wire_decode_value(data, offset, depth + 1)
+                if type(key) is not str:
+                    raise ValueError("remote wire dictionary key must be str")
+
+            # status fields are mostly positions, inline them
+            if data[offset] == WIRE_MILLI:
+                value[key] = wire_int32.unpack_from(data, offset)[1] / 1000
+                offset += 5
+            else:
+                value[key], offset = wire_decode_value(data, offset, depth + 1)
+
+        return value, offset
+
+    elif tag == WIRE_LIST:
+        count = wire_u16.unpack_from(data, offset)[0]
+        offset += 2
+        value = []
+
+        for i in range(count):
+            item, offset = wire_decode_value(data, offset, depth + 1)
+            value.append(item)
+
+        return value, offset
+
+    elif tag == WIRE_NONE:
+        return None, offset
+
+    elif tag == WIRE_TRUE:
+        return True, offset
+
+    elif tag == WIRE_FALSE:
+        return False, offset
+
+    raise ValueError("remote wire unknown type tag {}".format(tag))
+
+
+class RemoteUnpickler(pickle.Unpickler):
+    """
+    Unpickler for remote messages, only loads classes that are sent over
+    remote links, a peer can't make us import or call anything else
+
+    """
+
+    def find_class(self, module, name):
+        if (module, name) not in REMOTE_PICKLE_CLASSES:
+            raise pickle.UnpicklingError("remote message class {}.{} not allowed".format(module, name))
+
+        return pickle.Unpickler.find_class(self, module, name)
+
+
+def remote_msg_encode(event, wire_version=REMOTE_WIRE_VERSION):
+    """
+    Encode SimpleEvent as message payload, binary if the peer's
+    wire_version allows it and the event is a hot event, pickle otherwise
+
+    """
+    if wire_version >= 1 and event.event_id in REMOTE_WIRE_EVENTS:
+        buf = bytearray(wire_header.pack(REMOTE_WIRE_MAGIC, REMOTE_WIRE_VERSION, event.event_id))
+
+        try:
+            wire_encode_value(buf, event.sender)
+            wire_encode_value(buf, event.data)
+            return bytes(buf)
+        except (TypeError, ValueError, OverflowError, struct.error):
+            pass
+
+    return pickle.dumps(event, protocol=5)
+
+
+def remote_msg_decode(data):
+    """
+    Decode message payload to SimpleEvent, binary payloads are checked
+    and raise ValueError if malformed. Pickle payloads (legacy and
+    non hot events) may only reference REMOTE_PICKLE_CLASSES, raise
+    ValueError otherwise
+
+    """
+    if not len(data):
+        raise ValueError("remote wire empty message")
+
+    if data[0] != REMOTE_WIRE_MAGIC:
+        try:
+            event = RemoteUnpickler(io.BytesIO(data)).load()
+        except (pickle.UnpicklingError, EOFError) as e:
+            raise ValueError("remote pickle message {}".format(str(e)))
+
+        if not isinstance(event, SimpleEvent):
+            raise ValueError("remote pickle message is not an event")
+
+        return event
+
+    try:
+        magic, version, event_id = wire_header.unpack_from(data, 0)
+
+        if version != REMOTE_WIRE_VERSION:
+            raise ValueError("remote wire unsupported version {}".format(version))
+
+        sender, offset = wire_decode_value(data, wire_header.size)
+        value, offset = wire_decode_value(data, offset)
+
+    except (IndexError, struct.error):
+        raise ValueError("remote wire message truncated")
+
+    if offset != len(data):
+        raise ValueError("remote wire trailing data in message")
+
+    return SimpleEvent(event_id, value, sender)
+
+
+def get_remote_msg_version(data):
+    """
+    Wire version of message payload, 0 for pickle
+
+    """
+    if len(data) > 1 and data[0] == REMOTE_WIRE_MAGIC:
+        return data[1]
+
+    return 0
+
+
+def remote_msg_compress(data, min_size=REMOTE_COMPRESS_MIN_SIZE):
+    """
+    Compress message payload if it is at least min_size bytes (0 never
+    compresses) and it gets smaller, otherwise return it as is
+
+    """
+    if not min_size or len(data) < min_size:
+        return data
+
+    compressed = bytes([REMOTE_ZLIB_MAGIC]) + zlib.compress(data, REMOTE_COMPRESS_LEVEL)
+
+    if len(compressed) < len(data):
+        return compressed
+
+    return data
+
+
+def remote_msg_decompress(data):
+    """
+    Decompress message payload, return it as is if not compressed. Raises
+    ValueError if data is malformed or bigger than REMOTE_MSG_MAX_SIZE
+
+    """
+    if not len(data) or data[0] != REMOTE_ZLIB_MAGIC:
+        return data
+
+    decompressor = zlib.decompressobj()
+
+    try:
+        raw = decompressor.decompress(memoryview(data)[1:], REMOTE_MSG_MAX_SIZE)
+    except zlib.error as e:
+        raise ValueError("remote compressed message {}".format(str(e)))
+
+    if decompressor.unconsumed_tail or not decompressor.eof:
+        raise ValueError("remote compressed message truncated or too large")
+
+    return raw
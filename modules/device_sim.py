@@ -0,0 +1,847 @@
+"""----------------------------------------------------------------------------
+    device_sim.py
+
+    Copyright (C) 2013 Wilhelm Duembeg
+
+    This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+    Grbl like GCODE interpreters. With features similar to software debuggers.
+    Features such as breakpoint, change current program counter, inspection
+    and modification of variables.
+
+    gsat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.
+
+    gsat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+
+import os
+import re
+import json
+import time
+import select
+import threading
+import collections
+import logging
+import urllib.parse
+
+import modules.config as gc
+
+if os.name != 'nt':
+    import pty
+    import tty
+
+""" Global values for this module
+"""
+# serial port names starting with this prefix open a simulated device, i.e.
+# "sim:grbl", "sim:tinyg?block_time=0.01&rx_buffer_size=254"
+SIM_PORT_PREFIX = "sim:"
+
+# transport pacing granularity in seconds, bytes move in chunks that take
+# this long at the configured baud rate
+SIM_PACING_PERIOD = 0.001
+
+# error kinds, each device maps them to its own codes
+SIM_ERR_SYNTAX = 1
+SIM_ERR_GCODE = 2
+SIM_ERR_MCODE = 3
+SIM_ERR_LOCKED = 4
+SIM_ERR_SETTING = 5
+
+# supported G and M codes (common subset of the simulated firmwares)
+SIM_GCODES = set([
+    0, 1, 2, 3, 4, 10, 17, 18, 19, 20, 21, 28, 28.1, 28.2, 28.3, 30, 38.2,
+    40, 43.1, 49, 53, 54, 55, 56, 57, 58, 59, 61, 64, 80, 90, 91, 92, 92.1,
+    93, 94])
+SIM_MCODES = set([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 30])
+
+SIM_AXES = "XYZA"
+SIM_RAPID_FEED = 5000.0
+
+
+class DeviceSim_Base(object):
+    """
+    Simulated device base class, models a serial RX buffer, a planner
+    with fixed number of blocks and block execution time.
+
+    Simulation is deterministic, time only moves when a new time stamp is
+    given to write() or update(), output is collected with read(). This
+    allows driving the device in-process with a virtual clock, or in real
+    time through DeviceSimThread.
+
+    """
+
+    name = ""
+    RX_BUFFER_SIZE = 128
+    PLANNER_SIZE = 16
+
+    # real-time command bytes, handled as soon as received
+    realTimeCmds = {}
+
+    def __init__(self, rx_buffer_size=None, planner_size=None, block_time=0.002,
+                 motion_time_scale=0.0, status_interval=0.0):
+        """
+        block_time: time to execute a planner block, in seconds
+        motion_time_scale: add move time (distance/feed) times this scale to
+            block time, 0 disables, 1 is real time
+        status_interval: automatic status report period while moving, in
+            seconds, 0 disables
+
+        """
+        self.rxBufferSize = int(rx_buffer_size or self.RX_BUFFER_SIZE)
+        self.plannerSize = int(planner_size or self.PLANNER_SIZE)
+        self.blockTime = float(block_time)
+        self.motionTimeScale = float(motion_time_scale)
+        self.statusInterval = float(status_interval)
+
+        # stats
+        self.rxOverflowCount = 0
+        self.lineCount = 0
+        self.errorCount = 0
+
+        self.reset(0.0)
+
+    def reset(self, now):
+        """
+        Reset device, ala power on, all buffers are cleared
+
+        """
+        self.now = now
+        self.rxBuffer = bytearray()
+        self.output = bytearray()
+        self.planner = collections.deque()
+        self.blockStart = now
+        self.hold = False
+        self.alarm = False
+        self.pos = dict.fromkeys(SIM_AXES, 0.0)
+        self.target = dict(self.pos)
+        self.feed = 0.0
+        self.motion = 0
+        self.absolute = True
+        self.nextStatusTime = None
+        self.send(self.get_init_str())
+
+    def send(self, data):
+        self.output += data.encode('utf-8')
+
+    def read(self):
+        """
+        Get (and clear) data generated by device
+
+        """
+        data = bytes(self.output)
+        self.output.clear()
+        return data
+
+    def write(self, data, now):
+        """
+        Data from host
+
+        """
+        self.update(now)
+
+        for b in data:
+            cmd = self.realTimeCmds.get(b)
+
+            if cmd is not None:
+                getattr(self, cmd)()
+            elif len(self.rxBuffer) < self.rxBufferSize:
+                self.rxBuffer.append(b)
+
+                # parse as received, real-time commands that follow see it
+                if b == 0x0a:
+                    self.process_rx_buffer()
+            else:
+                self.rxOverflowCount += 1
+
+    def update(self, now):
+        """
+        Move time forward, execute planner blocks
+
+        """
+        if now < self.now:
+            now = self.now
+
+        self.now = now
+
+        while self.planner and not self.hold:
+            duration, target = self.planner[0]
+
+            if now - self.blockStart < duration:
+                break
+
+            self.planner.popleft()
+            self.pos = target
+            self.blockStart += duration
+
+            if not self.planner:
+                self.on_state_change()
+
+        if not self.planner or self.hold:
+            self.blockStart = now
+
+        if self.nextStatusTime is not None and now >= self.nextStatusTime:
+            self.on_status_interval()
+            self.nextStatusTime = now + self.statusInterval if self.is_moving() else None
+
+        self.process_rx_buffer()
+
+    def get_next_update_time(self):
+        """
+        Time of next planner or status event, None if nothing is scheduled
+
+        """
+        times = []
+
+        if self.planner and not self.hold:
+            times.append(self.blockStart + self.planner[0][0])
+
+        if self.nextStatusTime is not None:
+            times.append(self.nextStatusTime)
+
+        return min(times) if times else None
+
+    def is_moving(self):
+        return len(self.planner) > 0 and not self.hold
+
+    def process_rx_buffer(self):
+        """
+        Parse complete lines while there is room in the planner
+
+        """
+        while len(self.planner) < self.plannerSize:
+            end = self.rxBuffer.find(b'\n')
+
+            if end < 0:
+                break
+
+            line = self.rxBuffer[:end].decode('utf-8', 'replace')
+            del self.rxBuffer[:end + 1]
+            self.lineCount += 1
+            self.process_line(line.strip(), end + 1)
+
+    def process_line(self, line, line_len):
+        error = self.process_gcode(line)
+
+        if error:
+            self.errorCount += 1
+            self.send(self.get_error_str(error, line_len))
+        else:
+            self.send(self.get_ack_str(line_len))
+
+    def process_gcode(self, line):
+        """
+        Interpret gcode line, queue motion to planner. Returns error kind
+        or 0 if no error
+
+        """
+        line = re.sub(r'\(.*?\)|;.*$', '', line).upper().replace(' ', '')
+
+        if not line:
+            return 0
+
+        words = re.findall(r'([A-Z])([-+]?(?:\d+\.?\d*|\.\d+))', line)
+
+        if "".join("".join(w) for w in words) != line:
+            return SIM_ERR_SYNTAX
+
+        axes = {}
+        dwell = None
+        non_modal = None
+
+        for letter, value in words:
+            value = float(value)
+
+            if letter == 'G':
+                if value not in SIM_GCODES:
+                    return SIM_ERR_GCODE
+                if value in [0, 1, 2, 3]:
+                    self.motion = value
+                elif value == 90:
+                    self.absolute = True
+                elif value == 91:
+                    self.absolute = False
+                else:
+                    non_modal = value
+            elif letter == 'M':
+                if value not in SIM_MCODES:
+                    return SIM_ERR_MCODE
+            elif letter == 'F':
+                self.feed = value
+            elif letter == 'P':
+                dwell = value
+            elif letter in SIM_AXES:
+                axes[letter] = value
+
+        if self.alarm and (axes or non_modal is not None):
+            return SIM_ERR_LOCKED
+
+        if non_modal == 4:
+            self.queue_block(self.blockTime + (dwell or 0) * self.motionTimeScale, self.target)
+        elif non_modal in [10, 92, 92.1]:
+            pass
+        elif non_modal in [28.2, 28.3]:
+            self.target = dict.fromkeys(SIM_AXES, 0.0)
+            self.queue_block(self.blockTime, self.target)
+        elif axes:
+            target = dict(self.target)
+
+            for axis, value in axes.items():
+                target[axis] = value if self.absolute else target[axis] + value
+
+            feed = SIM_RAPID_FEED if self.motion == 0 or self.feed <= 0 else self.feed
+            distance = sum((target[a] - self.target[a]) ** 2 for a in SIM_AXES) ** 0.5
+            self.target = target
+            self.queue_block(self.blockTime + distance / feed * 60 * self.motionTimeScale, target)
+
+        return 0
+
+    def queue_block(self, duration, target):
+        if not self.planner:
+            self.blockStart = self.now
+
+            if self.statusInterval > 0:
+                self.nextStatusTime = self.now + self.statusInterval
+
+        self.planner.append((duration, dict(target)))
+
+        if len(self.planner) == 1:
+            self.on_state_change()
+
+    def do_cycle_start(self):
+        if self.hold:
+            self.hold = False
+            self.blockStart = self.now
+            self.on_state_change()
+
+    def do_feed_hold(self):
+        if self.planner and not self.hold:
+            # block in progress ends where it is, no interpolation
+            self.hold = True
+            self.on_state_change()
+
+    def do_reset(self):
+        # data sent before the reset is already on the wire
+        output = self.output
+        moving = self.is_moving()
+        self.reset(self.now)
+        self.output[:0] = output
+
+        if moving:
+            self.on_reset_while_moving()
+
+    def do_status(self):
+        self.send(self.get_status_str())
+
+    def on_reset_while_moving(self):
+        pass
+
+    def on_state_change(self):
+        pass
+
+    def on_status_interval(self):
+        pass
+
+    def get_ack_str(self, line_len):
+        raise NotImplementedError
+
+    def get_error_str(self, error, line_len):
+        raise NotImplementedError
+
+    def get_init_str(self):
+        raise NotImplementedError
+
+    def get_state(self):
+        if self.alarm:
+            return "Alarm"
+        if self.hold:
+            return "Hold"
+        if self.planner:
+            return "Run"
+        return "Idle"
+
+    def get_status_str(self):
+        raise NotImplementedError
+
+
+class DeviceSim_GRBL(DeviceSim_Base):
+    """
+    Simulated grbl 1.1
+
+    RX buffer 128 bytes, 15 planner blocks, real-time commands "?", "!",
+    "~" and ctrl-x. Reset while moving raises alarm 3, cleared with "$X".
+
+    """
+
+    name = "grbl"
+    RX_BUFFER_SIZE = 128
+    PLANNER_SIZE = 15
+
+    realTimeCmds = {
+        ord('?'): 'do_status',
+        ord('!'): 'do_feed_hold',
+        ord('~'): 'do_cycle_start',
+        0x18: 'do_reset',
+    }
+
+    errorCodes = {
+        SIM_ERR_SYNTAX: 1,
+        SIM_ERR_GCODE: 20,
+        SIM_ERR_MCODE: 20,
+        SIM_ERR_LOCKED: 9,
+        SIM_ERR_SETTING: 3,
+    }
+
+    version = "1.1f.20170801"
+
+    def __init__(self, *args, **kwargs):
+        self.settings = {0: "10", 1: "25", 10: "1", 11: "0.010", 110: "500.000", 120: "10.000"}
+        super(DeviceSim_GRBL, self).__init__(*args, **kwargs)
+
+    def process_line(self, line, line_len):
+        if not line.startswith('$'):
+            super(DeviceSim_GRBL, self).process_line(line, line_len)
+            return
+
+        cmd = line.upper()
+        error = 0
+
+        if cmd == "$I":
+            self.send(f"[VER:{self.version}:]\r\n[OPT:V,{self.plannerSize},{self.rxBufferSize}]\r\n")
+        elif cmd == "$$":
+            self.send("".join(f"${k}={v}\r\n" for k, v in sorted(self.settings.items())))
+        elif cmd == "$G":
+            self.send("[GC:G%d G54 G17 G21 G%d G94 M5 M9 T0 F%g S0]\r\n" % (
+                self.motion, 90 if self.absolute else 91, self.feed))
+        elif cmd == "$X":
+            if self.alarm:
+                self.alarm = False
+                self.send("[MSG:Caution: Unlocked]\r\n")
+        elif cmd == "$H":
+            self.alarm = False
+            self.target = dict.fromkeys(SIM_AXES, 0.0)
+            self.queue_block(self.blockTime, self.target)
+        elif cmd.startswith("$J="):
+            motion, absolute = self.motion, self.absolute
+            error = self.process_gcode(cmd[3:])
+            self.motion, self.absolute = motion, absolute
+        else:
+            setting = re.match(r'^\$(\d+)=(.+)$', cmd)
+
+            if setting is not None:
+                self.settings[int(setting.group(1))] = setting.group(2)
+            else:
+                error = SIM_ERR_SETTING
+
+        if error:
+            self.errorCount += 1
+            self.send(self.get_error_str(error, line_len))
+        else:
+            self.send(self.get_ack_str(line_len))
+
+    def on_reset_while_moving(self):
+        self.alarm = True
+        self.send("ALARM:3\r\n[MSG:'$H'|'$X' to unlock]\r\n")
+
+    def get_ack_str(self, line_len):
+        return "ok\r\n"
+
+    def get_error_str(self, error, line_len):
+        return f"error:{self.errorCodes[error]}\r\n"
+
+    def get_init_str(self):
+        return "\r\nGrbl 1.1f ['$' for help]\r\n"
+
+    def get_status_str(self):
+        pos = ",".join("%.3f" % self.pos[a] for a in SIM_AXES[:3])
+        feed = self.feed if self.is_moving() else 0
+        return f"<{self.get_state()}|MPos:{pos}|FS:{feed:g},0>\r\n"
+
+
+class DeviceSim_Smoothie(DeviceSim_GRBL):
+    """
+    Simulated Smoothieboard, grbl like protocol with its own status and
+    error formats
+
+    """
+
+    name = "smoothie"
+    RX_BUFFER_SIZE = 128
+    PLANNER_SIZE = 32
+
+    errorNames = {
+        SIM_ERR_SYNTAX: "Syntax error",
+        SIM_ERR_GCODE: "Unsupported command",
+        SIM_ERR_MCODE: "Unsupported command",
+        SIM_ERR_LOCKED: "Alarm lock",
+        SIM_ERR_SETTING: "Unsupported command",
+    }
+
+    def process_line(self, line, line_len):
+        if line.lower() in ["version", "$i"]:
+            self.send("Build version: edge-sim, Build date: Jan 1 2019 00:00:00, "
+                      "MCU: LPC1769, System Clock: 120MHz\r\nok\r\n")
+        else:
+            super(DeviceSim_Smoothie, self).process_line(line, line_len)
+
+    def on_reset_while_moving(self):
+        pass
+
+    def get_error_str(self, error, line_len):
+        return f"error:{self.errorNames[error]}\r\n"
+
+    def get_init_str(self):
+        return "Smoothie\r\n"
+
+    def get_status_str(self):
+        pos = ",".join("%.4f" % self.pos[a] for a in SIM_AXES[:3])
+        return f"<{self.get_state()},MPos:{pos},WPos:{pos}>\r\n"
+
+
+class DeviceSim_TinyG(DeviceSim_Base):
+    """
+    Simulated TinyG in JSON mode
+
+    RX buffer 254 bytes, 28 planner blocks, every line gets a JSON
+    response with footer "f":[1,status,count]. Automatic status reports
+    while moving and on state changes.
+
+    """
+
+    name = "tinyg"
+    RX_BUFFER_SIZE = 254
+    PLANNER_SIZE = 28
+
+    realTimeCmds = {
+        ord('!'): 'do_feed_hold',
+        ord('~'): 'do_cycle_start',
+        ord('%'): 'do_queue_flush',
+        0x18: 'do_reset',
+    }
+
+    errorCodes = {
+        SIM_ERR_SYNTAX: 130,
+        SIM_ERR_GCODE: 131,
+        SIM_ERR_MCODE: 132,
+        SIM_ERR_LOCKED: 27,
+        SIM_ERR_SETTING: 100,
+    }
+
+    statCodes = {
+        "Alarm": 2,
+        "Idle": 3,
+        "Run": 5,
+        "Hold": 6,
+    }
+
+    sysInfo = {"fb": 440.20, "fv": 0.970, "hp": 1, "hv": 8, "id": "SIM-TINYG"}
+    clearCmd = "clear"
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('status_interval', 0.25)
+        self.settings = {"sv": 1, "si": 250, "jv": 4, "qv": 0, "ee": 0}
+        super(DeviceSim_TinyG, self).__init__(*args, **kwargs)
+
+    def process_line(self, line, line_len):
+        if not line.startswith('{'):
+            super(DeviceSim_TinyG, self).process_line(line, line_len)
+            return
+
+        try:
+            cmd = json.loads(line)
+        except ValueError:
+            cmd = None
+
+        if not isinstance(cmd, dict):
+            self.errorCount += 1
+            self.send(self.get_response_str({}, 111, line_len))
+            return
+
+        r = {}
+        status = 0
+
+        for key, value in cmd.items():
+            if key == "sr":
+                r[key] = self.get_status_dict()
+            elif key == "sys":
+                info = self.sysInfo
+                if isinstance(value, dict):
+                    info = {k: self.sysInfo[k] for k in value if k in self.sysInfo}
+                r[key] = info
+            elif key in self.sysInfo:
+                r[key] = self.sysInfo[key]
+            elif key == self.clearCmd:
+                self.alarm = False
+                r[key] = value
+            elif key == "gc":
+                r[key] = value
+                error = self.process_gcode(str(value))
+                if error:
+                    status = self.errorCodes[error]
+            elif key in self.settings:
+                if value is not None:
+                    self.settings[key] = value
+                r[key] = self.settings[key]
+            else:
+                status = self.errorCodes[SIM_ERR_SETTING]
+
+        if status:
+            self.errorCount += 1
+
+        self.send(self.get_response_str(r, status, line_len))
+
+    def do_queue_flush(self):
+        if self.hold:
+            self.planner.clear()
+            self.rxBuffer.clear()
+            self.hold = False
+            self.target = dict(self.pos)
+            self.on_state_change()
+
+    def reset(self, now):
+        self.lastStatus = {}
+        super(DeviceSim_TinyG, self).reset(now)
+
+    def send_status_report(self):
+        """
+        Automatic status report, with "sv":1 only values that changed since
+        last report are sent
+
+        """
+        sv = self.settings.get("sv", 1)
+
+        if not sv:
+            return
+
+        sr = self.get_status_dict()
+
+        if sv == 1:
+            sr = {k: v for k, v in sr.items() if self.lastStatus.get(k) != v}
+            self.lastStatus.update(sr)
+
+        if sr:
+            self.send(json.dumps({"sr": sr}, separators=(',', ':')) + "\n")
+
+    def on_state_change(self):
+        # while moving reports are sent every status interval
+        if not self.is_moving():
+            self.send_status_report()
+
+    def on_status_interval(self):
+        self.send_status_report()
+
+    def get_response_str(self, r, status, line_len):
+        r = json.dumps(r, separators=(',', ':'))
+        return f'{{"r":{r},"f":[1,{status},{line_len}]}}\n'
+
+    def get_ack_str(self, line_len):
+        return self.get_response_str({}, 0, line_len)
+
+    def get_error_str(self, error, line_len):
+        return self.get_response_str({}, self.errorCodes[error], line_len)
+
+    def get_init_str(self):
+        r = dict(self.sysInfo)
+        r["msg"] = "SYSTEM READY"
+        return self.get_response_str(r, 0, 0)
+
+    def get_status_dict(self):
+        sr = {f"pos{a.lower()}": round(self.pos[a], 3) for a in SIM_AXES}
+        sr["feed"] = self.feed
+        sr["vel"] = self.feed if self.is_moving() else 0
+        sr["stat"] = self.statCodes[self.get_state()]
+        return sr
+
+
+class DeviceSim_g2core(DeviceSim_TinyG):
+    """
+    Simulated g2core, same JSON protocol as TinyG with larger planner
+
+    """
+
+    name = "g2core"
+    RX_BUFFER_SIZE = 254
+    PLANNER_SIZE = 48
+
+    sysInfo = {"fb": 101.03, "fv": 0.99, "hp": 3, "hv": 0, "id": "SIM-G2CORE"}
+    clearCmd = "clr"
+
+    def get_init_str(self):
+        r = dict(self.sysInfo)
+        r["msg"] = "SYSTEM READY"
+        return self.get_response_str(r, 0, 1)
+
+
+SIM_DEVICE_DICT = {
+    DeviceSim_GRBL.name: DeviceSim_GRBL,
+    DeviceSim_Smoothie.name: DeviceSim_Smoothie,
+    DeviceSim_TinyG.name: DeviceSim_TinyG,
+    DeviceSim_g2core.name: DeviceSim_g2core,
+}
+
+
+class DeviceSimThread(threading.Thread):
+    """
+    Serve simulated device over a pty pair, the host opens port_name as a
+    regular serial port. Data in both directions is paced to the baud rate
+    (10 bits per byte), baud rate 0 disables pacing.
+
+    """
+
+    def __init__(self, device, baud):
+        threading.Thread.__init__(self, daemon=True)
+
+        self.device = device
+        self.byteTime = 10.0 / baud if baud else 0
+        self.chunkSize = max(1, int(SIM_PACING_PERIOD / self.byteTime)) if baud else 4096
+        self.endThread = False
+
+        # simulator thread CPU time, to tell it apart from host CPU time
+        self.cpuTime = 0.0
+
+        self.masterFd, self.slaveFd = pty.openpty()
+        tty.setraw(self.masterFd)
+        os.set_blocking(self.masterFd, False)
+        self.portName = os.ttyname(self.slaveFd)
+
+        self.wakeupReadFd, self.wakeupWriteFd = os.pipe()
+
+        self.logger = logging.getLogger()
+
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF:
+            self.logger.info(f"simulated {device.name} on {self.portName}")
+
+        self.start()
+
+    def stop(self):
+        self.endThread = True
+        os.write(self.wakeupWriteFd, b'\0')
+
+    def run(self):
+        device = self.device
+        txBuffer = bytearray()
+        txFree = rxFree = time.monotonic()
+        cpuStart = time.thread_time()
+
+        while not self.endThread:
+            self.cpuTime = time.thread_time() - cpuStart
+            now = time.monotonic()
+            device.update(now)
+            txBuffer += device.read()
+
+            if txBuffer and now >= txFree:
+                chunk = txBuffer[:self.chunkSize]
+
+                try:
+                    os.write(self.masterFd, chunk)
+                except BlockingIOError:
+                    # host is not reading, try again later
+                    chunk = b''
+                    txFree = now + SIM_PACING_PERIOD
+
+                del txBuffer[:len(chunk)]
+                txFree = max(txFree, now) + len(chunk) * self.byteTime
+
+            timeouts = []
+            inputs = [self.wakeupReadFd]
+
+            if now >= rxFree:
+                inputs.append(self.masterFd)
+            else:
+                timeouts.append(rxFree - now)
+
+            if txBuffer:
+                timeouts.append(txFree - now)
+
+            nextUpdate = device.get_next_update_time()
+
+            if nextUpdate is not None:
+                timeouts.append(nextUpdate - now)
+
+            timeout = max(0, min(timeouts)) if timeouts else None
+            readable, _, _ = select.select(inputs, [], [], timeout)
+
+            if self.masterFd in readable:
+                try:
+                    data = os.read(self.masterFd, self.chunkSize)
+                except (BlockingIOError, OSError):
+                    data = b''
+
+                if data:
+                    now = time.monotonic()
+                    device.write(data, now)
+                    rxFree = max(rxFree, now) + len(data) * self.byteTime
+
+        for fd in [self.masterFd, self.slaveFd, self.wakeupReadFd, self.wakeupWriteFd]:
+            os.close(fd)
+
+
+# running simulators by port name, simulated devices stay "powered" when the
+# host closes the port, same as real hardware
+_simThreads = dict()
+_simThreadsLock = threading.Lock()
+
+
+def is_sim_port(port_name):
+    return str(port_name).startswith(SIM_PORT_PREFIX)
+
+
+def open_sim_port(port_name, baud):
+    """
+    Start (or reuse) simulator for port name, returns serial port name to
+    open. Port name format is "sim:<device>[?param=value&...]" where device
+    is one of SIM_DEVICE_DICT and params are DeviceSim_Base init params
+
+    """
+    if os.name == 'nt':
+        raise OSError("device simulator is not supported on this platform")
+
+    with _simThreadsLock:
+        simThread = _simThreads.get(port_name)
+
+        if simThread is None or not simThread.is_alive():
+            url = urllib.parse.urlsplit(port_name[len(SIM_PORT_PREFIX):])
+            device_class = SIM_DEVICE_DICT.get(url.path.lower())
+
+            if device_class is None:
+                raise OSError(f"unknown simulated device [{url.path}]")
+
+            try:
+                params = {k: float(v) for k, v in urllib.parse.parse_qsl(url.query)}
+                device = device_class(**params)
+            except (TypeError, ValueError) as e:
+                raise OSError(f"bad simulated device params [{url.query}], {str(e)}")
+
+            simThread = DeviceSimThread(device, int(baud or 0))
+            _simThreads[port_name] = simThread
+
+    return simThread.portName
+
+
+def get_sim_thread(port_name):
+    """
+    Get simulator thread serving port name, None if not running
+
+    """
+    with _simThreadsLock:
+        return _simThreads.get(port_name)
+
+
+def close_sim_ports():
+    """
+    Stop all running simulators
+
+    """
+    with _simThreadsLock:
+        for simThread in _simThreads.values():
+            simThread.stop()
+
+        _simThreads.clear()
@@ -23,14 +23,27 @@
 
 ----------------------------------------------------------------------------"""
 import re
+import time
+import collections
 from abc import ABCMeta, abstractmethod
 import logging
-import queue
 
 import modules.config as gc
 import modules.serial_thread as st
 
 
+# status polling activity, devices that have to be asked for status reports
+STATUS_POLL_STOP = 0
+STATUS_POLL_RUN = 1
+STATUS_POLL_FAST = 2
+
+STATUS_POLL_MIN_PERIOD = 0.05       # fastest poll, jog, probe and home
+STATUS_POLL_MAX_PERIOD = 1.0        # slowest poll, long moves without acks
+STATUS_POLL_KICK_GRACE = 0.5        # keep polling after a move is sent
+STATUS_POLL_REPORT_TIMEOUT = 1.0    # poll again if report never came
+STATUS_POLL_LINK_MAX_PRCNT = 10     # max serial link share for status reports
+
+
 class MachIf_Base(gc.EventQueueIf):
     """
     Machine interface base class to provide a unified API for specific devices (g2core, TinyG, grbl, etc).
@@ -53,6 +66,12 @@ class MachIf_Base(gc.EventQueueIf):
         self._inputBufferWatermark = float(self._inputBufferMaxSize) * self._inputBufferWatermarkPrcnt
         self._inputBufferInitVal = input_buffer_init_val
         self._inputBufferSize = self._inputBufferInitVal
+        self._inputBufferPart = list()
+
+        # always on counters and timers, write time of each line waiting
+        # for acknowledge (in sync with input buffer parts)
+        self.perf = gc.PerfCounters("machif")
+        self._ackWaitTimes = collections.deque()
 
         self.logger = logging.getLogger()
         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
@@ -60,6 +79,7 @@ class MachIf_Base(gc.EventQueueIf):
 
         self._serialPortOpen = False
         self._serialTxRxThread = None
+        self._wakeupListener = None
         self.serialName = None
         self.serialBaud = None
 
@@ -80,6 +100,18 @@ class MachIf_Base(gc.EventQueueIf):
         self.cmdStatus = ''
         self.cmdSystemInfo = ''
 
+        # status polling, see statusPollTick
+        self.statusPollEnable = False
+        self.statusPollPeriod = 0.2
+        self._statusPollActivity = STATUS_POLL_STOP
+        self._statusPollFast = False
+        self._statusPollInterval = self.statusPollPeriod
+        self._statusPollNext = 0
+        self._statusPollSentTime = None
+        self._statusPollKickTime = 0
+        self._statusPollAcks = 0
+        self._statusPollLinkBudget = None
+
     @abstractmethod
     def _init(self):
         pass
@@ -104,6 +136,12 @@ class MachIf_Base(gc.EventQueueIf):
         self._inputBufferMaxSize = input_buffer_max_size
         self._inputBufferWatermark = float(self._inputBufferMaxSize) * input_buffer_watermark_prcnt
         self._inputBufferSize = input_buffer_init_val
+        self._ackWaitTimes.clear()
+
+        # device reset, nothing moving and no report coming
+        self._statusPollActivity = STATUS_POLL_STOP
+        self._statusPollFast = False
+        self._statusPollSentTime = None
 
     def _sendAxisCmd(self, code, dict_axis_coor):
         """
@@ -190,21 +228,26 @@ class MachIf_Base(gc.EventQueueIf):
 
     def doHome(self, dict_axis):
         self._sendAxisCmd(self.cmdHome, dict_axis)
+        self.statusPollKick(fast=True)
 
     def doInitComm(self):
         self.write(self.cmdInitComm)
 
     def doJogFastMove(self, dict_axis_coor):
         self.doFastMove(dict_axis_coor)
+        self.statusPollKick(fast=True)
 
     def doJogFastMoveRelative(self, dict_axis_coor):
         self.doFastMoveRelative(dict_axis_coor)
+        self.statusPollKick(fast=True)
 
     def doJogMove(self, dict_axis_coor):
         self.doMove(dict_axis_coor)
+        self.statusPollKick(fast=True)
 
     def doJogMoveRelative(self, dict_axis_coor):
         self.doMoveRelative(dict_axis_coor)
+        self.statusPollKick(fast=True)
 
     def doJogStop(self):
         self.doFeedHold()
@@ -248,14 +291,16 @@ class MachIf_Base(gc.EventQueueIf):
             self.add_event(gc.EV_TXDATA, "{}\n".format(machine_current_position_mode))
             self.write("".join([machine_current_position_mode, "\n"]))
 
+        self.statusPollKick(fast=True)
+
     def doQueueFlush(self):
         self.add_event(gc.EV_TXDATA, "%s\n" % self.cmdQueueFlush.strip())
         self.write(self.cmdQueueFlush)
         self._init()
 
     def doReset(self):
+        # write re-inits buffer bookkeeping as the reset is queued
         self.write(self.cmdReset)
-        self._init()
 
     def doRapidMove(self, dict_axis_coor):
         """
@@ -316,6 +361,31 @@ class MachIf_Base(gc.EventQueueIf):
     def getProbeAxisCmd(self):
         return self.cmdProbeAxis
 
+    def getRealTimeCmds(self):
+        """
+        Single character commands the device acts on as soon as they are
+        received, these bypass queued data on the way to the device
+
+        """
+        return [self.cmdCycleStart, self.cmdFeedHold, self.cmdReset]
+
+    def getHoldLatency(self):
+        """
+        Latency histogram of feed hold, from request to serial write
+
+        """
+        if self._serialTxRxThread is not None:
+            return self._serialTxRxThread.get_realtime_latency(self.cmdFeedHold)
+
+        return None
+
+    def getInputBufferLineCount(self):
+        """
+        Lines written to the device and not acknowledged yet
+
+        """
+        return len(self._inputBufferPart)
+
     def getResetCmd(self):
         return self.cmdReset
 
@@ -331,6 +401,48 @@ class MachIf_Base(gc.EventQueueIf):
     def init(self):
         self.serialName = gc.CONFIG_DATA.get('/machine/Port')
         self.serialBaud = gc.CONFIG_DATA.get('/machine/Baud')
+        self.initConfig()
+
+    def initConfig(self):
+        """
+        Update configs that can be updated during run-time
+
+        """
+        period = gc.CONFIG_DATA.get(f"/machine/MachIfSpecific/{self.name}/AutoRefreshPeriod/Value")
+
+        if period:
+            self.statusPollPeriod = float(period) / 1000
+
+        # status report bytes per second allowed on the serial link, 10 bits
+        # per byte on the wire
+        try:
+            self._statusPollLinkBudget = int(self.serialBaud) / 10 * STATUS_POLL_LINK_MAX_PRCNT / 100
+        except (TypeError, ValueError):
+            self._statusPollLinkBudget = None
+
+    def getPerfStats(self):
+        """
+        Get performance counters snapshot of this interface and its tx/rx
+        thread
+
+        """
+        stats = self.perf.get_stats()
+        stats['queue'] = self.get_event_queue_stats()
+        stats['buffer'] = [self._inputBufferMaxSize, self._inputBufferSize]
+
+        perfStats = {'machif': stats}
+
+        if self._serialTxRxThread is not None:
+            perfStats['serial'] = self._serialTxRxThread.get_perf_stats()
+
+        return perfStats
+
+    def hasPendingData(self):
+        """
+        Check if there is data from tx/rx thread waiting to be read
+
+        """
+        return not self._eventQueue.empty()
 
     def isSerialPortOpen(self):
         return self._serialPortOpen
@@ -370,19 +482,22 @@ class MachIf_Base(gc.EventQueueIf):
 
         if self._serialTxRxThread is not None:
             # process events from queue
-            try:
-                e = self._eventQueue.get_nowait()
-            except queue.Empty:
-                pass
-            else:
+            e = self.get_event()
+
+            if e is not None:
                 if e.event_id == gc.EV_RXDATA:
                     if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD_EV:
                         self.logger.info("EV_RXDATA")
 
                     if len(e.data) > 0:
+                        bufferParts = len(self._inputBufferPart)
+                        decodeStart = time.perf_counter()
+
                         dictData = self.decode(e.data)
                         dictData['rx_data'] = e.data
 
+                        self.updatePerfRx(dictData, bufferParts, decodeStart)
+
                 elif e.event_id == gc.EV_TXDATA:
                     if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD_EV:
                         self.logger.info("EV_TXDATA")
@@ -433,8 +548,169 @@ class MachIf_Base(gc.EventQueueIf):
 
         return dictData
 
+    def updatePerfRx(self, dict_data, buffer_parts, decode_start):
+        """
+        Update counters after decode, an input buffer part released by the
+        decode means the device acknowledged (or errored) one line
+
+        """
+        timeNow = time.perf_counter()
+
+        # parts dropped without acknowledge (i.e. reset)
+        while len(self._ackWaitTimes) > buffer_parts:
+            self._ackWaitTimes.popleft()
+            self.perf.incr('lines_dropped')
+
+        self.perf.incr('rx_lines')
+
+        if len(self._inputBufferPart) < buffer_parts:
+            f = dict_data.get('f')
+
+            if f is not None and len(f) > 1 and f[1]:
+                msgType = "error"
+                self.perf.incr('lines_errored')
+            else:
+                msgType = "ack"
+                self.perf.incr('lines_acked')
+
+            if self._ackWaitTimes:
+                self.perf.add_time('write_to_ack', timeNow - self._ackWaitTimes.popleft())
+
+            if self._inputBufferMaxSize:
+                self.perf.add_value('buffer_prcnt', 100.0 * self._inputBufferSize / self._inputBufferMaxSize)
+
+        elif 'f' in dict_data:
+            msgType = "response"
+        elif len(dict_data.get('sr', {})) > 1:
+            msgType = "status"
+        else:
+            msgType = "other"
+
+        self.perf.add_time(f"decode_{msgType}", timeNow - decode_start)
+
+    def setWakeupListener(self, listener):
+        """
+        Set object to wake up (EventQueueIf.wakeup) when data arrives from
+        tx/rx thread
+
+        """
+        self._wakeupListener = listener
+
+    def statusPoll(self):
+        """
+        Ask device for status unless a request is still unanswered, returns
+        True if request was sent
+
+        """
+        if self._statusPollSentTime is not None or not self.okToSend(self.cmdStatus):
+            return False
+
+        # base write, devices may ask for status in their own write
+        MachIf_Base.write(self, self.cmdStatus)
+
+        self._statusPollSentTime = time.perf_counter()
+        self.perf.incr('status_polls')
+        self.perf.incr('status_poll_tx_bytes', len(self.cmdStatus))
+
+        return True
+
+    def statusPollKick(self, fast=False):
+        """
+        Machine is about to move, ask for status now and keep polling until
+        the device reports it stopped. Fast polling (jog, probe, home)
+        lasts until then
+
+        """
+        if not self.statusPollEnable:
+            return
+
+        self._statusPollKickTime = time.perf_counter()
+
+        if fast and not self._statusPollFast:
+            self._statusPollFast = True
+            self._statusPollNext = 0
+
+        if self._statusPollActivity == STATUS_POLL_STOP:
+            self._statusPollActivity = STATUS_POLL_RUN
+            self._statusPollInterval = self.statusPollPeriod
+            self._statusPollAcks = None
+            self._statusPollNext = 0
+
+        self.statusPollTick()
+
+    def statusPollReport(self, activity, report_len):
+        """
+        Device decoded a status report, activity is one of STATUS_POLL_*
+        for the reported machine state
+
+        """
+        self._statusPollSentTime = None
+        self.perf.incr('status_rx_bytes', report_len)
+        self.perf.add_value('status_report_bytes', report_len)
+
+        if activity == STATUS_POLL_STOP:
+            # device may not have started the move just sent
+            if time.perf_counter() - self._statusPollKickTime < STATUS_POLL_KICK_GRACE:
+                return
+
+            self._statusPollFast = False
+
+        self._statusPollActivity = activity
+
+    def statusPollTick(self):
+        """
+        Poll device status, fast during jog, probe and home, at configured
+        period while running, backing off while no line is acknowledged
+        (long moves) and never more than the serial link budget allows.
+        Stops when device reports it is not moving
+
+        """
+        if self._statusPollActivity == STATUS_POLL_STOP or not self.statusPollEnable:
+            return
+
+        timeNow = time.perf_counter()
+
+        if self._statusPollSentTime is not None:
+            if timeNow - self._statusPollSentTime < STATUS_POLL_REPORT_TIMEOUT:
+                return
+
+            # report lost
+            self.perf.incr('status_polls_lost')
+            self._statusPollSentTime = None
+
+        if timeNow < self._statusPollNext:
+            return
+
+        if self._statusPollFast or self._statusPollActivity == STATUS_POLL_FAST:
+            interval = max(STATUS_POLL_MIN_PERIOD, self.statusPollPeriod / 4)
+        else:
+            acks = self.perf.counters.get('lines_acked', 0)
+
+            if acks == self._statusPollAcks:
+                interval = min(STATUS_POLL_MAX_PERIOD, max(self._statusPollInterval * 2, self.statusPollPeriod))
+            else:
+                interval = self.statusPollPeriod
+
+            self._statusPollAcks = acks
+
+        if self._statusPollLinkBudget:
+            report = self.perf.values.get('status_report_bytes')
+
+            if report is not None:
+                # average report size over link budget
+                interval = max(interval, report[1] / report[0] / self._statusPollLinkBudget)
+
+        if self.statusPoll():
+            self._statusPollInterval = interval
+            self._statusPollNext = timeNow + interval
+            self.perf.add_value('status_poll_interval', interval)
+
     def tick(self):
-        pass
+        self.statusPollTick()
+
+    def wakeup(self):
+        if self._wakeupListener is not None:
+            self._wakeupListener.wakeup()
 
     def write(self, txData, raw_write=False):
         """
@@ -448,22 +724,50 @@ class MachIf_Base(gc.EventQueueIf):
             if raw_write:
                 # self._serialTxRxThread.serialWrite(txData)
                 self._serialTxRxThread.add_event(gc.EV_CMD_TXDATA, txData)
+            elif txData in self.getRealTimeCmds():
+                txData = self.encode(txData)
+
+                # reset discards anything the device has not executed,
+                # data queued ahead of it must not be sent after it, nor
+                # counted in the input buffer waiting for acknowledgement
+                isReset = txData == self.cmdReset
+                self._serialTxRxThread.add_realtime_data(txData, discard_queued=isReset)
+
+                if isReset:
+                    self._init()
+
+                bytesSent = len(txData)
             else:
                 lines = txData.splitlines(True)
+                encodedLines = []
+                bufferParts = len(self._inputBufferPart)
 
                 for line in lines:
                     line = self.encode(line)
+                    encodedLines.append(line)
 
-                    """ in current design there is only one thread writing, will
-                    bypass queue to improve jogging. This should be safe as
-                    there is only one thread writing and one reading. If
-                    issues start happening go back to queuing solution,
+                    bytesSent = bytesSent + len(line)
 
-                    *** UPDATE: there was no observable benefit nor issues
-                    Leaving this here to revisit in future ."""
-                    # self._serialTxRxThread.serialWrite(line)
-                    self._serialTxRxThread.add_event(gc.EV_CMD_TXDATA, line)
+                # lines added to input buffer will be acknowledged
+                timeNow = time.perf_counter()
+                linesSent = len(self._inputBufferPart) - bufferParts
+                for i in range(linesSent):
+                    self._ackWaitTimes.append(timeNow)
 
-                    bytesSent = bytesSent + len(line)
+                self.perf.incr('lines_sent', linesSent)
+                self.perf.incr('tx_bytes', bytesSent)
+
+                """ in current design there is only one thread writing, will
+                bypass queue to improve jogging. This should be safe as
+                there is only one thread writing and one reading. If
+                issues start happening go back to queuing solution,
+
+                *** UPDATE: there was no observable benefit nor issues
+                Leaving this here to revisit in future ."""
+                # self._serialTxRxThread.serialWrite(line)
+
+                # all lines in a single event, one queue hop and one write
+                if encodedLines:
+                    self._serialTxRxThread.add_event(gc.EV_CMD_TXDATA, "".join(encodedLines))
 
         return bytesSent
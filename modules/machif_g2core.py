@@ -23,10 +23,10 @@
 
 ----------------------------------------------------------------------------"""
 import re
-import json
 
 import modules.config as gc
 import modules.machif as mi
+import modules.machif_json as mi_json
 
 """ Global values for this module
 """
@@ -281,6 +281,9 @@ class MachIf_g2core(mi.MachIf_Base):
 
         self._inputBufferPart = list()
 
+        # JSON fast path
+        self.jsonDecoder = mi_json.JsonResponseDecoder()
+
         # list of commands
         self.cmdClearAlarm = '{"clr":null}\n'
         self.cmdQueueFlush = '%'
@@ -303,7 +306,7 @@ class MachIf_g2core(mi.MachIf_Base):
         dataDict = {}
 
         try:
-            dataDict = json.loads(data)
+            dataDict = self.jsonDecoder.loads(data)
 
             if 'r' in dataDict:
                 r = dataDict['r']
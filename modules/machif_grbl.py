@@ -214,67 +214,49 @@ class MachIf_GRBL(mi.MachIf_Base):
     }
 
     axes_list = ['x', 'y', 'z', 'a', 'b', 'c']
+    axes_pos_keys_list = ['pos%s' % axis for axis in axes_list]
 
-    # grbl version, example "[VER:x.x.x:]"
-    reGrblVersion = re.compile(r'\[VER:(.*):.*\]')
+    # grbl 0.9 status fields are separated by "," as are the axes values,
+    # example "<Idle,MPos:0.000,0.000,0.000,WPos:0.000,0.000,0.000>"
+    reGrblLegacyStatusSplit = re.compile(r',(?=[A-Za-z])')
 
-    # grbl init, example "Grbl 0.8c ['$' for help]"
-    reGrblInitStr = re.compile(r'(Grbl\s*(.*)\s*\[.*\])')
-
-    # status,
-    # quick re check to avoid multiple checks, speeds things up
-    reGrblOneMachineStatus = re.compile(r'pos', re.I)
-
-    # GRBL example
-    #   "<Run,MPos:20.163,0.000,0.000,WPos:20.163,0.000,0.000>"
-    #   "<Hold:29|WPos:20.163,0.000,20.000>"
-    #
-    # more with 3 axes
-    #   "<Idle|WPos:0.000,0.000,0.000,0.000|FS:0,0|Pn:XYZA|WCO:0.000,0.000,0.000,0.000>"
-
-    # reGrblMachineStatus = re.compile(
-    #     r'<(\w+)[:]{0,1}[\d]*[,\|].*[W|M]Pos:([+-]{0,1}\d+\.\d+),'
-    #     r'([+-]{0,1}\d+\.\d+),([+-]{0,1}\d+\.\d+)\|FS:(\d+),(\d+)')
+    """
+        Responses are classified by first character and only the matching
+        parser runs, most lines are "ok"
 
-    reGrblMachineStatus = re.compile(
-        r'<(\w+)[:]{0,1}[\d]*[,\|].*[W|M]Pos:(.+)\|FS:(\d+),(\d+)')
+        "ok"                          acknowledge
+        "error:20"                    error
+        "<Idle|WPos:0.000,...>"       status report
+        "ALARM:3"                     alarm
+        "[VER:1.1f.20170801:]"        version
+        "Grbl 1.1f ['$' for help]"    init string
+        "$100=250.000"                config setting
 
-    reGrblAxes = re.compile(
-        r'([+-]{0,1}\d+\.\d+),')
+        Status report fields parsed are grbl 1.1 WPos, MPos, FS, F, Bf, Ln,
+        Ov, WCO, Pn and A, as well as grbl 0.9 comma separated reports.
 
-    """
         To be able to track working position change GRBL settings to display
         work position as oppose to machine position from 1.1f use $10=0 to
-        configure...
+        configure, with machine position the last WCO is used to calculate
+        work position.
     """
 
-    # grbl ack, example  "ok"
-    reGrblMachineAck = re.compile(r'^ok\s$')
-
-    # grbl error, example  "error:20", "error: Unsupported command"
-    reGrblMachineError = re.compile(r'^error:(\d+)\s$')
-
-    # grbl init, example "ALARM:x"
-    reGrblAlarm = re.compile(r'ALARM:(\d+)')
-
-    # grbl config settings
-    reGrblConfig = re.compile(r'^\$(\d+)=\d+.*\s*')
-
     def __init__(self):
         super(MachIf_GRBL, self).__init__(
             ID, NAME, BUFFER_MAX_SIZE, BUFFER_INIT_VAL, BUFFER_WATERMARK_PRCNT)
 
         self._inputBufferPart = list()
 
-        self.machineAutoRefreshPeriod = 200
-        self.timeOut = gc.TimeOut(float(self.machineAutoRefreshPeriod/1000))
-        self.timeOut.disable()
         self.machineStatus = GRBL_STATE_UNKNOWN
 
-        self.autoStatusNextMicro = None
+        # grbl only reports status when asked
+        self.statusPollEnable = True
 
         self.initStringDetectFlag = False
 
+        # work coordinate offset, grbl only reports it every so often
+        self.workCoordOffset = None
+
         # list of commands
         self.cmdClearAlarm = '$X\n'
         self.cmdHome = '$H\n'
@@ -301,181 +283,259 @@ class MachIf_GRBL(mi.MachIf_Base):
     def decode(self, data):
         dataDict = {}
 
-        # GRBL status data
-        # data is expected to be an array of strings as follows
-        # statusData[0] : Machine state
-        # statusData[1] : Machine X
-        # statusData[2] : Machine Y
-        # statusData[3] : Machine Z
-        # statusData[4] : Work X
-        # statusData[5] : Work Y
-        # statusData[6] : Work Z
+        # dispatch on first character, parse only what applies
+        lead = data[:1]
 
-        status = self.reGrblMachineStatus.match(data)
-        if status is not None:
-            statusData = status.groups()
-            sr = {}
+        if lead == 'o':
+            if data.rstrip() == "ok":
+                self._decodeAck(dataDict, data)
 
-            # remove the "?" used to get status notice no "\n"
-            bufferPart = 1
+        elif lead == '<':
+            self._decodeStatus(dataDict, data)
 
-            if (self._inputBufferSize >= bufferPart):
-                self._inputBufferSize = self._inputBufferSize - bufferPart
-            else:
-                bufferPart = 0
+        elif lead == 'e':
+            if data.startswith("error:"):
+                self._decodeError(dataDict, data)
 
-            sr['stat'] = statusData[0]
-            sr['vel'] = float(statusData[2])
+        elif lead == 'A':
+            if data.startswith("ALARM:"):
+                self._decodeAlarm(dataDict, data)
 
-            axes = self.reGrblAxes.findall('%s,' % statusData[1])
-            if len(axes):
+        elif lead == '[':
+            if data.startswith("[VER:"):
+                self._decodeVersion(dataDict, data)
 
-                for i in range(len(axes)):
-                    sr['pos%s' % self.axes_list[i]] = float(axes[i])
+        elif lead == 'G':
+            if data.startswith("Grbl") and '[' in data:
+                self._decodeInitStr(dataDict, data)
 
-            dataDict['sr'] = sr
+        elif lead == '$':
+            self._decodeConfig(dataDict, data)
 
-            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
-                self.logger.info("status match %s" % str(statusData))
-                prcnt = float(self._inputBufferSize)/self._inputBufferMaxSize
-                self.logger.info(
-                    f"decode, input buffer free: {bufferPart}, size: {self._inputBufferSize}, {(100*prcnt):.2f}% full")
+        return dataDict
 
-            # check on status change
-            decodedStatus = self.stat_dict.get(
-                statusData[0], GRBL_STATE_UNKNOWN)
+    def _decodeAck(self, data_dict, data):
+        bufferPart = 0
 
-            if self.machineStatus != decodedStatus:
-                if decodedStatus in [GRBL_STATE_RUN, GRBL_STATE_JOG]:
+        if len(self._inputBufferPart) > 0:
+            bufferPart = self._inputBufferPart.pop(0)
 
-                    # start timer
-                    self.timeOut.reset()
+        self._inputBufferSize = self._inputBufferSize - bufferPart
 
-                self.machineStatus = decodedStatus
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
+            self.logger.info("found acknowledge [%s]" % data.strip())
 
-            sr['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
+        data_dict['r'] = {}
+        data_dict['f'] = [0, 0, bufferPart]
+        data_dict['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
 
-        ack = self.reGrblMachineAck.search(data)
-        if ack is not None:
-            bufferPart = 0
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
+            prcnt = float(self._inputBufferSize)/self._inputBufferMaxSize
+            self.logger.info(
+                f"decode, input buffer free: {bufferPart}, size: {self._inputBufferSize}, {(100*prcnt):.2f}% full")
 
-            if len(self._inputBufferPart) > 0:
-                bufferPart = self._inputBufferPart.pop(0)
+    def _decodeAlarm(self, data_dict, data):
+        sr = {}
+        sr['stat'] = "Alarm"
+        sr['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
 
-            self._inputBufferSize = self._inputBufferSize - bufferPart
+        data_dict['sr'] = sr
 
-            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
-                self.logger.info("found acknowledge [%s]" % data.strip())
+        alarm_code = data[6:].strip()
+        if alarm_code.isdigit():
+            alarm_code = int(alarm_code)
+            alarm_str = "[MSG: %s]\n" % (
+                GRBL_ALARM_CODE_2_STR_DICT.get(alarm_code, "Unknown")
+            )
+            data_dict['rx_data_info'] = alarm_str
 
-            r = {}
-            dataDict['r'] = r
-            dataDict['f'] = [0, 0, bufferPart]
-            dataDict['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
+    def _decodeConfig(self, data_dict, data):
+        # example "$100=250.000"
+        key, sep, value = data[1:].partition('=')
 
-            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
-                prcnt = float(self._inputBufferSize)/self._inputBufferMaxSize
-                self.logger.info(
-                    f"decode, input buffer free: {bufferPart}, size: {self._inputBufferSize}, {(100*prcnt):.2f}% full")
-
-        alarm = self.reGrblAlarm.search(data)
-        if alarm is not None:
-            if 'sr' in dataDict:
-                sr = dataDict.get('sr')
-            else:
-                sr = {}
-
-            sr['stat'] = "Alarm"
-            decodedStatus = self.stat_dict.get(sr['stat'], GRBL_STATE_UNKNOWN)
-
-            sr['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
-
-            dataDict['sr'] = sr
-
-            alarm_code = alarm.group(1).strip()
-            if alarm_code.isdigit():
-                alarm_code = int(alarm_code)
-                alarm_str = "[MSG: %s]\n" % (
-                    GRBL_ALARM_CODE_2_STR_DICT.get(alarm_code, "Unknown")
-                )
-                dataDict['rx_data_info'] = alarm_str
-            else:
-                error_code = -1
-
-        error = self.reGrblMachineError.search(data)
-        if error is not None:
-            bufferPart = 0
+        if sep and key.isdigit() and value[:1].isdigit():
+            data_len = len(data)
+            fill = 20 - data_len
+            data_dict['rx_data_info'] = "%s%s\n" % (' '*fill, GRBL_CONFIG_2_STR_DICT.get(int(key), ""))
 
-            if len(self._inputBufferPart) > 0:
-                bufferPart = self._inputBufferPart.pop(0)
+    def _decodeError(self, data_dict, data):
+        bufferPart = 0
 
-            self._inputBufferSize = self._inputBufferSize - bufferPart
+        if len(self._inputBufferPart) > 0:
+            bufferPart = self._inputBufferPart.pop(0)
 
-            if 'r' not in dataDict:
-                r = {}
-                dataDict['r'] = r
+        self._inputBufferSize = self._inputBufferSize - bufferPart
 
-            error_code = error.group(1).strip()
-            if error_code.isdigit():
-                error_code = int(error_code)
-                err_str = "[MSG: %s]\n" % (
-                    GRBL_ERROR_CODE_2_STR_DICT.get(error_code, "Unknown")
-                )
+        data_dict['r'] = {}
 
-                dataDict['rx_data_info'] = err_str
+        error_code = data[6:].strip()
+        if error_code.isdigit():
+            error_code = int(error_code)
+            err_str = "[MSG: %s]\n" % (
+                GRBL_ERROR_CODE_2_STR_DICT.get(error_code, "Unknown")
+            )
 
-            else:
-                error_code = -1
+            data_dict['rx_data_info'] = err_str
 
-            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
-                error_msg = "found error [%s]" % data.strip()
-                if 'rx_data_info' in dataDict:
-                    error_msg = "found %s, %s" % (data.strip(), dataDict['rx_data_info'].strip())
-                self.logger.info(error_msg)
+        else:
+            # grbl 0.9 and older report error text, i.e. "error: Bad number format"
+            error_code = -1
 
-            dataDict['f'] = [0, error_code, bufferPart, error_code]
-            dataDict['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
+            error_msg = "found error [%s]" % data.strip()
+            if 'rx_data_info' in data_dict:
+                error_msg = "found %s, %s" % (data.strip(), data_dict['rx_data_info'].strip())
+            self.logger.info(error_msg)
 
-            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
-                prcnt = float(self._inputBufferSize)/self._inputBufferMaxSize
-                self.logger.info(
-                    f"decode, input buffer free: {bufferPart}, size: {self._inputBufferSize}, {(100*prcnt):.2f}% full")
+        data_dict['f'] = [0, error_code, bufferPart, error_code]
+        data_dict['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
 
-        version = self.reGrblVersion.match(data)
-        if version is not None:
-            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
-                self.logger.info("found version [%s]" % version.group(1).strip())
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
+            prcnt = float(self._inputBufferSize)/self._inputBufferMaxSize
+            self.logger.info(
+                f"decode, input buffer free: {bufferPart}, size: {self._inputBufferSize}, {(100*prcnt):.2f}% full")
+
+    def _decodeInitStr(self, data_dict, data):
+        initStr = data.strip()
+
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
+            self.logger.info("found device init string [%s]" % initStr)
+
+        self.initStringDetectFlag = True
+
+        data_dict['r'] = {'init': initStr, 'machif': self.getName()}
+
+    def _decodeStatus(self, data_dict, data):
+        report = data.strip()
+
+        # incomplete report
+        if report[-1:] != '>':
+            return
+
+        report = report[1:-1]
+
+        if '|' in report:
+            fields = report.split('|')
+        else:
+            fields = self.reGrblLegacyStatusSplit.split(report)
 
-            if 'r' not in dataDict:
-                r = {}
-                dataDict['r'] = r
+        # state with optional sub-state code, i.e. "Hold:0", "Door:1"
+        state, sep, subState = fields[0].partition(':')
 
-            dataDict['r']['fb'] = version.group(1)
-            dataDict['r']['machif'] = self.getName()
-            dataDict['f'] = [0, 0, 0]
-            dataDict['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
-            self.systemInfo = data
+        sr = {}
+        sr['stat'] = state
 
-        initStr = self.reGrblInitStr.match(data)
-        if initStr is not None:
+        if subState.isdigit():
+            sr['substat'] = int(subState)
+
+        mpos = None
+        wpos = None
+
+        try:
+            for field in fields[1:]:
+                key, sep, value = field.partition(':')
+
+                if key == 'MPos':
+                    mpos = list(map(float, value.split(',')))
+
+                elif key == 'WPos':
+                    wpos = list(map(float, value.split(',')))
+
+                elif key == 'FS':
+                    # feed and spindle speed
+                    fs = value.split(',')
+                    sr['vel'] = float(fs[0])
+                    if len(fs) > 1:
+                        sr['spe'] = float(fs[1])
+
+                elif key == 'F':
+                    sr['vel'] = float(value)
+
+                elif key == 'Bf':
+                    # planner blocks and rx buffer bytes available
+                    sr['bf'] = list(map(int, value.split(',')))
+
+                elif key == 'Ln':
+                    sr['line'] = int(value)
+
+                elif key == 'Ov':
+                    # feed, rapid and spindle override percentages, accessory
+                    # field is only sent along overrides when something is on
+                    sr['ov'] = list(map(int, value.split(',')))
+                    sr.setdefault('acc', "")
+
+                elif key == 'WCO':
+                    self.workCoordOffset = list(map(float, value.split(',')))
+                    sr['wco'] = self.workCoordOffset
+
+                elif key == 'Pn':
+                    sr['pn'] = value
+
+                elif key == 'A':
+                    sr['acc'] = value
+
+        except ValueError:
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
-                self.logger.info("found device init string [%s]" % initStr.group(1).strip())
+                self.logger.info("malformed status [%s]" % data.strip())
 
-            self.initStringDetectFlag = True
+            return
 
-            if 'r' not in dataDict:
-                r = {}
-                dataDict['r'] = r
+        if wpos is None and mpos is not None:
+            wpos = mpos
 
-            dataDict['r']['init'] = initStr.group(1).strip()
-            dataDict['r']['machif'] = self.getName()
+            if self.workCoordOffset is not None:
+                wpos = [m - o for m, o in zip(mpos, self.workCoordOffset)]
 
-        config = self.reGrblConfig.match(data)
-        if config is not None:
-            data_len = len(data)
-            fill = 20 - data_len
-            dataDict['rx_data_info'] = "%s%s\n" % (' '*fill, GRBL_CONFIG_2_STR_DICT.get(int(config.group(1)), ""))
+        if wpos is not None:
+            sr.update(zip(self.axes_pos_keys_list, wpos))
 
-        return dataDict
+        # remove the "?" used to get status notice no "\n"
+        bufferPart = 1
+
+        if (self._inputBufferSize >= bufferPart):
+            self._inputBufferSize = self._inputBufferSize - bufferPart
+        else:
+            bufferPart = 0
+
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
+            self.logger.info("status match %s" % str(fields))
+            prcnt = float(self._inputBufferSize)/self._inputBufferMaxSize
+            self.logger.info(
+                f"decode, input buffer free: {bufferPart}, size: {self._inputBufferSize}, {(100*prcnt):.2f}% full")
+
+        # check on status change
+        decodedStatus = self.stat_dict.get(state, GRBL_STATE_UNKNOWN)
+
+        self.machineStatus = decodedStatus
+
+        if decodedStatus in [GRBL_STATE_JOG, GRBL_STATE_HOME]:
+            self.statusPollReport(mi.STATUS_POLL_FAST, len(data))
+        elif decodedStatus == GRBL_STATE_RUN:
+            self.statusPollReport(mi.STATUS_POLL_RUN, len(data))
+        else:
+            self.statusPollReport(mi.STATUS_POLL_STOP, len(data))
+
+        sr['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
+
+        data_dict['sr'] = sr
+
+    def _decodeVersion(self, data_dict, data):
+        # example "[VER:1.1f.20170801:]", build info follows the last ":"
+        version = data.strip()[5:-1]
+        sep = version.rfind(':')
+
+        if sep < 0:
+            return
+
+        version = version[:sep]
+
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_MOD:
+            self.logger.info("found version [%s]" % version.strip())
+
+        data_dict['r'] = {'fb': version, 'machif': self.getName()}
+        data_dict['f'] = [0, 0, 0]
+        data_dict['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
+        self.systemInfo = data
 
     def doGetSystemInfo(self):
         if self._serialTxRxThread is not None:
@@ -485,7 +545,7 @@ class MachIf_GRBL(mi.MachIf_Base):
         if 'x' in dict_axis and 'y' in dict_axis and 'z' in dict_axis:
             self.add_event(gc.EV_TXDATA, self.cmdHome)
             self.write(self.cmdHome)
-            self.write(self.cmdStatus)
+            self.statusPollKick(fast=True)
         else:
             msg = "!! grbl doesn't support single/partial axis homing."
             self.add_event(gc.EV_RXDATA, msg)
@@ -508,6 +568,7 @@ class MachIf_GRBL(mi.MachIf_Base):
             dict_axis_coor['feed'] = 10000
 
         self._move("$J=G90", dict_axis_coor, reset_pos_mode=False)
+        self.statusPollKick(fast=True)
 
     def doJogFastMoveRelative(self, dict_axis_coor):
         """
@@ -518,6 +579,7 @@ class MachIf_GRBL(mi.MachIf_Base):
             dict_axis_coor['feed'] = 10000
 
         self._move("$J=G91", dict_axis_coor, reset_pos_mode=False)
+        self.statusPollKick(fast=True)
 
     def doJogMove(self, dict_axis_coor):
         """
@@ -525,6 +587,7 @@ class MachIf_GRBL(mi.MachIf_Base):
 
         """
         self._move("$J=G90", dict_axis_coor, reset_pos_mode=False)
+        self.statusPollKick(fast=True)
 
     def doJogMoveRelative(self, dict_axis_coor):
         """
@@ -532,6 +595,7 @@ class MachIf_GRBL(mi.MachIf_Base):
 
         """
         self._move("$J=G91", dict_axis_coor, reset_pos_mode=False)
+        self.statusPollKick(fast=True)
 
     def doJogStop(self):
         self.doFeedHold()
@@ -588,25 +652,13 @@ class MachIf_GRBL(mi.MachIf_Base):
     def factory(self):
         return MachIf_GRBL()
 
-    def init(self):
-        super(MachIf_GRBL, self).init()
-        self.machineAutoRefreshPeriod = gc.CONFIG_DATA.get(
-            f"/machine/MachIfSpecific/{self.name}/AutoRefreshPeriod/Value")
-        self.timeOut.set_timeout(float(self.machineAutoRefreshPeriod/1000))
+    def getRealTimeCmds(self):
+        # status query is a real-time command
+        return super(MachIf_GRBL, self).getRealTimeCmds() + [self.cmdStatus]
 
     def tick(self):
-        # check if is time for auto-refresh and send get status cmd and
-        # prepare next refresh time
-        if self.machineStatus in [GRBL_STATE_RUN, GRBL_STATE_JOG]:
-            if self.timeOut.time_expired() and self.okToSend(self.cmdStatus):
-                super(MachIf_GRBL, self).write(self.cmdStatus)
-        else:
-            self.timeOut.disable()
-
-        configAutoRefresh = gc.CONFIG_DATA.get(f"/machine/MachIfSpecific/{self.name}/AutoRefreshPeriod/Value")
-        if self.machineAutoRefreshPeriod != configAutoRefresh:
-            self.machineAutoRefreshPeriod = configAutoRefresh
-            self.timeOut.set_timeout(float(self.machineAutoRefreshPeriod/1000))
+        # status polling
+        super(MachIf_GRBL, self).tick()
 
         # check for init condition, take action, and reset init condition
         if (self.initStringDetectFlag):
@@ -615,23 +667,13 @@ class MachIf_GRBL(mi.MachIf_Base):
             self._init()
 
     def write(self, txData, raw_write=False):
-        askForStatus = False
-        bytesSent = 0
+        bytesSent = super(MachIf_GRBL, self).write(txData, raw_write)
 
         # moving to active state get at least one status msg
         if self.machineStatus in [
             GRBL_STATE_IDLE, GRBL_STATE_STOP, GRBL_STATE_HOME,
             GRBL_STATE_SLEEP, GRBL_STATE_HOLD
-        ]:
-            askForStatus = True
-
-        bytesSent = super(MachIf_GRBL, self).write(txData, raw_write)
-
-        if askForStatus:
-            if self.okToSend(self.cmdStatus):
-                super(MachIf_GRBL, self).write(self.cmdStatus)
-                super(MachIf_GRBL, self).write(self.cmdStatus)
+        ] and txData != self.cmdStatus:
+            self.statusPollKick()
 
-            # start timer
-            self.timeOut.reset()
         return bytesSent
@@ -0,0 +1,102 @@
+"""----------------------------------------------------------------------------
+    machif_json.py
+
+    Copyright (C) 2013 Wilhelm Duembeg
+
+    This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+    grbl like GCODE interpreters. With features similar to software debuggers.
+    Features such as breakpoint, change current program counter, inspection
+    and modification of variables.
+
+    gsat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.
+
+    gsat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+
+import json
+
+""" Global values for this module
+"""
+# optional accelerated JSON backend, first one found is used, all raise
+# ValueError (or a subclass) on bad input like json does
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+        json_loads = ujson.loads
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        json_loads = json.loads
+        JSON_BACKEND = "json"
+
+# acknowledge with empty response, i.e. '{"r":{},"f":[1,0,33]}'
+JSON_ACK_PREFIX = '{"r":{},"f":['
+JSON_ACK_SUFFIX = ']}'
+JSON_ACK_CACHE_MAX = 512
+
+
+class JsonResponseDecoder(object):
+    """
+    JSON response decoder for TinyG and g2core
+
+    While streaming most lines are acknowledges with an empty response,
+    these are recognized without a full JSON parse and their footer list is
+    cached and reused (treat "f" lists as read only). Everything else goes
+    to the JSON backend.
+
+    """
+
+    def __init__(self):
+        self.ackCache = {}
+
+    def decodeAck(self, data):
+        """
+        Get footer of an empty response acknowledge, None if data is not
+        of that exact shape
+
+        """
+        footer = self.ackCache.get(data)
+
+        if footer is None:
+            ack = data.rstrip()
+
+            if not ack.endswith(JSON_ACK_SUFFIX):
+                return None
+
+            try:
+                footer = [int(v) for v in ack[len(JSON_ACK_PREFIX):-len(JSON_ACK_SUFFIX)].split(',')]
+            except ValueError:
+                return None
+
+            if len(self.ackCache) >= JSON_ACK_CACHE_MAX:
+                self.ackCache.clear()
+
+            self.ackCache[data] = footer
+
+        return footer
+
+    def loads(self, data):
+        """
+        Decode JSON line, raises ValueError if data is not JSON
+
+        """
+        if data.startswith(JSON_ACK_PREFIX):
+            footer = self.decodeAck(data)
+
+            if footer is not None:
+                return {'r': {}, 'f': footer}
+
+        return json_loads(data)
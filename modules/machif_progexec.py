@@ -23,11 +23,10 @@
 
 ----------------------------------------------------------------------------"""
 import re
+import array
 import threading
 import time
 import logging
-import hashlib
-import queue
 
 import modules.config as gc
 import modules.machif_config as mi
@@ -44,6 +43,90 @@ gReGcodeComments = [re.compile(r'\(.*\)'), re.compile(r';.*')]
 # message example "(MSG, CHANGE TOOL BIT: to drill size 0.81300 mm)"
 gReGcodeMsg = re.compile(r'^\s*\(MSG,(.+)\)')
 
+# max time to wait for serial data or events, periodic work (device status
+# requests, run time) is done at least this often
+EXEC_TICK_PERIOD = 0.02
+
+
+class GcodeProgram(object):
+    """ Compiled representation of the gcode lines, comments, MSG lines and
+        filters are resolved once when lines are loaded, so the RUN and STEP
+        states have no parsing to do per line. Entries are indexed by the
+        original line index (PC).
+    """
+    FLAG_MSG = 0x01
+    FLAG_FILTERED = 0x02
+
+    def __init__(self, gcode_lines=None, filter_gcodes_list=None):
+        self.compile(gcode_lines, filter_gcodes_list)
+
+    def __len__(self):
+        return len(self.sendData)
+
+    def compile(self, gcode_lines=None, filter_gcodes_list=None):
+        """ Build send ready data and flags for all lines
+        """
+        if gcode_lines is None:
+            gcode_lines = []
+
+        if filter_gcodes_list is None:
+            filter_gcodes_list = []
+
+        self.gcodeLines = gcode_lines
+        self.filterGCodesList = list(filter_gcodes_list)
+
+        # send ready data per line, empty string when nothing to send
+        self.sendData = []
+        self.flags = array.array('B', bytes(len(gcode_lines)))
+        self.msgData = {}
+
+        send_data = self.sendData
+        flags = self.flags
+
+        for index, gcode in enumerate(gcode_lines):
+            # check for msg line
+            reMsgSearch = gReGcodeMsg.search(gcode)
+            if reMsgSearch is not None:
+                flags[index] |= self.FLAG_MSG
+                self.msgData[index] = reMsgSearch.group(1)
+
+            # don't sent unnecessary data save the bits for speed
+            for reComments in gReGcodeComments:
+                gcode = reComments.sub("", gcode)
+
+            for filter in self.filterGCodesList:
+                if filter in gcode:
+                    flags[index] |= self.FLAG_FILTERED
+                    break
+
+            gcode = gcode.strip()
+
+            if len(gcode) > 0:
+                gcode = "%s\n" % (gcode)
+
+            send_data.append(gcode)
+
+    def isStale(self, gcode_lines, filter_gcodes_list):
+        """ Check if program needs to be compiled again
+        """
+        return (gcode_lines is not self.gcodeLines or
+                len(gcode_lines) != len(self.sendData) or
+                filter_gcodes_list != self.filterGCodesList)
+
+    def getMsg(self, index):
+        return self.msgData.get(index)
+
+    def getSendData(self, index, use_filter=False):
+        """ Get send ready data for line, empty string if nothing to send
+        """
+        if use_filter and self.flags[index] & self.FLAG_FILTERED:
+            return ""
+
+        return self.sendData[index]
+
+    def isMsg(self, index):
+        return bool(self.flags[index] & self.FLAG_MSG)
+
 
 class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
     """  Threads that executes the gcode sending code to serial port. This
@@ -62,6 +145,8 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
         self.okToPostEvents = True
 
         self.gcodeDataLines = []
+        self.gcodeProgram = GcodeProgram()
+        self.gcodeDigest = gc.GcodeDigest(self.gcodeDataLines)
         self.gcodeFileName = ""
         self.breakPointSet = set()
         self.initialProgramCounter = 0
@@ -73,17 +158,34 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
 
         self.serialWriteQueue = []
 
+        # lines sent and waiting for ack in the order the device acks
+        # them, program counter for streamed program lines, None for other
+        # lines (user commands, init script, jog)
+        self.runStreamInFlight = []
+        self.runStreamError = False
+
         self.machIfId = None
         self.machIfModule = None
         self.machIfState = None
+        self.machineState = gc.MachineState()
 
         self.runTimeStart = 0
         self.runTimeElapse = 0
 
         self.do_init_script = False
 
+        # always on counters and timers
+        self.perf = gc.PerfCounters("exec")
+
+        # per listener status coalescing, see notify_event_listeners
+        self.eventCoalescers = {}
+
         self.init_config()
 
+        # machine config changes come in as EV_CMD_UPDATE_CONFIG
+        self.configData = gc.CONFIG_DATA
+        self.configData.subscribe('/machine', self.on_config_changes)
+
         if event_handler is not None:
             self.add_event_listener(event_handler)
 
@@ -108,347 +210,411 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
         filterGcodeList = self.filterGCodes.split(',')
         self.filterGCodesList = [x.strip() for x in filterGcodeList]
         self.dictProbeSettings = gc.CONFIG_DATA.get('/machine/Probe')
+        self.streamingEnable = gc.CONFIG_DATA.get('/machine/StreamingEnable', False)
+        self.statusMaxRate = gc.CONFIG_DATA.get('/machine/StatusMaxRate', gc.STATUS_MAX_RATE)
+
+        for coalescer in self.eventCoalescers.values():
+            coalescer.set_max_rate(self.statusMaxRate)
+
+        if self.machIfModule is not None:
+            self.machIfModule.initConfig()
+
+    def compile_gcode_program(self):
+        """ Compile gcode lines if lines or filters changed
+        """
+        if self.gcodeProgram.isStale(self.gcodeDataLines, self.filterGCodesList):
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
+                self.logger.info("compile gcode program, %d lines" % len(self.gcodeDataLines))
+
+            self.gcodeProgram.compile(self.gcodeDataLines, self.filterGCodesList)
 
     def process_queue(self):
         """ Handle events coming from main UI
         """
-        # process events from queue
-        try:
-            e = self._eventQueue.get_nowait()
-        except queue.Empty:
-            pass
-        else:
+        # process events from queue, bounded so states keep running
+        for count in range(gc.EVENT_QUEUE_DRAIN_MAX):
+            e = self.get_event()
 
-            self.lastEventID = e.event_id
+            if e is None:
+                break
 
-            if e.event_id == gc.EV_CMD_STEP:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_STEP")
+            self.perf.incr('events')
 
-                h1 = hashlib.md5(str(self.gcodeDataLines).encode('utf-8')).hexdigest()
+            line_count = self.machIfModule.getInputBufferLineCount()
+            self.process_event(e)
+            self.track_device_lines(line_count)
 
-                if 'gcodeFileName' in e.data:
-                    self.gcodeFileName = e.data['gcodeFileName']
+            # give waiting loops the chance to see the stop
+            if e.event_id == gc.EV_CMD_STOP or self.endThread:
+                break
 
-                if 'gcodeLines' in e.data:
-                    self.gcodeDataLines = e.data['gcodeLines']
+    def process_event(self, e):
+        """ Handle single event
+        """
+        self.lastEventID = e.event_id
 
-                if 'gcodePC' in e.data:
-                    self.initialProgramCounter = e.data['gcodePC']
-                    self.workingProgramCounter = self.initialProgramCounter
-                else:
-                    self.initialProgramCounter = self.workingProgramCounter
-                    # self.workingProgramCounter = self.initialProgramCounter
+        if e.event_id == gc.EV_CMD_STEP:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_STEP")
 
-                last_brk_pt_set = self.breakPointSet
-                if 'breakPoints' in e.data:
-                    self.breakPointSet = e.data['breakPoints']
+            h1 = self.gcodeDigest.digest
 
-                # if gcode lines change update listeners of new md5
-                h2 = hashlib.md5(str(self.gcodeDataLines).encode('utf-8')).hexdigest()
-                if h1 != h2:
-                    self.notify_event_listeners(gc.EV_GCODE_MD5, h2)
-                elif last_brk_pt_set != self.breakPointSet:
-                    self.notify_event_listeners(gc.EV_BRK_PT_CHG)
+            if 'gcodeFileName' in e.data:
+                self.gcodeFileName = e.data['gcodeFileName']
 
-                self.swState = gc.STATE_STEP
+            if 'gcodeLines' in e.data:
+                self.gcodeDataLines = e.data['gcodeLines']
 
-            elif e.event_id == gc.EV_CMD_RUN:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_RUN")
+            if 'gcodePC' in e.data:
+                self.initialProgramCounter = e.data['gcodePC']
+                self.workingProgramCounter = self.initialProgramCounter
+            else:
+                self.initialProgramCounter = self.workingProgramCounter
+                # self.workingProgramCounter = self.initialProgramCounter
 
-                h1 = hashlib.md5(str(self.gcodeDataLines).encode('utf-8')).hexdigest()
+            last_brk_pt_set = self.breakPointSet
+            if 'breakPoints' in e.data:
+                self.breakPointSet = e.data['breakPoints']
 
-                if 'gcodeFileName' in e.data:
-                    self.gcodeFileName = e.data['gcodeFileName']
+            self.compile_gcode_program()
 
-                if 'gcodeLines' in e.data:
-                    self.gcodeDataLines = e.data['gcodeLines']
+            # if gcode lines change update listeners of new md5
+            h2 = h1
+            if 'gcodeLines' in e.data:
+                h2 = self.gcodeDigest.update(self.gcodeDataLines)
 
-                if 'gcodePC' in e.data:
-                    self.initialProgramCounter = e.data['gcodePC']
-                    self.workingProgramCounter = self.initialProgramCounter
+            if h1 != h2:
+                self.notify_event_listeners(gc.EV_GCODE_MD5, h2)
+            elif last_brk_pt_set != self.breakPointSet:
+                self.notify_event_listeners(gc.EV_BRK_PT_CHG)
 
-                last_brk_pt_set = self.breakPointSet
-                if 'breakPoints' in e.data:
-                    self.breakPointSet = e.data['breakPoints']
+            self.swState = gc.STATE_STEP
 
-                # init time only if we got new lines or previous state was
-                # IDLE (if we stop or step operations)
-                h2 = hashlib.md5(str(self.gcodeDataLines).encode('utf-8')).hexdigest()
-                if h1 != h2 or self.swState == gc.STATE_IDLE:
-                    self.runTimeStart = int(time.time())
+        elif e.event_id == gc.EV_CMD_RUN:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_RUN")
 
-                # if gcode lines change update listeners of new md5
-                if h1 != h2:
-                    self.notify_event_listeners(gc.EV_GCODE_MD5, h2)
-                elif last_brk_pt_set != self.breakPointSet:
-                    self.notify_event_listeners(gc.EV_BRK_PT_CHG)
+            h1 = self.gcodeDigest.digest
 
-                self.swState = gc.STATE_RUN
+            if 'gcodeFileName' in e.data:
+                self.gcodeFileName = e.data['gcodeFileName']
 
-            elif e.event_id == gc.EV_CMD_PAUSE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_PAUSE")
+            if 'gcodeLines' in e.data:
+                self.gcodeDataLines = e.data['gcodeLines']
 
-                self.swState = gc.STATE_PAUSE
+            if 'gcodePC' in e.data:
+                self.initialProgramCounter = e.data['gcodePC']
+                self.workingProgramCounter = self.initialProgramCounter
 
-            elif e.event_id == gc.EV_CMD_STOP:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_STOP")
+            last_brk_pt_set = self.breakPointSet
+            if 'breakPoints' in e.data:
+                self.breakPointSet = e.data['breakPoints']
 
-                force_update = False
+            self.compile_gcode_program()
 
-                if self.swState != gc.STATE_IDLE:
-                    force_update = True
-                    self.swState = gc.STATE_IDLE
+            # init time only if we got new lines or previous state was
+            # IDLE (if we stop or step operations)
+            h2 = h1
+            if 'gcodeLines' in e.data:
+                h2 = self.gcodeDigest.update(self.gcodeDataLines)
 
-                # self.runTimeStart = 0
+            if h1 != h2 or self.swState == gc.STATE_IDLE:
+                self.runTimeStart = int(time.time())
 
-                if force_update:
-                    self.notify_event_listeners(gc.EV_SW_STATE, self.swState)
+            # if gcode lines change update listeners of new md5
+            if h1 != h2:
+                self.notify_event_listeners(gc.EV_GCODE_MD5, h2)
+            elif last_brk_pt_set != self.breakPointSet:
+                self.notify_event_listeners(gc.EV_BRK_PT_CHG)
 
-            elif e.event_id == gc.EV_CMD_SEND:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_SEND {}".format(str(e.data).strip()))
+            # lines streamed before a PAUSE, STOP or BREAK may still be in
+            # the device buffer, keep them so their acks aren't taken for
+            # the lines we send next
+            self.runStreamError = False
+            self.swState = gc.STATE_RUN
 
-                self.serialWriteQueue.append((e.data, False))
+        elif e.event_id == gc.EV_CMD_PAUSE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_PAUSE")
 
-            elif e.event_id == gc.EV_CMD_SEND_W_ACK:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_SEND_W_ACK {}".format(e.data))
+            self.swState = gc.STATE_PAUSE
 
-                self.serialWriteQueue.append((e.data, True))
+        elif e.event_id == gc.EV_CMD_STOP:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_STOP")
 
-            elif e.event_id == gc.EV_CMD_OK_TO_POST:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_OK_TO_POST")
-                pass
+            force_update = False
 
-            elif e.event_id == gc.EV_CMD_GET_STATUS:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_GET_STATUS")
+            if self.swState != gc.STATE_IDLE:
+                force_update = True
+                self.swState = gc.STATE_IDLE
 
-                self.machIfModule.doGetStatus()
+            # self.runTimeStart = 0
 
-            elif e.event_id == gc.EV_CMD_GET_SYSTEM_INFO:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_GET_SYSTEM_INFO")
+            if force_update:
+                self.notify_event_listeners(gc.EV_SW_STATE, self.swState)
 
-                self.machIfModule.doGetSystemInfo()
+        elif e.event_id == gc.EV_CMD_SEND:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_SEND {}".format(str(e.data).strip()))
 
-            elif e.event_id == gc.EV_CMD_CYCLE_START:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_CYCLE_START")
+            self.serialWriteQueue.append((e.data, False))
 
-                # this command is usually use for resume after a machine stop
-                # thus, queues most probably full send without checking if ok..
-                self.machIfModule.doCycleStartResume()
+        elif e.event_id == gc.EV_CMD_SEND_W_ACK:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_SEND_W_ACK {}".format(e.data))
 
-            elif e.event_id == gc.EV_CMD_FEED_HOLD:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_FEED_HOLD")
+            self.serialWriteQueue.append((e.data, True))
 
-                # this command is usually use for abort and machine stop
-                # we can't afford to skip this action, send without checking
-                # if ok...
-                self.machIfModule.doFeedHold()
+        elif e.event_id == gc.EV_CMD_OK_TO_POST:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_OK_TO_POST")
+            pass
 
-            elif e.event_id == gc.EV_CMD_QUEUE_FLUSH:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_QUEUE_FLUSH")
+        elif e.event_id == gc.EV_CMD_GET_STATUS:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_GET_STATUS")
 
-                self.machIfModule.doQueueFlush()
+            self.machIfModule.doGetStatus()
 
-            elif e.event_id == gc.EV_CMD_RESET:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_RESET")
+        elif e.event_id == gc.EV_CMD_GET_SYSTEM_INFO:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_GET_SYSTEM_INFO")
 
-                self.machIfModule.doReset()
+            self.machIfModule.doGetSystemInfo()
 
-            elif e.event_id == gc.EV_CMD_CLEAR_ALARM:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_CLEAR_ALARM")
+        elif e.event_id == gc.EV_CMD_CYCLE_START:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_CYCLE_START")
 
-                self.machIfModule.doClearAlarm()
+            # this command is usually use for resume after a machine stop
+            # thus, queues most probably full send without checking if ok..
+            self.machIfModule.doCycleStartResume()
 
-            elif e.event_id == gc.EV_CMD_MOVE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_MOVE {}".format(e.data))
+        elif e.event_id == gc.EV_CMD_FEED_HOLD:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_FEED_HOLD")
 
-                self.machIfModule.doMove(e.data)
+            # this command is usually use for abort and machine stop
+            # we can't afford to skip this action, send without checking
+            # if ok...
+            self.machIfModule.doFeedHold()
 
-            elif e.event_id == gc.EV_CMD_MOVE_RELATIVE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_MOVE_RELATIVE {}".format(e.data))
+        elif e.event_id == gc.EV_CMD_QUEUE_FLUSH:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_QUEUE_FLUSH")
 
-                self.machIfModule.doMoveRelative(e.data)
+            self.machIfModule.doQueueFlush()
 
-            elif e.event_id == gc.EV_CMD_RAPID_MOVE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_RAPID_MOVE {}".format(e.data))
+            # device drops lines in its buffer, no acks coming
+            self.runStreamInFlight = []
 
-                self.machIfModule.doFastMove(e.data)
+        elif e.event_id == gc.EV_CMD_RESET:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_RESET")
 
-            elif e.event_id == gc.EV_CMD_RAPID_MOVE_RELATIVE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_RAPID_MOVE_RELATIVE {}".format(e.data))
+            self.machIfModule.doReset()
 
-                self.machIfModule.doFastMoveRelative(e.data)
+            # device drops lines in its buffer, no acks coming
+            self.runStreamInFlight = []
 
-            elif e.event_id == gc.EV_CMD_JOG_MOVE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_JOG_MOVE {}".format(e.data))
+        elif e.event_id == gc.EV_CMD_CLEAR_ALARM:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_CLEAR_ALARM")
 
-                self.machIfModule.doJogMove(e.data)
+            self.machIfModule.doClearAlarm()
 
-            elif e.event_id == gc.EV_CMD_JOG_MOVE_RELATIVE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_JOG_MOVE_RELATIVE {}".format(e.data))
+        elif e.event_id == gc.EV_CMD_MOVE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_MOVE {}".format(e.data))
 
-                self.machIfModule.doJogMoveRelative(e.data)
+            self.machIfModule.doMove(e.data)
 
-            elif e.event_id == gc.EV_CMD_JOG_RAPID_MOVE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_JOG_RAPID_MOVE {}".format(e.data))
+        elif e.event_id == gc.EV_CMD_MOVE_RELATIVE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_MOVE_RELATIVE {}".format(e.data))
 
-                self.machIfModule.doJogFastMove(e.data)
+            self.machIfModule.doMoveRelative(e.data)
 
-            elif e.event_id == gc.EV_CMD_JOG_RAPID_MOVE_RELATIVE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info(
-                        "EV_CMD_JOG_RAPID_MOVE_RELATIVE {}".format(e.data))
+        elif e.event_id == gc.EV_CMD_RAPID_MOVE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_RAPID_MOVE {}".format(e.data))
 
-                self.machIfModule.doJogFastMoveRelative(e.data)
+            self.machIfModule.doFastMove(e.data)
 
-            elif e.event_id == gc.EV_CMD_JOG_STOP:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_JOG_STOP {}".format(e.data))
+        elif e.event_id == gc.EV_CMD_RAPID_MOVE_RELATIVE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_RAPID_MOVE_RELATIVE {}".format(e.data))
 
-                self.machIfModule.doJogStop()
+            self.machIfModule.doFastMoveRelative(e.data)
 
-            elif e.event_id == gc.EV_CMD_SET_AXIS:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_SET_AXIS {}".format(e.data))
+        elif e.event_id == gc.EV_CMD_JOG_MOVE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_JOG_MOVE {}".format(e.data))
 
-                self.machIfModule.doSetAxis(e.data)
+            self.machIfModule.doJogMove(e.data)
 
-            elif e.event_id == gc.EV_CMD_HOME:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_HOME")
+        elif e.event_id == gc.EV_CMD_JOG_MOVE_RELATIVE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_JOG_MOVE_RELATIVE {}".format(e.data))
 
-                self.machIfModule.doHome(e.data)
+            self.machIfModule.doJogMoveRelative(e.data)
 
-            elif e.event_id == gc.EV_CMD_EXIT:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_EXIT")
+        elif e.event_id == gc.EV_CMD_JOG_RAPID_MOVE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_JOG_RAPID_MOVE {}".format(e.data))
 
-                if self.machIfModule.isSerialPortOpen():
-                    self.machIfModule.close()
-                else:
-                    self.endThread = True
-                    self.swState = gc.STATE_IDLE
+            self.machIfModule.doJogFastMove(e.data)
 
-            elif e.event_id == gc.EV_HELLO:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_HELLO from 0x{:x}".format(id(e.sender)))
+        elif e.event_id == gc.EV_CMD_JOG_RAPID_MOVE_RELATIVE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info(
+                    "EV_CMD_JOG_RAPID_MOVE_RELATIVE {}".format(e.data))
 
-                listener = e.sender
-                self.add_event_listener(listener)
-                h = hashlib.md5(str(self.gcodeDataLines).encode('utf-8')).hexdigest()
-                listener.add_event(gc.EV_GCODE_MD5, h)
+            self.machIfModule.doJogFastMoveRelative(e.data)
 
-            elif e.event_id == gc.EV_GOOD_BYE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_GOOD_BYE from 0x{:x}".format(id(e.sender)))
+        elif e.event_id == gc.EV_CMD_JOG_STOP:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_JOG_STOP {}".format(e.data))
 
-                self.remove_event_listener(e.sender)
+            self.machIfModule.doJogStop()
 
-            elif e.event_id == gc.EV_CMD_PROBE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_PROBE {}".format(e.data))
+        elif e.event_id == gc.EV_CMD_SET_AXIS:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_SET_AXIS {}".format(e.data))
 
-                self.machIfModule.doProbe(e.data)
+            self.machIfModule.doSetAxis(e.data)
 
-            elif e.event_id == gc.EV_CMD_PROBE_HELPER:
-                # This helper takes care of
-                #   Running the probe command
-                #   Setting probe offset
-                #   Retract using settings saved settings
-                # all the commands are sent to the machine interface, it is
-                # expected that if a probe error happens the machine will
-                # ignore the the set axis command anf the retract command
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_PROBE_HELPER {}".format(e.data))
+        elif e.event_id == gc.EV_CMD_HOME:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_HOME")
 
-                # expectation is a dictionary with a single key (the axis)
-                # and a positive or negative value indicating direction,
-                # the actual value is not important
-                axis = list(e.data.keys())[0]
-                direction = e.data[axis]
+            self.machIfModule.doHome(e.data)
 
-                feed_rate = self.dictProbeSettings[axis.upper()]['FeedRate']
-                travel_limit = self.dictProbeSettings[axis.upper()]['TravelLimit']
-                retract = self.dictProbeSettings[axis.upper()]['Retract']
-                offset = self.dictProbeSettings[axis.upper()]['Offset']
+        elif e.event_id == gc.EV_CMD_EXIT:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_EXIT")
 
-                # depending on probe direction we need to update some values
-                if direction > 0:
-                    travel_limit = abs(travel_limit)
-                    retract = -abs(retract)
-                else:
-                    travel_limit = -abs(travel_limit)
-                    retract = abs(retract)
+            if self.machIfModule.isSerialPortOpen():
+                self.machIfModule.close()
+            else:
+                self.endThread = True
+                self.swState = gc.STATE_IDLE
 
-                probe = {axis: travel_limit, 'feed': feed_rate}
-                self.machIfModule.doProbe(probe)
+        elif e.event_id == gc.EV_HELLO:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_HELLO from 0x{:x}".format(id(e.sender)))
+
+            listener = e.sender
+            self.add_event_listener(listener)
+            h = self.gcodeDigest.digest
+            listener.add_event(gc.EV_GCODE_MD5, h)
+
+        elif e.event_id == gc.EV_GOOD_BYE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_GOOD_BYE from 0x{:x}".format(id(e.sender)))
+
+            self.remove_event_listener(e.sender)
+
+        elif e.event_id == gc.EV_CMD_PROBE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_PROBE {}".format(e.data))
+
+            self.machIfModule.doProbe(e.data)
+
+        elif e.event_id == gc.EV_CMD_PROBE_HELPER:
+            # This helper takes care of
+            #   Running the probe command
+            #   Setting probe offset
+            #   Retract using settings saved settings
+            # all the commands are sent to the machine interface, it is
+            # expected that if a probe error happens the machine will
+            # ignore the the set axis command anf the retract command
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_PROBE_HELPER {}".format(e.data))
+
+            # expectation is a dictionary with a single key (the axis)
+            # and a positive or negative value indicating direction,
+            # the actual value is not important
+            axis = list(e.data.keys())[0]
+            direction = e.data[axis]
+
+            feed_rate = self.dictProbeSettings[axis.upper()]['FeedRate']
+            travel_limit = self.dictProbeSettings[axis.upper()]['TravelLimit']
+            retract = self.dictProbeSettings[axis.upper()]['Retract']
+            offset = self.dictProbeSettings[axis.upper()]['Offset']
+
+            # depending on probe direction we need to update some values
+            if direction > 0:
+                travel_limit = abs(travel_limit)
+                retract = -abs(retract)
+            else:
+                travel_limit = -abs(travel_limit)
+                retract = abs(retract)
 
-                set_axis = {axis: offset}
-                self.machIfModule.doSetAxis(set_axis)
+            probe = {axis: travel_limit, 'feed': feed_rate}
+            self.machIfModule.doProbe(probe)
 
-                if retract != 0:
-                    retract_axis = {axis: retract}
-                    self.machIfModule.doFastMoveRelative(retract_axis)
+            set_axis = {axis: offset}
+            self.machIfModule.doSetAxis(set_axis)
 
-            elif e.event_id == gc.EV_CMD_UPDATE_CONFIG:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_UPDATE_CONFIG")
+            if retract != 0:
+                retract_axis = {axis: retract}
+                self.machIfModule.doFastMoveRelative(retract_axis)
 
-                self.init_config(run_time_safe_only=True)
+        elif e.event_id == gc.EV_CMD_UPDATE_CONFIG:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_UPDATE_CONFIG {}".format(e.data))
 
-            elif e.event_id == gc.EV_CMD_GET_SW_STATE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_GET_SW_STATE")
+            self.init_config(run_time_safe_only=True)
+            self.compile_gcode_program()
 
-                self.notify_event_listeners(gc.EV_SW_STATE, self.swState)
+        elif e.event_id == gc.EV_CMD_GET_SW_STATE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_GET_SW_STATE")
+
+            self.notify_event_listeners(gc.EV_SW_STATE, self.swState)
 
-            elif e.event_id == gc.EV_CMD_GET_GCODE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_GET_GCODE")
+        elif e.event_id == gc.EV_CMD_GET_PERF_STATS:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_GET_PERF_STATS")
 
-                listener = e.sender
-                listener.add_event(gc.EV_GCODE, self.gcodeDataLines, self)
+            self.notify_event_listeners(gc.EV_PERF_STATS, self.get_perf_stats())
 
-            elif e.event_id == gc.EV_CMD_GET_GCODE_MD5:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_GET_GCODE_MD5")
+        elif e.event_id == gc.EV_CMD_GET_MACHINE_STATE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_GET_MACHINE_STATE")
 
-                h = hashlib.md5(str(self.gcodeDataLines).encode('utf-8')).hexdigest()
-                # self.notify_event_listeners(gc.EV_GCODE_MD5, h)
+            snapshot = self.machineState.get_snapshot()
+            self.notify_event_listeners(gc.EV_MACHINE_STATE, self.machineState.get_status_data(snapshot))
 
-                listener = e.sender
-                listener.add_event(gc.EV_GCODE_MD5, h, self)
+        elif e.event_id == gc.EV_CMD_GET_GCODE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_GET_GCODE")
 
-            elif e.event_id == gc.EV_CMD_GET_BRK_PT:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.info("EV_CMD_GET_BRK_PT")
+            listener = e.sender
+            listener.add_event(gc.EV_GCODE, self.gcodeDataLines, self)
 
-                listener = e.sender
-                listener.add_event(gc.EV_BRK_PT, self.breakPointSet)
+        elif e.event_id == gc.EV_CMD_GET_GCODE_MD5:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_GET_GCODE_MD5")
 
-            else:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
-                    self.logger.error("got unknown event!! [{}]".format(str(e.event_id)))
+            h = self.gcodeDigest.digest
+            # self.notify_event_listeners(gc.EV_GCODE_MD5, h)
+
+            listener = e.sender
+            listener.add_event(gc.EV_GCODE_MD5, h, self)
+
+        elif e.event_id == gc.EV_CMD_GET_BRK_PT:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.info("EV_CMD_GET_BRK_PT")
+
+            listener = e.sender
+            listener.add_event(gc.EV_BRK_PT, self.breakPointSet)
+
+        else:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC_EV:
+                self.logger.error("got unknown event!! [{}]".format(str(e.event_id)))
 
     """-------------------------------------------------------------------------
     programExecuteThread: General Functions
@@ -456,6 +622,7 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
 
     def init_machine_if_module(self):
         self.machIfModule = mi.GetMachIfModule(self.machIfId)
+        self.machIfModule.setWakeupListener(self)
 
         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
             msg = "init MachIf Module (%s)." % self.machIfModule.getName()
@@ -474,7 +641,11 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
     def serial_read(self):
         rxData = self.machIfModule.read()
 
-        if 'event' in rxData:
+        if not rxData:
+            # nothing to process
+            pass
+
+        elif 'event' in rxData:
             forwardEvent = True
             e = rxData['event']
             if e['id'] == gc.EV_ABORT:
@@ -486,62 +657,80 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
                 self.swState = gc.STATE_IDLE
                 forwardEvent = False
 
+            if e['id'] in [gc.EV_SER_PORT_OPEN, gc.EV_SER_PORT_CLOSE]:
+                # new connection, nothing known about the device
+                self.machineState.reset()
+                self.runStreamInFlight = []
+
             if forwardEvent:
                 # notify listeners
                 self.notify_event_listeners(e['id'], e['data'])
 
         else:
-            rxData['pc'] = self.workingProgramCounter
-            rxData['swstate'] = "{}".format(self.swState)
+            sr = rxData.get('sr')
+            r = rxData.get('r')
+            stateData = {'pc': self.workingProgramCounter, 'swstate': self.swState}
 
-            rxDataKeys = rxData.keys()
+            if 'ib' in rxData:
+                # device buffer after acknowledge
+                stateData['ib'] = rxData['ib']
 
-            if set(['rx_data', 'sr']) & set(rxDataKeys):
+            if sr is not None:
+                if len(self.gcodeDataLines):
+                    # at this point we haven't completed and added program counter
+                    # we need to +1, also array starts at 0 and gcode page starts at 1
+                    # nee another +1
+                    gcode_lines_len = len(self.gcodeDataLines)
+                    adj_prog_counter = self.workingProgramCounter + 2
 
-                try:
-                    rx_data = rxData['rx_data']
+                    if adj_prog_counter > gcode_lines_len:
+                        adj_prog_counter = gcode_lines_len
 
-                    if len(rx_data):
-                        if 'rx_data_info' in rxData:
-                            rx_data_info = rxData['rx_data_info']
-                            rx_data = "".join(
-                                [rx_data.strip(), " ", rx_data_info])
-                            rxData['rx_data'] = rx_data
-                except KeyError:
-                    pass
+                    prcnt = "{}/{} {:.2f}%".format(
+                        adj_prog_counter, gcode_lines_len,
+                        abs((float(adj_prog_counter)/float(gcode_lines_len) * 100)))
+                    stateData['prcnt'] = prcnt
 
-                    # notify listeners
-                    # self.notifyEventListeners(gc.EV_DATA_IN, rx_data)
+                if 'stat' in sr:
+                    self.machIfState = sr['stat']
 
-                if 'sr' in rxData:
-                    if len(self.gcodeDataLines):
-                        # at this point we haven't completed and added program counter
-                        # we need to +1, also array starts at 0 and gcode page starts at 1
-                        # nee another +1
-                        gcode_lines_len = len(self.gcodeDataLines)
-                        adj_prog_counter = self.workingProgramCounter + 2
+                if self.runTimeStart:
+                    runTimeNow = int(time.time())
+                    self.runTimeElapse = runTimeNow - self.runTimeStart
+                    stateData['rtime'] = self.runTimeElapse
 
-                        if adj_prog_counter > gcode_lines_len:
-                            adj_prog_counter = gcode_lines_len
+                    # if self.swState == gc.STATE_IDLE and self.machIfState in [
+                    #     "Idle", "idle", "Stop", "stop", "End", "end"]:
+                    #     self.runTimeStart = 0
 
-                        prcnt = "{}/{} {:.2f}%".format(
-                            adj_prog_counter, gcode_lines_len,
-                            abs((float(adj_prog_counter)/float(gcode_lines_len) * 100)))
-                        rxData['sr']['prcnt'] = prcnt
+            if r:
+                # firmware info
+                for info in [r, r.get('sys')]:
+                    if isinstance(info, dict):
+                        for key in ['fb', 'fv', 'machif']:
+                            if key in info:
+                                stateData[key] = info[key]
 
-                    if 'stat' in rxData['sr']:
-                        self.machIfState = rxData['sr']['stat']
+            # listeners only get what changed
+            changes = self.machineState.apply(sr, stateData)
 
-                    if self.runTimeStart:
-                        runTimeNow = int(time.time())
-                        self.runTimeElapse = runTimeNow - self.runTimeStart
-                        rxData['sr']['rtime'] = self.runTimeElapse
+            statusData = {}
 
-                        # if self.swState == gc.STATE_IDLE and self.machIfState in [
-                        #     "Idle", "idle", "Stop", "stop", "End", "end"]:
-                        #     self.runTimeStart = 0
+            rx_data = rxData.get('rx_data', "")
+            if len(rx_data):
+                if 'rx_data_info' in rxData:
+                    rx_data = "".join([rx_data.strip(), " ", rxData['rx_data_info']])
 
-                self.notify_event_listeners(gc.EV_DATA_STATUS, rxData)
+                statusData['rx_data'] = rx_data
+
+            if r:
+                statusData['r'] = r
+
+            if changes:
+                statusData.update(self.machineState.get_status_data(changes))
+
+            if statusData:
+                self.notify_event_listeners(gc.EV_DATA_STATUS, statusData)
 
             if 'tx_data' in rxData:
                 tx_data = rxData['tx_data']
@@ -561,6 +750,9 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
                     self.notify_event_listeners(gc.EV_DATA_STATUS, rxData['r'])
 
                 if 'init' in rxData['r']:
+                    # device (re)started, lines in flight are gone
+                    self.runStreamInFlight = []
+
                     # notify listeners
                     self.notify_event_listeners(gc.EV_DEVICE_DETECTED, rxData['r'])
                     self.do_init_script = True
@@ -586,12 +778,31 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
 
         return rxData
 
+    def get_perf_stats(self):
+        """ Snapshot of performance counters of this thread, the machine
+            interface and the serial thread
+        """
+        stats = self.perf.get_stats()
+        stats['queue'] = self.get_event_queue_stats()
+
+        coalescers = list(self.eventCoalescers.values())
+        stats['counters']['data_events_in'] = sum(c.eventsIn for c in coalescers)
+        stats['counters']['data_events_out'] = sum(c.eventsOut for c in coalescers)
+
+        perf_stats = {'exec': stats}
+
+        if self.machIfModule is not None:
+            perf_stats.update(self.machIfModule.getPerfStats())
+
+        return perf_stats
+
     def serial_write(self, serial_data):
         bytesSent = 0
 
         lines = serial_data.splitlines(True)
 
         for line in lines:
+            self.perf.incr('lines_written')
             bytes_sent = self.machIfModule.write(line)
 
             # sent data to UI
@@ -603,9 +814,50 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
 
         return bytesSent
 
+    def flush_event_coalescers(self, force=False):
+        """ Deliver coalesced data to listeners that are due, drop
+            coalescers of listeners that went away
+        """
+        for listener_id in list(self.eventCoalescers.keys()):
+            coalescer = self.eventCoalescers[listener_id]
+
+            if self._eventListeners.get(listener_id) is not coalescer.listener:
+                del self.eventCoalescers[listener_id]
+            else:
+                coalescer.flush(self, force)
+
+    def notify_event_listeners(self, event_id, data=None):
+        """ EV_DATA_STATUS and EV_DATA_OUT go through a coalescer per
+            listener (rate and queue depth limited), any other event first
+            flushes them so listeners see events in order
+        """
+        if event_id in [gc.EV_DATA_STATUS, gc.EV_DATA_OUT] and self.statusMaxRate:
+            for listener_id, listener in self._eventListeners.items():
+                coalescer = self.eventCoalescers.get(listener_id)
+
+                if coalescer is None or coalescer.listener is not listener:
+                    coalescer = gc.EventCoalescer(listener, self.statusMaxRate)
+                    self.eventCoalescers[listener_id] = coalescer
+
+                coalescer.add(event_id, data)
+                coalescer.flush(self)
+
+        else:
+            if self.eventCoalescers:
+                self.flush_event_coalescers(force=True)
+
+            gc.EventQueueIf.notify_event_listeners(self, event_id, data)
+
+    def on_config_changes(self, changes):
+        """ Machine config changed, called from the thread that made the
+            change
+        """
+        self.add_event(gc.EV_CMD_UPDATE_CONFIG, changes)
+
     def tick(self):
         self.machIfModule.tick()
         self.process_queue()
+        self.flush_event_coalescers()
 
         if self.do_init_script:
             # run user specified script
@@ -635,6 +887,11 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
             if self.endThread:
                 wait_for_acknowledge = False
 
+            if self.runStreamInFlight and ('r' in rxDataDict or 'err' in rxDataDict):
+                # ack of a line streamed before, keep waiting for ours
+                self.runStreamInFlight.pop(0)
+                continue
+
             if 'r' in rxDataDict:
                 if 'f' in rxDataDict:
                     if rxDataDict['f'][1] == 0:
@@ -694,18 +951,29 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
             if self.lastEventID == gc.EV_CMD_STOP:
                 waitForResponse = False
 
-            time.sleep(0.01)
+            if waitForResponse:
+                self.wait_for_io()
 
         return rxDataDict
 
-    def send_run_step_gcode(self, gcode_data):
+    def wait_for_io(self, timeout=EXEC_TICK_PERIOD):
+        """ Wait for serial data or new events, the machine interface wakes
+            us up as soon as data arrives
+        """
+        if self.machIfModule.hasPendingData():
+            return
+
+        wait_start = time.perf_counter()
+        self.wait_for_event(timeout)
+        self.perf.add_time('wait_for_io', time.perf_counter() - wait_start)
+
+    def send_run_step_gcode(self, gcode):
+        """ Send gcode, data is expected to be send ready (see GcodeProgram)
+        """
         write_to_device = True
         rc_error = False
-        gcode = gcode_data.strip()
 
         if len(gcode) > 0:
-            gcode = "%s\n" % (gcode)
-
             if self.machIfModule.okToSend(gcode):
                 # write data
                 self.serial_write(gcode)
@@ -722,6 +990,9 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
                 write_to_device = False
                 self.serial_read()
 
+                # wait for device to free up buffer space
+                self.wait_for_io()
+
         if write_to_device:
             if not rc_error:
                 self.workingProgramCounter += 1
@@ -739,8 +1010,12 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
         """
         error = False
 
+        if self.streamingEnable:
+            self.process_run_stream_sate()
+            return
+
         # check if we are done with gcode
-        if self.workingProgramCounter >= len(self.gcodeDataLines):
+        if self.workingProgramCounter >= len(self.gcodeProgram):
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
                 self.logger.info("reach last PC, moving to gc.STATE_IDLE")
 
@@ -773,34 +1048,23 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
             self.notify_event_listeners(gc.EV_SW_STATE, self.swState)
             return
 
-        # get gcode line
-        gcode = self.gcodeDataLines[self.workingProgramCounter]
-
         # check for msg line
-        reMsgSearch = gReGcodeMsg.search(gcode)
-        if (reMsgSearch is not None) and \
-           (self.workingProgramCounter != self.initialProgramCounter):
+        if (self.gcodeProgram.isMsg(self.workingProgramCounter) and
+           self.workingProgramCounter != self.initialProgramCounter):
+            msg = self.gcodeProgram.getMsg(self.workingProgramCounter)
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
                 self.logger.info("encounter MSG line PC[%s], "
                                  "moving to gc.STATE_BREAK, MSG[%s]" %
-                                 (self.workingProgramCounter,
-                                  reMsgSearch.group(1)))
+                                 (self.workingProgramCounter, msg))
 
             self.swState = gc.STATE_BREAK
 
             # notify listeners
-            self.notify_event_listeners(gc.EV_GCODE_MSG, reMsgSearch.group(1))
+            self.notify_event_listeners(gc.EV_GCODE_MSG, msg)
             return
 
-        # don't sent unnecessary data save the bits for speed
-        for reComments in gReGcodeComments:
-            gcode = reComments.sub("", gcode)
-
-        if self.filterGCodesEnable:
-            for filter in self.filterGCodesList:
-                if filter in gcode:
-                    gcode = ""
-                    break
+        # get send ready gcode line
+        gcode = self.gcodeProgram.getSendData(self.workingProgramCounter, self.filterGCodesEnable)
 
         # send g-code command
         error = self.send_run_step_gcode(gcode)
@@ -818,13 +1082,143 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
             self.notify_event_listeners(gc.EV_SW_STATE, self.swState)
             return
 
+    def track_device_lines(self, line_count, pc=None):
+        """ Record lines added to the device input buffer since it held
+            line_count lines, so their acks are matched to them and not
+            to program lines. pc for program lines, None for other lines
+        """
+        added = self.machIfModule.getInputBufferLineCount() - line_count
+
+        if added > 0:
+            self.runStreamInFlight.extend([pc] * added)
+
+    def process_run_stream_acks(self):
+        """ Process all pending responses and match acknowledges to lines
+            in flight, return True if any of the lines reported an error
+        """
+        rc_error = False
+
+        while self.swState != gc.STATE_ABORT and not self.endThread:
+            rxDataDict = self.serial_read()
+
+            if not rxDataDict:
+                break
+
+            if 'r' in rxDataDict or 'err' in rxDataDict:
+                pc = None
+                if self.runStreamInFlight:
+                    pc = self.runStreamInFlight.pop(0)
+
+                if ('err' in rxDataDict or
+                   ('f' in rxDataDict and rxDataDict['f'][1] != 0)):
+                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
+                        line = "?" if pc is None else pc + 1
+                        self.logger.info("acknowledgement state ERROR, PC[%s]" % line)
+
+                    # errors of user commands don't stop the program
+                    if pc is not None:
+                        rc_error = True
+
+        return rc_error
+
+    def process_run_stream_sate(self):
+        """ Process RUN state in streaming mode, character counting, send lines
+            as long as the device input buffer has room and match the
+            acknowledges as they arrive, stop sending at break points, MSG
+            lines and errors and change state once all lines in flight
+            are acknowledged
+        """
+        if self.process_run_stream_acks():
+            self.runStreamError = True
+
+        if self.swState != gc.STATE_RUN or self.endThread:
+            return
+
+        program = self.gcodeProgram
+        gcode_lines_len = len(program)
+
+        while not self.runStreamError and self.workingProgramCounter < gcode_lines_len:
+            pc = self.workingProgramCounter
+
+            # check for break point hit
+            if pc in self.breakPointSet and pc != self.initialProgramCounter:
+                break
+
+            # check for msg line
+            if program.isMsg(pc) and pc != self.initialProgramCounter:
+                break
+
+            gcode = program.getSendData(pc, self.filterGCodesEnable)
+
+            if len(gcode) > 0:
+                if not self.machIfModule.okToSend(gcode):
+                    break
+
+                line_count = self.machIfModule.getInputBufferLineCount()
+                self.serial_write(gcode)
+                self.track_device_lines(line_count, pc)
+
+            self.workingProgramCounter += 1
+
+        # wait for device to catch up before changing state
+        if self.runStreamInFlight:
+            return
+
+        if self.runStreamError:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
+                self.logger.info("error event, moving to gc.STATE_BREAK")
+
+            self.runStreamError = False
+            self.swState = gc.STATE_BREAK
+
+            # notify listeners
+            self.notify_event_listeners(gc.EV_BRK_PT_STOP)
+            self.notify_event_listeners(gc.EV_SW_STATE, self.swState)
+
+        elif self.workingProgramCounter >= gcode_lines_len:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
+                self.logger.info("reach last PC, moving to gc.STATE_IDLE")
+
+            self.swState = gc.STATE_IDLE
+
+            # notify listeners
+            self.notify_event_listeners(gc.EV_RUN_END)
+            self.notify_event_listeners(gc.EV_SW_STATE, self.swState)
+            self.runTimeStart = 0
+
+        elif (self.workingProgramCounter in self.breakPointSet and
+              self.workingProgramCounter != self.initialProgramCounter):
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
+                self.logger.info("encounter breakpoint PC[%d], "
+                                 "moving to gc.STATE_BREAK" %
+                                 (self.workingProgramCounter + 1))
+
+            self.swState = gc.STATE_BREAK
+
+            # notify listeners
+            self.notify_event_listeners(gc.EV_BRK_PT_STOP)
+            self.notify_event_listeners(gc.EV_SW_STATE, self.swState)
+
+        elif (program.isMsg(self.workingProgramCounter) and
+              self.workingProgramCounter != self.initialProgramCounter):
+            msg = program.getMsg(self.workingProgramCounter)
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
+                self.logger.info("encounter MSG line PC[%s], "
+                                 "moving to gc.STATE_BREAK, MSG[%s]" %
+                                 (self.workingProgramCounter, msg))
+
+            self.swState = gc.STATE_BREAK
+
+            # notify listeners
+            self.notify_event_listeners(gc.EV_GCODE_MSG, msg)
+
     def process_step_sate(self):
         """ Process STEP state and update counters or end state
         """
         error = False
 
         # check if we are done with gcode
-        if self.workingProgramCounter >= len(self.gcodeDataLines):
+        if self.workingProgramCounter >= len(self.gcodeProgram):
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
                 self.logger.info("reach last PC, moving to gc.STATE_IDLE")
 
@@ -837,7 +1231,9 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
 
         # update PC
         # self.notifyEventListeners(gc.EV_PC_UPDATE, self.workingProgramCounter)
-        self.notify_event_listeners(gc.EV_DATA_STATUS, {'pc': self.workingProgramCounter})
+        changes = self.machineState.apply({'pc': self.workingProgramCounter})
+        if changes:
+            self.notify_event_listeners(gc.EV_DATA_STATUS, self.machineState.get_status_data(changes))
 
         # end move to IDLE state
         if self.workingProgramCounter > self.initialProgramCounter:
@@ -851,11 +1247,7 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
             self.notify_event_listeners(gc.EV_SW_STATE, self.swState)
             return
 
-        gcode = self.gcodeDataLines[self.workingProgramCounter]
-
-        # don't sent unnecessary data save the bits for speed
-        for reComments in gReGcodeComments:
-            gcode = reComments.sub("", gcode)
+        gcode = self.gcodeProgram.getSendData(self.workingProgramCounter)
 
         error = self.send_run_step_gcode(gcode)
 
@@ -870,19 +1262,30 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
             return
 
     def process_idle_sate(self):
-        self.serial_read()
+        if self.runStreamInFlight:
+            # lines streamed before PAUSE, STOP or BREAK still ack
+            self.process_run_stream_acks()
+        else:
+            self.serial_read()
 
     def process_serial_write_queue(self):
-        if self.serialWriteQueue:
+        while self.serialWriteQueue and not self.endThread:
 
             data = self.serialWriteQueue[0]
 
-            if self.machIfModule.okToSend(data[0]):
-                self.serialWriteQueue.pop(0)
-                self.serial_write(data[0])
+            if not self.machIfModule.okToSend(data[0]):
+                break
 
-                if data[1]:
-                    self.wait_for_acknowledge()
+            self.serialWriteQueue.pop(0)
+
+            if data[1]:
+                self.serial_write(data[0])
+                self.wait_for_acknowledge()
+            else:
+                # ack may come while other lines are in flight
+                line_count = self.machIfModule.getInputBufferLineCount()
+                self.serial_write(data[0])
+                self.track_device_lines(line_count)
 
     def run_device_init_script(self):
         init_script_en = gc.CONFIG_DATA.get('/machine/InitScriptEnable')
@@ -923,7 +1326,7 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
         self.machIfModule.open()
 
         # initial report of GCode MD5
-        h = hashlib.md5(str(self.gcodeDataLines).encode('utf-8')).hexdigest()
+        h = self.gcodeDigest.digest
         self.notify_event_listeners(gc.EV_GCODE_MD5, h)
 
         while not self.endThread:
@@ -957,10 +1360,17 @@ class MachIfExecuteThread(threading.Thread, gc.EventQueueIf):
                 self.process_idle_sate()
                 self.swState = gc.STATE_IDLE
 
-            time.sleep(0.010)
+            # RUN (send and wait ack) and STEP wait for the device on their
+            # own, other states wait for serial data or events
+            if not (self.swState == gc.STATE_STEP or
+                    (self.swState == gc.STATE_RUN and not self.streamingEnable)):
+                self.wait_for_io()
 
         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_MACHIF_EXEC:
+            self.logger.info("event queue stats {}".format(self.get_event_queue_stats()))
             self.logger.info("thread exit")
 
+        self.configData.unsubscribe(self.on_config_changes)
+
         # notify listeners
         self.notify_event_listeners(gc.EV_EXIT)
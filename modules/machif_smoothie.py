@@ -23,7 +23,6 @@
 
 ----------------------------------------------------------------------------"""
 
-import datetime as dt
 import re
 
 import modules.config as gc
@@ -122,8 +121,9 @@ class MachIf_Smoothie(mi.MachIf_Base):
         self._inputBufferPart = list()
 
         self.currentStatus = SMOOTHIE_STATE_UNKNOWN
-        self.autoStatusNextMicro = None
-        self.machineAutoRefreshPeriod = 200
+
+        # smoothie only reports status when asked
+        self.statusPollEnable = True
 
         # list of commands
         self.cmdStatus = '?'
@@ -139,7 +139,7 @@ class MachIf_Smoothie(mi.MachIf_Base):
         """
         super(MachIf_Smoothie, self)._reset(BUFFER_MAX_SIZE,
                                             BUFFER_INIT_VAL, BUFFER_WATERMARK_PRCNT)
-        self.inputBufferPart = list()
+        self._inputBufferPart = list()
 
     def decode(self, data):
         dataDict = {}
@@ -186,13 +186,14 @@ class MachIf_Smoothie(mi.MachIf_Base):
             # check on status change
             decodedStatus = self.stat_dict.get(
                 statusData[0], SMOOTHIE_STATE_UNKNOWN)
-            if self.currentStatus != decodedStatus:
-                if decodedStatus in [SMOOTHIE_STATE_RUN, SMOOTHIE_STATE_JOG]:
-                    self.autoStatusNextMicro = dt.datetime.now() + \
-                        dt.timedelta(
-                            microseconds=self.machineAutoRefreshPeriod * 1000)
+            self.currentStatus = decodedStatus
 
-                self.currentStatus = decodedStatus
+            if decodedStatus in [SMOOTHIE_STATE_JOG, SMOOTHIE_STATE_HOME]:
+                self.statusPollReport(mi.STATUS_POLL_FAST, len(data))
+            elif decodedStatus == SMOOTHIE_STATE_RUN:
+                self.statusPollReport(mi.STATUS_POLL_RUN, len(data))
+            else:
+                self.statusPollReport(mi.STATUS_POLL_STOP, len(data))
 
         ack = self.reSmoothieMachineAck.search(data)
         if ack is not None:
@@ -316,56 +317,17 @@ class MachIf_Smoothie(mi.MachIf_Base):
     def factory(self):
         return MachIf_Smoothie()
 
-    def init(self):
-        super(MachIf_Smoothie, self).init()
-        self.machineAutoRefreshPeriod = gc.CONFIG_DATA.get(
-            '/machine/MachIfSpecific/%s/AutoRefreshPeriod/Value' % self.name)
-
-    def tick(self):
-        # check if is time for auto-refresh and send get status cmd and prepare next refresh time
-        if (self.autoStatusNextMicro is not None) and (
-           self.currentStatus in [SMOOTHIE_STATE_RUN, SMOOTHIE_STATE_JOG]):
-            tnow = dt.datetime.now()
-            tnowMilli = tnow.second*1000 + tnow.microsecond/1000
-            tdeltaMilli = self.autoStatusNextMicro.second * \
-                1000 + self.autoStatusNextMicro.microsecond/1000
-            if (tnowMilli - tdeltaMilli) >= 0:
-                if self.okToSend(self.cmdStatus):
-                    super(MachIf_Smoothie, self).write(self.cmdStatus)
-
-                self.autoStatusNextMicro = dt.datetime.now() + \
-                    dt.timedelta(
-                        microseconds=self.machineAutoRefreshPeriod * 1000)
-
-        elif self.autoStatusNextMicro is not None and self.currentStatus not in [SMOOTHIE_STATE_RUN, SMOOTHIE_STATE_JOG]:
-            self.autoStatusNextMicro = None
-
-        if self.machineAutoRefreshPeriod != gc.CONFIG_DATA.get(
-                '/machine/MachIfSpecific/%s/AutoRefreshPeriod/Value'
-                % self.name):
-            self.machineAutoRefreshPeriod = gc.CONFIG_DATA.get(
-                '/machine/MachIfSpecific/%s/AutoRefreshPeriod/Value'
-                % self.name)
+    def getRealTimeCmds(self):
+        # status query is a real-time command
+        return super(MachIf_Smoothie, self).getRealTimeCmds() + [self.cmdStatus]
 
     def write(self, txData, raw_write=False):
-        askForStatus = False
-        bytesSent = 0
+        bytesSent = super(MachIf_Smoothie, self).write(txData, raw_write)
 
         # moving to active state get at least one status msg
         if self.currentStatus in [SMOOTHIE_STATE_IDLE, SMOOTHIE_STATE_STOP,
                                   SMOOTHIE_STATE_HOME, SMOOTHIE_STATE_SLEEP,
-                                  SMOOTHIE_STATE_HOLD]:
-            askForStatus = True
-
-        bytesSent = super(MachIf_Smoothie, self).write(txData, raw_write)
-
-        if askForStatus:
-            if self.okToSend(self.cmdStatus):
-                super(MachIf_Smoothie, self).write(self.cmdStatus)
-                super(MachIf_Smoothie, self).write(self.cmdStatus)
-
-            self.autoStatusNextMicro = dt.datetime.now() + \
-                dt.timedelta(
-                    microseconds=self.machineAutoRefreshPeriod * 1000)
+                                  SMOOTHIE_STATE_HOLD] and txData != self.cmdStatus:
+            self.statusPollKick()
 
         return bytesSent
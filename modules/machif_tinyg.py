@@ -23,10 +23,10 @@
 
 ----------------------------------------------------------------------------"""
 import re
-import json
 
 import modules.config as gc
 import modules.machif as mi
+import modules.machif_json as mi_json
 
 
 """ Global values for this module
@@ -262,6 +262,9 @@ class MachIf_TinyG(mi.MachIf_Base):
 
         self._inputBufferPart = list()
 
+        # JSON fast path
+        self.jsonDecoder = mi_json.JsonResponseDecoder()
+
         # list of commands
         self.cmdClearAlarm = '{"clear":true}\n'
         self.cmdInitComm = '{"sys":null}\n'
@@ -286,7 +289,7 @@ class MachIf_TinyG(mi.MachIf_Base):
         dataDict = {}
 
         try:
-            dataDict = json.loads(data)
+            dataDict = self.jsonDecoder.loads(data)
 
             if 'r' in dataDict:
                 r = dataDict['r']
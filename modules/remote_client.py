@@ -26,13 +26,14 @@ import threading
 import logging
 import socket
 import select
-import time
 import errno
-import queue
-import pickle
 
 import modules.config as gc
 
+# G-code chunks outlive connections, after reconnecting only chunks that
+# changed on either side are transferred
+gcode_chunk_cache = gc.GcodeChunkCache()
+
 
 class RemoteClientThread(threading.Thread, gc.EventQueueIf):
     """
@@ -88,8 +89,32 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
 
         self.rxBuffer = b""
         self.rxBufferLen = 0
+        self.rxHeader = b""
+        self.rxClosed = False
         self.allMsgLenRecv = 0
 
+        # server wire format version, pickle only until server sends binary
+        self.wireVersion = 0
+
+        # server takes compressed messages, compress from this size up
+        self.serverCompress = False
+        self.compressMinSize = gc.CONFIG_DATA.get('/remote/CompressMinSize', gc.REMOTE_COMPRESS_MIN_SIZE)
+        self.perf = gc.PerfCounters("remote_client")
+
+        # G-code chunks the server has, None if server only handles whole
+        # G-code, and G-code waiting for chunks from server
+        self.gcodeDigest = gc.GcodeDigest()
+        self.gcodeChunkCache = gcode_chunk_cache
+        self.serverGcodeChunks = None
+        self.gcodePending = None
+        self.gcodeSent = None
+
+        # wait on sockets and wakeup socket for new events
+        self.wakeupSocRead, self.wakeupSocWrite = socket.socketpair()
+        self.wakeupSocRead.setblocking(0)
+        self.wakeupSocWrite.setblocking(0)
+        self.wakeupPending = False
+
         self.swState = gc.STATE_RUN
 
         self.logger = logging.getLogger()
@@ -109,38 +134,115 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
 
         """
         # process events from queue
-        try:
-            e = self._eventQueue.get_nowait()
-        except queue.Empty:
-            pass
+        for e in self.get_events():
+            self.process_event(e)
+
+            if self.endThread:
+                break
+
+    def process_event(self, e):
+        """
+        Handle single event
+
+        """
+        if e.event_id == gc.EV_HELLO:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_HELLO from 0x{:x} {}".format(id(e.sender), e.sender))
+
+            self.add_event_listener(e.sender)
+
+        elif e.event_id == gc.EV_GOOD_BYE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_GOOD_BYE from 0x{:x} {}".format(id(e.sender), e.sender))
+
+            self.remove_event_listener(e.sender)
+
+        elif e.event_id == gc.EV_CMD_EXIT:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_EXIT")
+
+            self.close()
+
+            self.endThread = True
+
         else:
-            if e.event_id == gc.EV_HELLO:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_HELLO from 0x{:x} {}".format(id(e.sender), e.sender))
+            # if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+            # self.logger.error("EV_?? got unknown event!! from 0x{:x} {}".format(id(e.sender), e.sender))
+
+            # commands that we don't handle forward to server
+            e.sender = id(e.sender)
+
+            if e.event_id in [gc.EV_CMD_RUN, gc.EV_CMD_STEP] and self.serverGcodeChunks is not None and \
+               isinstance(e.data, dict) and 'gcodeLines' in e.data:
+                # only send chunks server doesn't have, keep whole program in
+                # case server asks for chunks we no longer have
+                self.gcodeSent = gc.SimpleEvent(e.event_id, e.data, e.sender)
+                e = gc.SimpleEvent(
+                    e.event_id, self.gcodeChunkCache.pack(e.data, self.gcodeDigest, self.serverGcodeChunks), e.sender)
 
-                self.add_event_listener(e.sender)
+            self.send(self.socServer, e)
 
-            elif e.event_id == gc.EV_GOOD_BYE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_GOOD_BYE from 0x{:x} {}".format(id(e.sender), e.sender))
+    def process_server_event(self, e):
+        """
+        Handle protocol events from server, return event to forward to
+        listeners or None. Raises ValueError on malformed G-code chunks
+
+        """
+        if e.event_id == gc.EV_RMT_HELLO and isinstance(e.data, dict):
+            # server reply to our hello, what it handles
+            if e.data.get('gcodeChunks', False):
+                self.serverGcodeChunks = set()
+
+            self.serverCompress = bool(e.data.get('zlib', False))
+
+            return None
+
+        elif e.event_id == gc.EV_PERF_STATS and isinstance(e.data, dict):
+            e.data['remote_client'] = self.perf.get_stats()
 
-                self.remove_event_listener(e.sender)
+        elif e.event_id == gc.EV_GCODE and isinstance(e.data, dict) and 'gcodeChunks' in e.data:
+            gcode_dict, missing = self.gcodeChunkCache.unpack(e.data, self.serverGcodeChunks)
 
-            elif e.event_id == gc.EV_CMD_EXIT:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_CMD_EXIT")
+            if gcode_dict is None:
+                # hold on to G-code until server sends missing chunks
+                self.gcodePending = e
+                self.send(self.socServer, gc.SimpleEvent(gc.EV_CMD_GET_GCODE_CHUNKS, missing, id(self)))
+                return None
 
-                self.close()
+            e.data = gcode_dict
 
-                self.endThread = True
+        elif e.event_id == gc.EV_GCODE:
+            # whole program, replaces one waiting for chunks
+            self.gcodePending = None
 
+        elif e.event_id == gc.EV_CMD_GET_GCODE_CHUNKS:
+            # server doesn't have all chunks we thought it had
+            chunk_data, missing = self.gcodeChunkCache.get_chunk_data(e.data)
+
+            if missing and self.gcodeSent is not None:
+                # chunks are gone (program changed meanwhile), send whole program
+                self.send(self.socServer, self.gcodeSent)
             else:
-                # if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                # self.logger.error("EV_?? got unknown event!! from 0x{:x} {}".format(id(e.sender), e.sender))
+                self.send(self.socServer, gc.SimpleEvent(gc.EV_GCODE_CHUNKS, chunk_data, id(self)))
+
+            return None
+
+        elif e.event_id == gc.EV_GCODE_CHUNKS:
+            self.gcodeChunkCache.add_chunk_data(e.data)
+
+            e = self.gcodePending
+            self.gcodePending = None
+
+            if e is not None:
+                gcode_dict, missing = self.gcodeChunkCache.unpack(e.data, self.serverGcodeChunks)
 
-                # commands that we don't handle forward to server
-                e.sender = id(e.sender)
-                self.send(self.socServer, e)
+                if gcode_dict is None:
+                    self.logger.error("Dropped EV_GCODE, missing {} G-code chunk(s)".format(len(missing)))
+                    return None
+
+                e.data = gcode_dict
+
+        return e
 
     def get_hostname(self):
         """
@@ -202,6 +304,10 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
                 self.socServer.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, 3)
 
             self.socServer.connect((self.host, self.tcpPort))
+            self.rxBuffer = b""
+            self.rxBufferLen = 0
+            self.rxHeader = b""
+            self.rxClosed = False
             self.inputs.append(self.socServer)
             self.inputsAddr[self.socServer] = self.socServer.getpeername()
 
@@ -243,29 +349,78 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
         else:
             msg = "Open remote connection to {}{}\n".format(self.host, self.inputsAddr[self.socServer])
 
+            # tell server which wire format we understand
+            self.wireVersion = 0
+            self.serverGcodeChunks = None
+            self.gcodePending = None
+            self.gcodeSent = None
+            self.serverCompress = False
+            hello = {'wire': gc.REMOTE_WIRE_VERSION, 'gcodeChunks': True, 'zlib': True}
+            self.send(self.socServer, gc.SimpleEvent(gc.EV_RMT_HELLO, hello, id(self)))
+
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_CLIENT:
                 self.logger.info(msg.strip())
 
             # sending directly to who created us
             self.notify_event_listeners(gc.EV_RMT_PORT_OPEN, msg)
 
+    def decode(self, msg):
+        """
+        Decode message, None if it is malformed
+
+        """
+        try:
+            raw_msg = gc.remote_msg_decompress(msg)
+
+            self.perf.incr('rx_msgs')
+            self.perf.incr('rx_bytes', len(msg))
+            self.perf.incr('rx_raw_bytes', len(raw_msg))
+
+            data = gc.remote_msg_decode(raw_msg)
+
+        except ValueError as e:
+            self.logger.error("Dropped malformed msg len:{} err:{}".format(len(msg), str(e)))
+            return None
+
+        version = gc.get_remote_msg_version(raw_msg)
+        if version > self.wireVersion:
+            # server speaks binary, use it from now on
+            self.wireVersion = version
+
+        return data
+
     def recv(self, soc):
         exFlag = False
         exMsg = ""
         data = None
 
         try:
-            if not len(self.rxBuffer):
-                msg_header = soc.recv(gc.SOCK_HEADER_SIZE)
-                msg_len = 0
+            if self.rxBufferLen <= 0:
+                # header may arrive in pieces when server writes are partial
+                msg_header = soc.recv(gc.SOCK_HEADER_SIZE - len(self.rxHeader))
+
+                if not len(msg_header):
+                    self.rxClosed = True
+
+                self.rxHeader += msg_header
 
-                if len(msg_header):
-                    msg_len = int(msg_header.decode('utf-8'))
+                if len(self.rxHeader) == gc.SOCK_HEADER_SIZE:
+                    msg_len = int(self.rxHeader.decode('utf-8'))
+
+                    if msg_len <= 0 or msg_len > gc.REMOTE_MSG_MAX_SIZE:
+                        raise ValueError("bad msg len {}".format(msg_len))
+
+                    self.rxHeader = b""
                     self.rxBufferLen = msg_len
                     self.allMsgLenRecv += msg_len
 
             msg = b""
-            msg = soc.recv(self.rxBufferLen)
+
+            if self.rxBufferLen > 0:
+                msg = soc.recv(self.rxBufferLen)
+
+                if not len(msg):
+                    self.rxClosed = True
 
             if len(msg):
                 self.rxBufferLen -= len(msg)
@@ -273,9 +428,9 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
 
                 if self.rxBufferLen <= 0:
                     # got the entire message decode it
-                    data = pickle.loads(self.rxBuffer)
+                    data = self.decode(self.rxBuffer)
 
-                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_CLIENT:
+                    if data is not None and gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_CLIENT:
                         log_msg =  "Recv msg id:{} obj:0x{:x} len:{} from {} ".format(
                             data.event_id, id(data), len(self.rxBuffer), self.inputsAddr[soc])
 
@@ -315,6 +470,11 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
             exMsg = "** socket.error exception: {}\n".format(str(e))
             exFlag = True
 
+        except ValueError as e:
+            # stream is out of sync, no way to find next header
+            exMsg = "** Bad msg header: {}\n".format(str(e))
+            exFlag = True
+
         # except:
         #     e = sys.exc_info()[0]
         #     exMsg = "** Unexpected exception: {}\n".format(str(e))
@@ -323,6 +483,7 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
         if exFlag:
             # make sure we stop processing any states...
             # self.swState = gc.STATE_ABORT
+            self.rxClosed = True
 
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_CLIENT:
                 self.logger.error(exMsg.strip())
@@ -351,9 +512,9 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
 
             if len(msg):
                 # got the entire message decode
-                data = pickle.loads(msg)
+                data = self.decode(msg)
 
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_CLIENT:
+                if data is not None and gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_CLIENT:
                     log_msg = "Recv msg id:{} obj:0x{:x} len:{} from {} ".format(
                         data.event_id, id(data), len(msg), from_data)
 
@@ -413,10 +574,22 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
         exFlag = False
         exMsg = ""
 
-        pickle_data = pickle.dumps(data, protocol=5)
-        msg_len = len(pickle_data)
+        msg_data = gc.remote_msg_encode(data, self.wireVersion)
+        raw_len = len(msg_data)
+
+        if self.serverCompress:
+            msg_data = gc.remote_msg_compress(msg_data, self.compressMinSize)
+
+        msg_len = len(msg_data)
+
+        self.perf.incr('tx_msgs')
+        self.perf.incr('tx_bytes', msg_len)
+        self.perf.incr('tx_raw_bytes', raw_len)
+
+        if msg_len != raw_len:
+            self.perf.incr('tx_compressed_msgs')
         msg = "{:{header_size}}".format(msg_len, header_size=gc.SOCK_HEADER_SIZE).encode('utf-8')
-        msg += pickle_data
+        msg += msg_data
         data_len = len(msg)
         data_sent_len = 0
 
@@ -457,13 +630,13 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
                 data.event_id, id(data), msg_len, self.inputsAddr[soc])
 
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_HEX_DUMP:
-                log_msg = log_msg + gc.verbose_hex_dump("", pickle_data)
+                log_msg = log_msg + gc.verbose_hex_dump("", msg_data)
 
             elif gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_HEX:
-                log_msg = log_msg + gc.verbose_data_hex("", pickle_data)
+                log_msg = log_msg + gc.verbose_data_hex("", msg_data)
 
             elif (gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_STR):
-                log_msg = log_msg + gc.verbose_data_ascii("", pickle_data)
+                log_msg = log_msg + gc.verbose_data_ascii("", msg_data)
 
             self.logger.info(log_msg)
 
@@ -478,6 +651,48 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
             # self.notifyEventListeners(gc.EV_ABORT, exMsg)
             # self.close()
 
+    def wait_for_io(self, inputs, outputs, exceptional):
+        """
+        Wait for socket I/O or new events
+
+        """
+        timeout = gc.EVENT_QUEUE_WAIT_TIMEOUT
+
+        if not self._eventQueue.empty():
+            timeout = 0
+
+        readable, writable, exceptional = select.select(
+            inputs + [self.wakeupSocRead], outputs, exceptional, timeout)
+
+        if self.wakeupSocRead in readable:
+            readable.remove(self.wakeupSocRead)
+
+            try:
+                while self.wakeupSocRead.recv(512):
+                    pass
+            except OSError:
+                pass
+
+            # clear after draining and before handling the queue, a wakeup()
+            # from now on sends again and new events wake us
+            self.wakeupPending = False
+
+        return readable, writable, exceptional
+
+    def wakeup(self):
+        """
+        Wake up thread waiting on sockets
+
+        """
+        if not self.wakeupPending:
+            self.wakeupPending = True
+
+            try:
+                self.wakeupSocWrite.send(b'\0')
+            except OSError:
+                # buffer full (thread already awake) or closed
+                pass
+
     def run(self):
         """
         Run Worker Thread.
@@ -502,15 +717,32 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
 
             if len(self.inputs):
                 if self.swState == gc.STATE_RUN:
-                    readable, writable, exceptional = select.select(self.inputs, self.outputs, self.inputs, 0)
+                    wait_inputs = list(self.inputs)
+                    if self.useUdpBroadcast and self.socBroadcast is not None:
+                        wait_inputs.append(self.socBroadcast)
+
+                    readable, writable, exceptional = self.wait_for_io(wait_inputs, self.outputs, self.inputs)
+
+                    udp_readable = False
+                    if self.socBroadcast is not None and self.socBroadcast in readable:
+                        readable.remove(self.socBroadcast)
+                        udp_readable = True
 
                     for soc in readable:
                         data = self.recv(soc)
                         if data:
-                            data.sender = self
-                            self.notify_event_listeners(data)
+                            try:
+                                data = self.process_server_event(data)
+                            except ValueError as e:
+                                # malformed G-code chunks from server
+                                self.logger.error("Dropped EV_[{}], {}".format(data.event_id, str(e)))
+                                data = None
+
+                            if data is not None:
+                                data.sender = self
+                                self.notify_event_listeners(data)
                         else:
-                            if not self.rxBufferLen:
+                            if self.rxClosed:
                                 msg = "Connection reset by peer, server {}{}\n".format(
                                     self.host, self.inputsAddr[self.socServer]
                                 )
@@ -526,10 +758,7 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
                         pass
 
                     if self.useUdpBroadcast:
-                        udp_readable, udp_writable, udp_exceptional = select.select(
-                            [self.socBroadcast], self.outputs, self.inputs, 0)
-
-                        if len(udp_readable):
+                        if udp_readable:
                             data = self.recv_from()
                             if data:
                                 data.sender = self
@@ -557,7 +786,7 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
 
                 elif self.swState == gc.STATE_ABORT:
                     # do nothing, wait to be terminated
-                    pass
+                    self.wait_for_io([], [], [])
                 else:
                     exMsg = "Unexpected state [%d], Aborting..." \
                             % (self.swState)
@@ -580,11 +809,13 @@ class RemoteClientThread(threading.Thread, gc.EventQueueIf):
                 self.notify_event_listeners(gc.EV_ABORT, message)
                 break
 
-            time.sleep(0.010)
-
         # exit thread
         self.close()
+        self.wakeupSocRead.close()
+        self.wakeupSocWrite.close()
+
         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_CLIENT:
+            self.logger.info("event queue stats {}".format(self.get_event_queue_stats()))
             self.logger.info("thread exit")
 
         self.notify_event_listeners(gc.EV_EXIT, "")
@@ -25,14 +25,13 @@
 import os
 import sys
 import threading
-import time
 import logging
 import socket
 import select
 import errno
 import re
 import queue
-import pickle
+from collections import deque
 
 import modules.config as gc
 import modules.machif_progexec as mi_progexec
@@ -40,6 +39,65 @@ import modules.machif_progexec as mi_progexec
 import modules.version_info as vinfo
 
 
+class RemoteClientQueue(object):
+    """
+    Outbound messages of one client, written as the client socket takes
+    them. Looks like an event listener (add_event, get_event_queue_depth)
+    to its EventCoalescer, which holds status back while messages are
+    waiting. Also holds the client's partially received message.
+
+    """
+
+    def __init__(self, server, soc):
+        self.server = server
+        self.soc = soc
+        self.frames = deque()
+        self.frameOffset = 0
+        self.byteCount = 0
+        self.coalescer = gc.EventCoalescer(self, 0)
+        self.rxHeader = b""
+        self.rxBuffer = b""
+        self.rxBufferLen = 0
+        self.rxClosed = False
+
+    def add_event(self, event_id, data=None, sender=None):
+        self.server.send(self.soc, gc.SimpleEvent(event_id, data, sender))
+
+    def get_event_queue_depth(self):
+        return len(self.frames)
+
+    def get_stats(self):
+        stats = {
+            'frames': len(self.frames),
+            'bytes': self.byteCount,
+            'coalesced': self.coalescer.eventsIn - self.coalescer.eventsOut,
+        }
+
+        return stats
+
+    def put(self, frame):
+        self.frames.append(frame)
+        self.byteCount += len(frame)
+
+    def write(self):
+        """
+        Write frames until socket is full, raises OSError (EAGAIN when
+        full)
+
+        """
+        while self.frames:
+            frame = self.frames[0]
+            sent = self.soc.send(memoryview(frame)[self.frameOffset:])
+            self.frameOffset += sent
+            self.byteCount -= sent
+
+            if self.frameOffset < len(frame):
+                break
+
+            self.frames.popleft()
+            self.frameOffset = 0
+
+
 class RemoteServerThread(threading.Thread, gc.EventQueueIf):
     """
     Threads to send and monitor network socket for new data.
@@ -70,12 +128,35 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
         self.deviceDetected = False
         self.useUdpBroadcast = gc.CONFIG_DATA.get('/remote/UdpBroadcast', False)
 
-        self.rxBuffer = b""
-        self.rxBufferLen = 0
         self.allMsgLenRecv = 0
 
+        # wire format version per client, 0 (pickle) until client says hello
+        self.clientWireVersion = {}
+
+        # clients that take compressed messages, compress from this size up
+        self.clientCompress = {}
+        self.compressMinSize = gc.CONFIG_DATA.get('/remote/CompressMinSize', gc.REMOTE_COMPRESS_MIN_SIZE)
+        self.perf = gc.PerfCounters("remote")
+
+        # frames encoded while a broadcast is sent, shared by clients that
+        # take the same format
+        self.broadcastFrames = None
+
+        # G-code chunks each client has (only clients that handle chunked
+        # G-code), and run/step requests waiting for chunks from a client
+        self.gcodeDigest = gc.GcodeDigest()
+        self.gcodeChunkCache = gc.GcodeChunkCache()
+        self.clientGcodeChunks = {}
+        self.clientGcodePending = {}
+
         self.clientEventQueue = gc.EventQueueIf()
 
+        # wait on sockets and wakeup socket for new events
+        self.wakeupSocRead, self.wakeupSocWrite = socket.socketpair()
+        self.wakeupSocRead.setblocking(0)
+        self.wakeupSocWrite.setblocking(0)
+        self.wakeupPending = False
+
         self.swState = gc.STATE_RUN
 
         self.logger = logging.getLogger()
@@ -95,217 +176,356 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
 
         """
         # process events from queue
-        try:
-            e = self._eventQueue.get_nowait()
-        except queue.Empty:
-            pass
-        else:
-            # this message came from progexec tread
-            if e.sender is self.machifProgExec:
+        for e in self.get_events():
+            self.process_event(e)
 
-                if e.event_id in [gc.EV_DATA_STATUS, gc.EV_DATA_OUT, gc.EV_DATA_IN]:
-                    # these are the most common events from prog exe, process first
-                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                        self.logger.info("EV_DATA_* {} from 0x{:x} {}".format(e.event_id, id(e.sender), e.sender))
+            if self.endThread:
+                break
 
-                    e.sender = id(self)
-                    self.send_broadcast(e)
+    def process_event(self, e):
+        """
+        Handle single event
 
-                elif e.event_id == gc.EV_SER_PORT_OPEN:
-                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                        self.logger.info("EV_SER_PORT_OPEN from 0x{:x} {}".format(id(e.sender), e.sender))
+        """
+        # this message came from progexec tread
+        if e.sender is self.machifProgExec:
 
-                    self.serialPortIsOpen = True
-                    e.sender = id(self)
-                    self.send_broadcast(e)
+            if e.event_id in [gc.EV_DATA_STATUS, gc.EV_DATA_OUT, gc.EV_DATA_IN]:
+                # these are the most common events from prog exe, process first
+                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                    self.logger.info("EV_DATA_* {} from 0x{:x} {}".format(e.event_id, id(e.sender), e.sender))
 
-                elif e.event_id == gc.EV_SER_PORT_CLOSE:
-                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                        self.logger.info("EV_SER_PORT_CLOSE from 0x{:x} {}".format(id(e.sender), e.sender))
+                e.sender = id(self)
+                self.send_broadcast(e)
 
-                    self.serialPortIsOpen = False
-                    e.sender = id(self)
-                    self.send_broadcast(e)
+            elif e.event_id == gc.EV_SER_PORT_OPEN:
+                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                    self.logger.info("EV_SER_PORT_OPEN from 0x{:x} {}".format(id(e.sender), e.sender))
 
-                elif e.event_id == gc.EV_CMD_EXIT:
-                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                        self.logger.info("EV_CMD_EXIT from 0x{:x} {}".format(id(e.sender), e.sender))
+                self.serialPortIsOpen = True
+                e.sender = id(self)
+                self.send_broadcast(e)
 
-                    self.machifProgExec = None
+            elif e.event_id == gc.EV_SER_PORT_CLOSE:
+                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                    self.logger.info("EV_SER_PORT_CLOSE from 0x{:x} {}".format(id(e.sender), e.sender))
 
-                elif e.event_id == gc.EV_ABORT:
-                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                        self.logger.info("EV_ABORT from 0x{:x} {}".format(id(e.sender), e.sender))
+                self.serialPortIsOpen = False
+                e.sender = id(self)
+                self.send_broadcast(e)
 
-                    if self.machifProgExec is not None:
-                        self.machifProgExec.add_event(gc.EV_CMD_EXIT)
+            elif e.event_id == gc.EV_CMD_EXIT:
+                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                    self.logger.info("EV_CMD_EXIT from 0x{:x} {}".format(id(e.sender), e.sender))
 
-                    e.sender = id(self)
-                    e.event_id = gc.EV_DATA_IN
-                    e.data = "remote machifProgExec {}".format(e.data)
-                    self.send_broadcast(e)
+                self.machifProgExec = None
 
-                elif e.event_id == gc.EV_DEVICE_DETECTED:
-                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                        self.logger.info("EV_DEVICE_DETECTED from 0x{:x} {}".format(id(e.sender), e.sender))
+            elif e.event_id == gc.EV_ABORT:
+                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                    self.logger.info("EV_ABORT from 0x{:x} {}".format(id(e.sender), e.sender))
 
-                    self.deviceDetected = True
+                if self.machifProgExec is not None:
+                    self.machifProgExec.add_event(gc.EV_CMD_EXIT)
 
-                    # This will be done by progexec thread where it belongs
-                    # self.run_device_init_script()
+                e.sender = id(self)
+                e.event_id = gc.EV_DATA_IN
+                e.data = "remote machifProgExec {}".format(e.data)
+                self.send_broadcast(e)
 
-                    e.sender = id(self)
-                    self.send_broadcast(e)
+            elif e.event_id == gc.EV_DEVICE_DETECTED:
+                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                    self.logger.info("EV_DEVICE_DETECTED from 0x{:x} {}".format(id(e.sender), e.sender))
 
-                else:
-                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                        self.logger.info("EV_[{}] from 0x{:x} {}".format(e.event_id, id(e.sender), e.sender))
+                self.deviceDetected = True
 
-                    e.sender = id(self)
-                    self.send_broadcast(e)
+                # This will be done by progexec thread where it belongs
+                # self.run_device_init_script()
 
-            # local/non-machine messaging
-            elif e.event_id == gc.EV_HELLO:
+                e.sender = id(self)
+                self.send_broadcast(e)
+
+            elif e.event_id == gc.EV_PERF_STATS:
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_HELLO from 0x{:x} {}".format(id(e.sender), e.sender))
+                    self.logger.info("EV_PERF_STATS from 0x{:x} {}".format(id(e.sender), e.sender))
 
-                self.add_event_listener(e.sender)
+                # add remote server queue and traffic to pipeline stats
+                remote_stats = self.perf.get_stats()
+                remote_stats['queue'] = self.get_event_queue_stats()
+                remote_stats['clients'] = self.get_client_stats()
+                e.data['remote'] = remote_stats
+                e.sender = id(self)
+                self.send_broadcast(e)
 
-            elif e.event_id == gc.EV_GOOD_BYE:
+            else:
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_GOOD_BYE from 0x{:x} {}".format(id(e.sender), e.sender))
+                    self.logger.info("EV_[{}] from 0x{:x} {}".format(e.event_id, id(e.sender), e.sender))
 
-                self.remove_event_listener(e.sender)
+                e.sender = id(self)
+                self.send_broadcast(e)
 
-            elif e.event_id == gc.EV_CMD_EXIT:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_CMD_EXIT from 0x{:x} {}".format(id(e.sender), e.sender))
+        # local/non-machine messaging
+        elif e.event_id == gc.EV_HELLO:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_HELLO from 0x{:x} {}".format(id(e.sender), e.sender))
 
-                if self.machifProgExec is not None:
-                    self.machifProgExec.add_event(gc.EV_CMD_EXIT)
+            self.add_event_listener(e.sender)
 
-                self.close()
+        elif e.event_id == gc.EV_GOOD_BYE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_GOOD_BYE from 0x{:x} {}".format(id(e.sender), e.sender))
 
-                self.endThread = True
+            self.remove_event_listener(e.sender)
 
-            else:
-                # if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                self.logger.error(
-                    "EV_?? got unknown event!! {} from 0x{:x} {}".format(e.event_id, id(e.sender), e.sender))
+        elif e.event_id == gc.EV_CMD_EXIT:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_EXIT from 0x{:x} {}".format(id(e.sender), e.sender))
+
+            if self.machifProgExec is not None:
+                self.machifProgExec.add_event(gc.EV_CMD_EXIT)
+
+            self.close()
+
+            self.endThread = True
+
+        else:
+            # if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+            self.logger.error(
+                "EV_?? got unknown event!! {} from 0x{:x} {}".format(e.event_id, id(e.sender), e.sender))
 
     def process_client_queue(self):
         """
         Process socket events
 
         """
-        try:
-            e = self.clientEventQueue._eventQueue.get_nowait()
-        except queue.Empty:
-            pass
-        else:
-            # this message came from clients
-            if e.event_id == gc.EV_CMD_TXDATA:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_CMD_TXDATA from client{}".format(self.inputsAddr[e.sender]))
+        for e in self.clientEventQueue.get_events():
+            self.process_client_event(e)
 
-            elif e.event_id == gc.EV_CMD_OPEN:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_CMD_OPEN from client{}".format(self.inputsAddr[e.sender]))
+    def drop_client_event(self, e, reason):
+        """
+        Log client event that can't be handled and tell the client
 
-                if self.machifProgExec is None:
-                    self.machifProgExec = mi_progexec.MachIfExecuteThread(self)
+        """
+        msg = "** Dropped EV_[{}] from client{}, {}\n".format(e.event_id, self.inputsAddr.get(e.sender), reason)
 
-            elif e.event_id == gc.EV_CMD_CLOSE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_CMD_CLOSE from client{}".format(self.inputsAddr[e.sender]))
+        self.logger.error(msg.strip())
+        self.send(e.sender, gc.SimpleEvent(gc.EV_DATA_IN, msg, id(self.socServer)))
 
-                if self.machifProgExec is not None:
-                    self.machifProgExec.add_event(gc.EV_CMD_EXIT)
+    def process_client_event(self, e):
+        """
+        Handle single event from client
 
-            elif e.event_id == gc.EV_CMD_GET_CONFIG:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_CMD_GET_CONFIG from client{}".format(self.inputsAddr[e.sender]))
+        """
+        # this message came from clients
+        if e.event_id == gc.EV_CMD_TXDATA:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_TXDATA from client{}".format(self.inputsAddr[e.sender]))
 
-                port_list = self.get_serial_ports()
-                gc.CONFIG_DATA.add('/temp/SerialPorts', port_list)
-                gc.CONFIG_DATA.add('/temp/RemoteServer', True)
-                self.send(e.sender,  gc.SimpleEvent(gc.EV_RMT_CONFIG_DATA, gc.CONFIG_DATA, id(self.socServer)))
+        elif e.event_id == gc.EV_CMD_OPEN:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_OPEN from client{}".format(self.inputsAddr[e.sender]))
 
-            elif e.event_id == gc.EV_CMD_GET_GCODE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_CMD_GET_GCODE from client{}".format(self.inputsAddr[e.sender]))
+            if self.machifProgExec is None:
+                self.machifProgExec = mi_progexec.MachIfExecuteThread(self)
 
-                if self.machifProgExec is not None:
-                    gcode_dict = self.machifProgExec.get_gcode_dict()
-                    self.send(e.sender, gc.SimpleEvent(gc.EV_GCODE, gcode_dict, id(self.socServer)))
+        elif e.event_id == gc.EV_CMD_CLOSE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_CLOSE from client{}".format(self.inputsAddr[e.sender]))
 
-            elif e.event_id == gc.EV_CMD_GET_BRK_PT:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_CMD_GET_BRK_PT from client{}".format(self.inputsAddr[e.sender]))
+            if self.machifProgExec is not None:
+                self.machifProgExec.add_event(gc.EV_CMD_EXIT)
 
-                if self.machifProgExec is not None:
-                    gcode_dict = self.machifProgExec.get_gcode_dict()
-                    self.send(e.sender, gc.SimpleEvent(gc.EV_BRK_PT, gcode_dict['breakPoints'], id(self.socServer)))
+        elif e.event_id == gc.EV_CMD_GET_CONFIG:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_GET_CONFIG from client{}".format(self.inputsAddr[e.sender]))
 
-            elif e.event_id == gc.EV_CMD_UPDATE_CONFIG:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_CMD_UPDATE_CONFIG from client{}".format(self.inputsAddr[e.sender]))
+            port_list = self.get_serial_ports()
+            gc.CONFIG_DATA.add('/temp/SerialPorts', port_list)
+            gc.CONFIG_DATA.add('/temp/RemoteServer', True)
+            self.send(e.sender,  gc.SimpleEvent(gc.EV_RMT_CONFIG_DATA, gc.CONFIG_DATA, id(self.socServer)))
 
-                machine_device = gc.CONFIG_DATA.get('/machine/Device')
-                machine_port = gc.CONFIG_DATA.get('/machine/Port')
-                machine_baud = gc.CONFIG_DATA.get('/machine/Baud')
+        elif e.event_id == gc.EV_CMD_GET_GCODE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_GET_GCODE from client{}".format(self.inputsAddr[e.sender]))
 
-                tcp_port = gc.CONFIG_DATA.get('/remote/TcpPort')
-                udp_port = gc.CONFIG_DATA.get('/remote/UdpPort')
-                udp_broadcast = gc.CONFIG_DATA.get('/remote/UdpBroadcast')
+            if self.machifProgExec is not None:
+                gcode_dict = self.machifProgExec.get_gcode_dict()
 
-                if e.data is not None:
-                    gc.CONFIG_DATA = e.data
-                    gc.CONFIG_DATA.save()
+                peer_chunks = self.clientGcodeChunks.get(e.sender)
+                if peer_chunks is not None:
+                    gcode_dict = self.gcodeChunkCache.pack(gcode_dict, self.gcodeDigest, peer_chunks)
 
-                if self.machifProgExec is not None:
-                    self.machifProgExec.add_event(gc.EV_CMD_UPDATE_CONFIG)
+                self.send(e.sender, gc.SimpleEvent(gc.EV_GCODE, gcode_dict, id(self.socServer)))
 
-                    # close serial port if settings changed
-                    if (machine_device != gc.CONFIG_DATA.get('/machine/Device') or
-                       machine_port != gc.CONFIG_DATA.get('/machine/Port') or
-                       machine_baud != gc.CONFIG_DATA.get('/machine/Baud')):
-                        self.machifProgExec.add_event(gc.EV_CMD_EXIT)
+        elif e.event_id == gc.EV_CMD_GET_GCODE_CHUNKS:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_GET_GCODE_CHUNKS from client{}".format(self.inputsAddr[e.sender]))
 
-                # re start server if settings changed
-                if (tcp_port != gc.CONFIG_DATA.get('/remote/TcpPort') or
-                   udp_port != gc.CONFIG_DATA.get('/remote/UdpPort') or
-                   udp_broadcast != gc.CONFIG_DATA.get('/remote/UdpBroadcast')):
+            # client doesn't have all chunks we thought it had
+            try:
+                chunk_data, missing = self.gcodeChunkCache.get_chunk_data(e.data)
+            except ValueError as ex:
+                self.drop_client_event(e, str(ex))
+                return
+
+            if missing and self.machifProgExec is not None:
+                # chunks are gone (program changed meanwhile), send whole program
+                gcode_dict = self.machifProgExec.get_gcode_dict()
+                self.send(e.sender, gc.SimpleEvent(gc.EV_GCODE, gcode_dict, id(self.socServer)))
+            else:
+                self.send(e.sender, gc.SimpleEvent(gc.EV_GCODE_CHUNKS, chunk_data, id(self.socServer)))
 
-                    self.tcpPort = gc.CONFIG_DATA.get('/remote/TcpPort')
-                    self.udpPort = gc.CONFIG_DATA.get('/remote/UdpPort')
-                    self.udpBroadcast = gc.CONFIG_DATA.get('/remote/UdpBroadcast')
+        elif e.event_id == gc.EV_GCODE_CHUNKS:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_GCODE_CHUNKS from client{}".format(self.inputsAddr[e.sender]))
 
-                    msg = gc.SimpleEvent(gc.EV_RMT_GOOD_BYE, "** Server settings changing, restart...\n")
-                    self.send_broadcast(msg)
-                    self.close()
-                    self.open()
+            try:
+                self.gcodeChunkCache.add_chunk_data(e.data)
+            except ValueError as ex:
+                self.drop_client_event(e, str(ex))
+                return
 
-            elif e.event_id == gc.EV_CMD_RMT_RESET:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_CMD_RMT_RESET from client{}".format(self.inputsAddr[e.sender]))
+            pending = self.clientGcodePending.pop(e.sender, None)
+            if pending is not None:
+                gcode_dict, missing = self.gcodeChunkCache.unpack(pending.data, self.clientGcodeChunks[e.sender])
 
-                os.system('sudo reboot')
+                if gcode_dict is None:
+                    # client sends whole program when it can't supply chunks,
+                    # left are chunks that didn't match their digest
+                    pending.sender = e.sender
+                    self.drop_client_event(pending, "missing {} G-code chunk(s)".format(len(missing)))
 
-            elif e.event_id == gc.EV_RMT_PING:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                    self.logger.info("EV_RMT_PING from client{}".format(self.inputsAddr[e.sender]))
+                elif self.machifProgExec is not None:
+                    pending.data = gcode_dict
+                    pending.sender = self
+                    self.machifProgExec.add_event(pending)
 
-                self.send(e.sender, gc.SimpleEvent(gc.EV_RMT_PONG, 0, id(self.socServer)))
+        elif e.event_id in [gc.EV_CMD_RUN, gc.EV_CMD_STEP] and isinstance(e.data, dict) and 'gcodeChunks' in e.data:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_[{}] chunked G-code from client{}".format(
+                    e.event_id, self.inputsAddr[e.sender]))
 
-            else:
-                # # if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
-                # self.logger.error(
-                #     "EV_?? got unknown event!! {} from client{}".format(e.event_id, self.inputs_addr[e.sender]))
+            peer_chunks = self.clientGcodeChunks.setdefault(e.sender, set())
 
-                if self.machifProgExec is not None:
-                    e.sender = self
-                    self.machifProgExec.add_event(e)
+            try:
+                gcode_dict, missing = self.gcodeChunkCache.unpack(e.data, peer_chunks)
+            except ValueError as ex:
+                self.drop_client_event(e, str(ex))
+                return
+
+            if gcode_dict is None:
+                # hold on to request until client sends missing chunks
+                self.clientGcodePending[e.sender] = e
+                self.send(e.sender, gc.SimpleEvent(gc.EV_CMD_GET_GCODE_CHUNKS, missing, id(self.socServer)))
+
+            elif self.machifProgExec is not None:
+                e.data = gcode_dict
+                e.sender = self
+                self.machifProgExec.add_event(e)
+
+        elif e.event_id == gc.EV_CMD_GET_BRK_PT:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_GET_BRK_PT from client{}".format(self.inputsAddr[e.sender]))
+
+            if self.machifProgExec is not None:
+                gcode_dict = self.machifProgExec.get_gcode_dict()
+                self.send(e.sender, gc.SimpleEvent(gc.EV_BRK_PT, gcode_dict['breakPoints'], id(self.socServer)))
+
+        elif e.event_id == gc.EV_CMD_UPDATE_CONFIG:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_UPDATE_CONFIG from client{}".format(self.inputsAddr[e.sender]))
+
+            machine_device = gc.CONFIG_DATA.get('/machine/Device')
+            machine_port = gc.CONFIG_DATA.get('/machine/Port')
+            machine_baud = gc.CONFIG_DATA.get('/machine/Baud')
+
+            tcp_port = gc.CONFIG_DATA.get('/remote/TcpPort')
+            udp_port = gc.CONFIG_DATA.get('/remote/UdpPort')
+            udp_broadcast = gc.CONFIG_DATA.get('/remote/UdpBroadcast')
+
+            # changed keys, older clients send the whole config
+            changes = e.data or {}
+            if isinstance(changes, gc.ConfigData):
+                changes = gc.CONFIG_DATA.get_diff(changes)
+
+            if type(changes) is not dict or not all(type(k) is str for k in changes):
+                self.drop_client_event(e, "config changes must be a dictionary of key paths")
+                return
+
+            # server owned data
+            changes = {k: v for k, v in changes.items() if not k.startswith('/temp/')}
+
+            if changes:
+                # subscribers (machifProgExec) get their part of the changes
+                gc.CONFIG_DATA.update(changes)
+                gc.CONFIG_DATA.save()
+
+                self.compressMinSize = gc.CONFIG_DATA.get('/remote/CompressMinSize', gc.REMOTE_COMPRESS_MIN_SIZE)
+
+                self.send_broadcast(gc.SimpleEvent(gc.EV_RMT_CONFIG_CHANGES, changes, id(self.socServer)))
+
+            if self.machifProgExec is not None:
+                # close serial port if settings changed
+                if (machine_device != gc.CONFIG_DATA.get('/machine/Device') or
+                   machine_port != gc.CONFIG_DATA.get('/machine/Port') or
+                   machine_baud != gc.CONFIG_DATA.get('/machine/Baud')):
+                    self.machifProgExec.add_event(gc.EV_CMD_EXIT)
+
+            # re start server if settings changed
+            if (tcp_port != gc.CONFIG_DATA.get('/remote/TcpPort') or
+               udp_port != gc.CONFIG_DATA.get('/remote/UdpPort') or
+               udp_broadcast != gc.CONFIG_DATA.get('/remote/UdpBroadcast')):
+
+                self.tcpPort = gc.CONFIG_DATA.get('/remote/TcpPort')
+                self.udpPort = gc.CONFIG_DATA.get('/remote/UdpPort')
+                self.udpBroadcast = gc.CONFIG_DATA.get('/remote/UdpBroadcast')
+
+                msg = gc.SimpleEvent(gc.EV_RMT_GOOD_BYE, "** Server settings changing, restart...\n")
+                self.send_broadcast(msg)
+                self.close()
+                self.open()
+
+        elif e.event_id == gc.EV_CMD_RMT_RESET:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_CMD_RMT_RESET from client{}".format(self.inputsAddr[e.sender]))
+
+            os.system('sudo reboot')
+
+        elif e.event_id == gc.EV_RMT_HELLO:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_RMT_HELLO from client{}".format(self.inputsAddr[e.sender]))
+
+            if isinstance(e.data, dict) and e.sender in self.clientWireVersion:
+                wire_version = e.data.get('wire', 0)
+                if isinstance(wire_version, int):
+                    self.clientWireVersion[e.sender] = max(0, min(wire_version, gc.REMOTE_WIRE_VERSION))
+
+                if e.data.get('gcodeChunks', False):
+                    self.clientGcodeChunks[e.sender] = set()
+
+                self.clientCompress[e.sender] = bool(e.data.get('zlib', False))
+
+                # tell client what we handle
+                hello = {'wire': self.clientWireVersion[e.sender], 'gcodeChunks': True, 'zlib': True}
+                self.send(e.sender, gc.SimpleEvent(gc.EV_RMT_HELLO, hello, id(self.socServer)))
+
+        elif e.event_id == gc.EV_RMT_PING:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+                self.logger.info("EV_RMT_PING from client{}".format(self.inputsAddr[e.sender]))
+
+            self.send(e.sender, gc.SimpleEvent(gc.EV_RMT_PONG, 0, id(self.socServer)))
+
+        else:
+            # # if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_EV:
+            # self.logger.error(
+            #     "EV_?? got unknown event!! {} from client{}".format(e.event_id, self.inputs_addr[e.sender]))
+
+            if e.event_id in [gc.EV_CMD_RUN, gc.EV_CMD_STEP]:
+                # whole program, replaces one waiting for chunks
+                self.clientGcodePending.pop(e.sender, None)
+
+            if self.machifProgExec is not None:
+                e.sender = self
+                self.machifProgExec.add_event(e)
 
     def close(self):
         """
@@ -318,6 +538,12 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
                 soc = self.inputs.pop()
                 soc.close()
 
+            self.clientWireVersion.clear()
+            self.clientCompress.clear()
+            self.messageQueues.clear()
+            del self.outputs[:]
+            self.clientGcodeChunks.clear()
+            self.clientGcodePending.clear()
             self.socServer = None
 
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
@@ -329,6 +555,19 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
             self.socBroadcast.close()
             self.socBroadcast = None
 
+    def get_client_stats(self):
+        """
+        Get outbound queue state per client
+
+        """
+        stats = dict()
+
+        for client, client_queue in list(self.messageQueues.items()):
+            addr = self.inputsAddr.get(client)
+            stats["{}:{}".format(*addr[:2]) if addr else str(id(client))] = client_queue.get_stats()
+
+        return stats
+
     def get_serial_ports(self):
         ser_list = []
         port_search_fail_safe = False
@@ -387,7 +626,7 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
             self.socServer.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # for TCP
             self.socServer.setblocking(0)
             self.socServer.bind(("", self.tcpPort))
-            self.socServer.listen(5)  # only for TCP
+            self.socServer.listen(gc.REMOTE_LISTEN_BACKLOG)  # only for TCP
             self.inputs.append(self.socServer)
 
             if self.useUdpBroadcast:
@@ -429,49 +668,89 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
             # sending directly to who created us
             self.notify_event_listeners(gc.EV_RMT_PORT_OPEN, msg)
 
+    def decode(self, msg):
+        """
+        Decode message, None if it is malformed
+
+        """
+        try:
+            raw_msg = gc.remote_msg_decompress(msg)
+
+            self.perf.incr('rx_msgs')
+            self.perf.incr('rx_bytes', len(msg))
+            self.perf.incr('rx_raw_bytes', len(raw_msg))
+
+            return gc.remote_msg_decode(raw_msg)
+
+        except ValueError as e:
+            self.logger.error("Dropped malformed msg len:{} err:{}".format(len(msg), str(e)))
+
+        return None
+
     def recv(self, soc):
+        """
+        Read from client socket, return message once complete. Receive
+        state is kept per client, clients' messages arrive interleaved
+
+        """
         exFlag = False
         exMsg = ""
         data = None
+        client = self.messageQueues[soc]
 
         try:
-            if not len(self.rxBuffer):
-                msg_header = soc.recv(gc.SOCK_HEADER_SIZE)
-                msg_len = 0
+            if client.rxBufferLen <= 0:
+                # header may arrive in pieces
+                msg_header = soc.recv(gc.SOCK_HEADER_SIZE - len(client.rxHeader))
+
+                if not len(msg_header):
+                    client.rxClosed = True
+
+                client.rxHeader += msg_header
+
+                if len(client.rxHeader) == gc.SOCK_HEADER_SIZE:
+                    msg_len = int(client.rxHeader.decode('utf-8'))
 
-                if len(msg_header):
-                    msg_len = int(msg_header.decode('utf-8'))
-                    self.rxBufferLen = msg_len
+                    if msg_len <= 0 or msg_len > gc.REMOTE_MSG_MAX_SIZE:
+                        raise ValueError("bad msg len {}".format(msg_len))
+
+                    client.rxHeader = b""
+                    client.rxBufferLen = msg_len
                     self.allMsgLenRecv += msg_len
 
             msg = b""
-            msg = soc.recv(self.rxBufferLen)
+
+            if client.rxBufferLen > 0:
+                msg = soc.recv(client.rxBufferLen)
+
+                if not len(msg):
+                    client.rxClosed = True
 
             if len(msg):
-                self.rxBufferLen -= len(msg)
-                self.rxBuffer += msg
+                client.rxBufferLen -= len(msg)
+                client.rxBuffer += msg
 
                 # got the entire message decode
-                if self.rxBufferLen <= 0:
-                    data = pickle.loads(self.rxBuffer)
+                if client.rxBufferLen <= 0:
+                    data = self.decode(client.rxBuffer)
 
-                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
+                    if data is not None and gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
                         log_msg =  "Recv msg id:{} obj:0x{:x} len:{} from {} ".format(
-                            data.event_id, id(data), len(self.rxBuffer), self.inputsAddr[soc])
+                            data.event_id, id(data), len(client.rxBuffer), self.inputsAddr[soc])
 
                         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_HEX_DUMP:
-                            log_msg = log_msg + gc.verbose_hex_dump("", self.rxBuffer)
+                            log_msg = log_msg + gc.verbose_hex_dump("", client.rxBuffer)
 
                         elif gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_HEX:
-                            log_msg = log_msg + gc.verbose_data_hex("", self.rxBuffer)
+                            log_msg = log_msg + gc.verbose_data_hex("", client.rxBuffer)
 
                         elif (gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_STR):
-                            log_msg = log_msg + gc.verbose_data_ascii("", self.rxBuffer)
+                            log_msg = log_msg + gc.verbose_data_ascii("", client.rxBuffer)
 
                         self.logger.info(log_msg)
 
                     # init rxBuffer last
-                    self.rxBuffer = b""
+                    client.rxBuffer = b""
 
         except OSError as e:
             # This is normal on non blocking connections - when there are no incoming data error is going to be raised
@@ -495,6 +774,11 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
             exMsg = "** socket.error exception: {}\n".format(str(e))
             exFlag = True
 
+        except ValueError as e:
+            # stream is out of sync, no way to find next header
+            exMsg = "** Bad msg header from client{}: {}\n".format(self.inputsAddr[soc], str(e))
+            exFlag = True
+
         # except:
         #     e = sys.exc_info()[0]
         #     exMsg = "** Unexpected exception: {}\n".format(str(e))
@@ -503,6 +787,7 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
         if exFlag:
             # make sure we stop processing any states...
             # self.swState = gc.STATE_ABORT
+            client.rxClosed = True
 
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
                 self.logger.error(exMsg.strip())
@@ -515,91 +800,145 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
         return data
 
     def send(self, soc, data):
-        exFlag = False
-        exMsg = ""
+        """
+        Queue message to client and write what the socket takes now, the
+        rest is written when select reports the socket writable
 
-        pickle_data = pickle.dumps(data, protocol=5)
-        msg_len = len(pickle_data)
-        msg = "{:{header_size}}".format(msg_len, header_size=gc.SOCK_HEADER_SIZE).encode('utf-8')
-        msg += pickle_data
-        data_len = len(msg)
-        data_sent_len = 0
+        """
+        client_queue = self.messageQueues.get(soc)
+        if client_queue is None:
+            # client already gone
+            return
 
-        while (not exFlag and data_sent_len < data_len):
-            try:
-                data_sent_len += soc.send(bytes(msg[data_sent_len:]))
-
-            except OSError as e:
-                # This is normal on non blocking connections - when there are no incoming data error is going to be
-                # raised. Some operating systems will indicate that using AGAIN, and some using WOULDBLOCK error code
-                # We are going to check for both - if one of them - that's expected, means no incoming data, continue
-                # as normal. If we got different error code - something happened
-                if e.errno != errno.EAGAIN and e.errno != errno.EWOULDBLOCK:
-                    exMsg = "** OSError exception: {}\n".format(str(e))
-                    exFlag = True
-
-            except IOError as e:
-                # This is normal on non blocking connections - when there are no incoming data error is going to be
-                # raised. Some operating systems will indicate that using AGAIN, and some using WOULDBLOCK error code
-                # We are going to check for both - if one of them - that's expected, means no incoming data, continue
-                # as normal. If we got different error code - something happened
-                if e.errno != errno.EAGAIN and e.errno != errno.EWOULDBLOCK:
-                    exMsg = "** IOError exception: {}\n".format(str(e))
-                    exFlag = True
-
-            except socket.error as e:
-                exMsg = "** socket.error exception: {}\n".format(str(e))
-                exFlag = True
+        frame, raw_len = self.get_frame(
+            data, self.clientWireVersion.get(soc, 0), self.clientCompress.get(soc, False))
 
-            # except:
-            #     e = sys.exc_info()[0]
-            #     exMsg = "** Unexpected exception: {}\n".format(str(e))
-            #     exFlag = True
+        msg_len = len(frame) - gc.SOCK_HEADER_SIZE
+        self.count_tx(raw_len, msg_len)
 
         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
             log_msg = "Send msg id:{} obj:0x{:x} len:{} to {} ".format(
                 data.event_id, id(data), msg_len, self.inputsAddr[soc])
 
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_HEX_DUMP:
-                log_msg = log_msg + gc.verbose_hex_dump("->", pickle_data)
+                log_msg = log_msg + gc.verbose_hex_dump("->", frame[gc.SOCK_HEADER_SIZE:])
 
             elif gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_HEX:
-                log_msg = log_msg + gc.verbose_data_hex("->", pickle_data)
+                log_msg = log_msg + gc.verbose_data_hex("->", frame[gc.SOCK_HEADER_SIZE:])
 
             elif (gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_STR):
-                log_msg = log_msg + gc.verbose_data_ascii("->", pickle_data)
+                log_msg = log_msg + gc.verbose_data_ascii("->", frame[gc.SOCK_HEADER_SIZE:])
 
             self.logger.info(log_msg)
 
+        client_queue.put(frame)
+        self.perf.add_value('client_queue_bytes', client_queue.byteCount)
+
+        # a client that can't keep up is dropped, one message bigger than
+        # the limit is let through if nothing else is waiting
+        if client_queue.byteCount > gc.REMOTE_CLIENT_QUEUE_MAX_BYTES and len(client_queue.frames) > 1:
+            self.logger.error("Client{} queue over {} bytes, disconnect".format(
+                self.inputsAddr[soc], gc.REMOTE_CLIENT_QUEUE_MAX_BYTES))
+
+            self.perf.incr('clients_dropped')
+            self.clean_up(soc)
+            return
+
+        self.write(soc)
+
+    def write(self, soc):
+        """
+        Write queued messages until client socket is full
+
+        """
+        exFlag = False
+        exMsg = ""
+        client_queue = self.messageQueues[soc]
+
+        try:
+            client_queue.write()
+
+        except OSError as e:
+            # This is normal on non blocking connections - when the socket buffer is full error is going to be
+            # raised. Some operating systems will indicate that using AGAIN, and some using WOULDBLOCK error code
+            # We are going to check for both - if one of them - that's expected, the rest is written when the
+            # socket is writable. If we got different error code - something happened
+            if e.errno != errno.EAGAIN and e.errno != errno.EWOULDBLOCK:
+                exMsg = "** OSError exception: {}\n".format(str(e))
+                exFlag = True
+
         if exFlag:
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
                 self.logger.error(exMsg.strip())
 
             self.clean_up(soc)
 
+        elif client_queue.frames:
+            if soc not in self.outputs:
+                self.outputs.append(soc)
+
+        elif soc in self.outputs:
+            self.outputs.remove(soc)
+
+    def send_welcome(self, client):
+        """
+        Announce new client to local listeners, send welcome message and
+        port state to client
+
+        """
+        msg = "Server stablish connection to client{}\n".format(self.inputsAddr[client])
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
+            self.logger.info(msg.strip())
+            self.logger.info("Server report [{}] connected client(s)".format(len(self.messageQueues)))
+
+        # notify local listeners
+        self.notify_event_listeners(gc.EV_RMT_HELLO, msg)
+
+        # send welcome message, only to new client
+        python_ver = sys.version.replace('\n', "")
+        sys_str = str(os.uname()).replace("posix.uname_result", "")
+        welcome_str = \
+            "==========================================\n"\
+            f"Welcome to gsat server {vinfo.__version__}, running on:\n"\
+            f"host: {self.host} port: {self.socServer.getsockname()[1]}\n"\
+            f"python: {python_ver}\n"\
+            f"system: {sys_str}\n"\
+            "\n"
+
+        msg = gc.SimpleEvent(gc.EV_RMT_HELLO, welcome_str, id(self))
+
+        self.send(client, msg)
+
+        if self.serialPortIsOpen:
+            msg = gc.SimpleEvent(gc.EV_SER_PORT_OPEN, 0, id(self))
+            self.send(client, msg)
+
     def send_to(self, data):
         exFlag = False
         exMsg = ""
 
-        pickle_data = pickle.dumps(data, protocol=5)
-        msg_len = len(pickle_data)
-        msg = "{:{header_size}}".format(msg_len, header_size=gc.SOCK_HEADER_SIZE).encode('utf-8')
-        msg += pickle_data
+        # every client gets the datagram, use the oldest format
+        wire_version = min(self.clientWireVersion.values(), default=0)
+        compress = bool(self.clientCompress) and all(self.clientCompress.values())
+        frame, raw_len = self.get_frame(data, wire_version, compress)
+
+        msg_len = len(frame) - gc.SOCK_HEADER_SIZE
+        self.count_tx(raw_len, msg_len)
 
         try:
-            self.socBroadcast.sendto(bytes(msg), ('255.255.255.255', self.udpPort))
+            self.socBroadcast.sendto(frame, ('255.255.255.255', self.udpPort))
 
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
                 log_msg = "Send broadcast msg id:{} obj:0x{:x} len:{} ".format(data.event_id, id(data), msg_len)
 
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_HEX_DUMP:
-                    log_msg = log_msg + gc.verbose_hex_dump("->", pickle_data)
+                    log_msg = log_msg + gc.verbose_hex_dump("->", frame[gc.SOCK_HEADER_SIZE:])
 
                 elif gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_HEX:
-                    log_msg = log_msg + gc.verbose_data_hex("->", pickle_data)
+                    log_msg = log_msg + gc.verbose_data_hex("->", frame[gc.SOCK_HEADER_SIZE:])
 
                 elif (gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_STR):
-                    log_msg = log_msg + gc.verbose_data_ascii("->", pickle_data)
+                    log_msg = log_msg + gc.verbose_data_ascii("->", frame[gc.SOCK_HEADER_SIZE:])
 
                 self.logger.info(log_msg)
 
@@ -624,27 +963,142 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
             if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
                 self.logger.error(exMsg.strip())
 
+    def get_frame(self, data, wire_version, compress):
+        """
+        Encode message into a frame (header and payload), return frame and
+        payload size before compression. While a broadcast is sent frames
+        are kept, clients that take the same format share one frame (read
+        only)
+
+        """
+        key = (data.event_id, id(data.data), data.sender, wire_version, compress)
+
+        if self.broadcastFrames is not None:
+            frame_info = self.broadcastFrames.get(key)
+
+            # data is kept with the frame, its id can't be reused meanwhile
+            if frame_info is not None and frame_info[0] is data.data:
+                self.perf.incr('tx_shared_msgs')
+                return frame_info[1], frame_info[2]
+
+        msg_data = gc.remote_msg_encode(data, wire_version)
+        raw_len = len(msg_data)
+
+        if compress:
+            msg_data = gc.remote_msg_compress(msg_data, self.compressMinSize)
+
+        msg_header = "{:{header_size}}".format(len(msg_data), header_size=gc.SOCK_HEADER_SIZE).encode('utf-8')
+        frame = b"".join([msg_header, msg_data])
+
+        if self.broadcastFrames is not None:
+            self.broadcastFrames[key] = (data.data, frame, raw_len)
+
+        return frame, raw_len
+
+    def count_tx(self, raw_len, msg_len):
+        self.perf.incr('tx_msgs')
+        self.perf.incr('tx_bytes', msg_len)
+        self.perf.incr('tx_raw_bytes', raw_len)
+
+        if msg_len != raw_len:
+            self.perf.incr('tx_compressed_msgs')
+
     def send_broadcast(self, data):
         if self.useUdpBroadcast:
             self.send_to(data)
         else:
-            for soc in self.inputs:
-                if soc is not self.socServer:
-                    self.send(soc, data)
+            # data is encoded once per format, status passed on as is by
+            # the coalescer included
+            self.broadcastFrames = dict()
+
+            try:
+                for soc in list(self.messageQueues.keys()):
+                    client_queue = self.messageQueues.get(soc)
+                    if client_queue is None:
+                        # dropped while sending to a previous client
+                        continue
+
+                    # status and output held back (merged) while client is behind
+                    if data.event_id in [gc.EV_DATA_STATUS, gc.EV_DATA_OUT]:
+                        client_queue.coalescer.add(data.event_id, data.data)
+                        client_queue.coalescer.flush(data.sender)
+                    else:
+                        # keep order, anything held goes first
+                        client_queue.coalescer.flush(data.sender, force=True)
+                        self.send(soc, data)
+
+            finally:
+                self.broadcastFrames = None
+
+    def flush_client_queues(self):
+        """
+        Send status held back for clients that caught up
+
+        """
+        for client_queue in list(self.messageQueues.values()):
+            if not client_queue.frames:
+                client_queue.coalescer.flush(id(self))
 
     def clean_up(self, soc):
+        if soc not in self.inputsAddr:
+            # already cleaned up
+            return
+
         if soc in self.outputs:
             self.outputs.remove(soc)
 
         self.inputs.remove(soc)
 
-        if soc in self.outputs:
-            self.outputs.remove(soc)
-
         del self.inputsAddr[soc]
         del self.messageQueues[soc]
+        self.clientWireVersion.pop(soc, None)
+        self.clientCompress.pop(soc, None)
+        self.clientGcodeChunks.pop(soc, None)
+        self.clientGcodePending.pop(soc, None)
         soc.close()
 
+    def wait_for_io(self, inputs, outputs, exceptional):
+        """
+        Wait for socket I/O or new events
+
+        """
+        timeout = gc.EVENT_QUEUE_WAIT_TIMEOUT
+
+        if not self._eventQueue.empty() or not self.clientEventQueue._eventQueue.empty():
+            timeout = 0
+
+        readable, writable, exceptional = select.select(
+            inputs + [self.wakeupSocRead], outputs, exceptional, timeout)
+
+        if self.wakeupSocRead in readable:
+            readable.remove(self.wakeupSocRead)
+
+            try:
+                while self.wakeupSocRead.recv(512):
+                    pass
+            except OSError:
+                pass
+
+            # clear after draining and before handling the queue, a wakeup()
+            # from now on sends again and new events wake us
+            self.wakeupPending = False
+
+        return readable, writable, exceptional
+
+    def wakeup(self):
+        """
+        Wake up thread waiting on sockets
+
+        """
+        if not self.wakeupPending:
+            self.wakeupPending = True
+
+            try:
+                self.wakeupSocWrite.send(b'\0')
+            except OSError:
+                # buffer full (thread already awake) or closed
+                pass
+
     def run_device_init_script(self):
         init_script_en = gc.CONFIG_DATA.get('/machine/InitScriptEnable')
 
@@ -698,7 +1152,7 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
 
             if len(self.inputs):
                 if self.swState == gc.STATE_RUN:
-                    readable, writable, exceptional = select.select(self.inputs, self.outputs, self.inputs, 0)
+                    readable, writable, exceptional = self.wait_for_io(self.inputs, self.outputs, self.inputs)
 
                     for soc in readable:
                         if soc is self.socServer:
@@ -707,34 +1161,11 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
                             connection.setblocking(0)
                             self.inputs.append(connection)
                             self.inputsAddr[connection] = client_address
-                            self.messageQueues[connection] = queue.Queue()
+                            self.messageQueues[connection] = RemoteClientQueue(self, connection)
+                            self.clientWireVersion[connection] = 0
+
+                            self.send_welcome(connection)
 
-                            msg = "Server stablish connection to client{}\n".format(self.inputsAddr[connection])
-                            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
-                                self.logger.info(msg.strip())
-                                self.logger.info("Server report [{}] connected client(s)".format(len(self.inputs)-1))
-
-                            # notify local listeners
-                            self.notify_event_listeners(gc.EV_RMT_HELLO, msg)
-
-                            # send welcome message, only to new client
-                            python_ver = sys.version.replace('\n', "")
-                            sys_str = str(os.uname()).replace("posix.uname_result", "")
-                            welcome_str = \
-                                "==========================================\n"\
-                                f"Welcome to gsat server {vinfo.__version__}, running on:\n"\
-                                f"host: {self.host} port: {soc.getsockname()[1]}\n"\
-                                f"python: {python_ver}\n"\
-                                f"system: {sys_str}\n"\
-                                "\n"
-
-                            msg = gc.SimpleEvent(gc.EV_RMT_HELLO, welcome_str, id(self))
-
-                            self.send(connection, msg)
-
-                            if self.serialPortIsOpen:
-                                msg = gc.SimpleEvent(gc.EV_SER_PORT_OPEN, 0, id(self))
-                                self.send(connection, msg)
                         else:
                             # read data from client
                             data = self.recv(soc)
@@ -745,37 +1176,30 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
                                 # self.eventPut(data)
                                 self.clientEventQueue.add_event(data)
 
-                            else:
-                                if not self.rxBufferLen:
-                                    # no data client disconnected, clean up
-                                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
-                                        self.logger.info(
-                                            "Connection reset by peer, client {}".format(self.inputsAddr[soc]))
-
-                                    self.clean_up(soc)
-
-                                    if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
-                                        self.logger.info(
-                                            "Server report [{}] connected client(s)".format(len(self.inputs)-1))
-
-                    # # Handle outputs
-                    # for soc in writable:
-                    #     try:
-                    #         msg = self.messageQueues[soc].get_nowait()
-                    #     except Queue.Empty:
-                    #         pass
-                    #     else:
-                    #         self.send(soc, msg)
-
-                    #     try:
-                    #         msg = self.broadcastQueue.get_nowait()
-                    #     except Queue.Empty:
-                    #         pass
-                    #     else:
-                    #         self.send(soc, msg)
+                            elif self.messageQueues[soc].rxClosed:
+                                # client disconnected or sent garbage, clean up
+                                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
+                                    self.logger.info(
+                                        "Connection reset by peer, client {}".format(self.inputsAddr[soc]))
+
+                                self.clean_up(soc)
+
+                                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
+                                    self.logger.info(
+                                        "Server report [{}] connected client(s)".format(len(self.inputs)-1))
+
+                    # handle outputs
+                    for soc in writable:
+                        if soc in self.messageQueues:
+                            self.write(soc)
+
+                    self.flush_client_queues()
 
                     # handle exceptions
                     for soc in exceptional:
+                        if soc not in self.inputsAddr:
+                            continue
+
                         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
                             self.logger.info("Unknown exception from client {}".format(self.inputsAddr[soc]))
 
@@ -783,7 +1207,7 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
 
                 elif self.swState == gc.STATE_ABORT:
                     # do nothing, wait to be terminated
-                    pass
+                    self.wait_for_io([], [], [])
                 else:
                     exMsg = "unexpected state [%d], Aborting..." \
                             % (self.swState)
@@ -806,11 +1230,13 @@ class RemoteServerThread(threading.Thread, gc.EventQueueIf):
                 self.notify_event_listeners(gc.EV_ABORT, message)
                 break
 
-            time.sleep(0.010)
-
         # exit thread
         self.close()
+        self.wakeupSocRead.close()
+        self.wakeupSocWrite.close()
+
         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
+            self.logger.info("event queue stats {}".format(self.get_event_queue_stats()))
             self.logger.info("thread exit")
 
         self.notify_event_listeners(gc.EV_EXIT, "")
@@ -0,0 +1,350 @@
+"""----------------------------------------------------------------------------
+    remote_server_async.py
+
+    Copyright (C) 2020 Wilhelm Duembeg
+
+    This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+    Grbl like GCODE interpreters. With features similar to software debuggers.
+    Features such as breakpoint, change current program counter, inspection
+    and modification of variables.
+
+    gsat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.
+
+    gsat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+import time
+import asyncio
+from collections import deque
+
+import modules.config as gc
+import modules.remote_server as remote_server
+
+
+class RemoteAsyncClient(object):
+    """
+    Client connection of the asyncio server, a reader task handles client
+    messages and a writer task writes queued messages to the stream. Same
+    queue interface as RemoteClientQueue, status is held back (merged)
+    while the client is behind.
+
+    """
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.frames = deque()
+        self.frameTimes = deque()
+        self.byteCount = 0
+        self.coalescer = gc.EventCoalescer(self, 0)
+        self.writeEvent = asyncio.Event()
+        self.sendLatency = gc.LatencyHistogram("send")
+        self.tasks = []
+
+    def add_event(self, event_id, data=None, sender=None):
+        self.server.send(self, gc.SimpleEvent(event_id, data, sender))
+
+    def get_event_queue_depth(self):
+        return len(self.frames)
+
+    def get_stats(self):
+        stats = {
+            'frames': len(self.frames),
+            'bytes': self.byteCount,
+            'coalesced': self.coalescer.eventsIn - self.coalescer.eventsOut,
+            'send': self.sendLatency.get_summary(),
+        }
+
+        return stats
+
+    def put(self, frame):
+        self.frames.append(frame)
+        self.frameTimes.append(time.perf_counter())
+        self.byteCount += len(frame)
+
+    def write_frames_now(self):
+        """
+        Hand all queued frames to the stream, return time each was queued
+
+        """
+        put_times = list(self.frameTimes)
+
+        while self.frames:
+            self.writer.write(self.frames.popleft())
+
+        self.frameTimes.clear()
+        self.byteCount = 0
+
+        return put_times
+
+    async def read_frames(self):
+        """
+        Read and handle client messages until client disconnects, raises
+        ValueError on bad message header
+
+        """
+        server = self.server
+
+        while True:
+            msg_header = await self.reader.readexactly(gc.SOCK_HEADER_SIZE)
+            msg_len = int(msg_header.decode('utf-8'))
+
+            if msg_len <= 0 or msg_len > gc.REMOTE_MSG_MAX_SIZE:
+                raise ValueError("bad msg len {}".format(msg_len))
+
+            msg = await self.reader.readexactly(msg_len)
+            server.allMsgLenRecv += msg_len
+
+            data = server.decode(msg)
+
+            if data is not None:
+                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
+                    server.logger.info("Recv msg id:{} obj:0x{:x} len:{} from {} ".format(
+                        data.event_id, id(data), msg_len, server.inputsAddr.get(self)))
+
+                data.sender = self
+                server.process_client_event(data)
+
+            # busy client doesn't hold up the others
+            await asyncio.sleep(0)
+
+    async def write_frames(self):
+        """
+        Write queued frames, wait while the stream is full (frames queued
+        meanwhile are held and status merged)
+
+        """
+        while True:
+            await self.writeEvent.wait()
+            self.writeEvent.clear()
+
+            while self.frames:
+                put_times = self.write_frames_now()
+
+                await self.writer.drain()
+
+                time_now = time.perf_counter()
+                for put_time in put_times:
+                    self.sendLatency.add(time_now - put_time)
+
+                if not self.frames:
+                    # caught up, send what was held back
+                    self.coalescer.flush(id(self.server))
+
+
+class RemoteServerAsyncThread(remote_server.RemoteServerThread):
+    """
+    Remote server on an asyncio loop, same protocol and event handling as
+    RemoteServerThread. Each client gets its own reader and writer task,
+    cancelled together when the client disconnects or the server closes.
+
+    """
+
+    def __init__(self, event_handler):
+        # base init starts the thread
+        self.loop = None
+        self.wakeupEvent = None
+        self.tcpServer = None
+        self.tasks = set()
+
+        remote_server.RemoteServerThread.__init__(self, event_handler)
+
+    def close(self):
+        """
+        Close clients (queued messages are still written) and server port
+
+        """
+        for client in list(self.messageQueues.keys()):
+            client.write_frames_now()
+            self.clean_up(client)
+
+        if self.tcpServer is not None:
+            self.tcpServer.close()
+            self.tcpServer = None
+
+        remote_server.RemoteServerThread.close(self)
+
+    def open(self):
+        """
+        Open server port
+
+        """
+        remote_server.RemoteServerThread.open(self)
+
+        if self.socServer in self.inputs:
+            task = self.loop.create_task(self.serve(self.socServer))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def serve(self, soc):
+        """
+        Accept clients on server socket
+
+        """
+        try:
+            tcp_server = await asyncio.start_server(self.handle_client, sock=soc)
+
+        except OSError as e:
+            if soc is self.socServer:
+                self.logger.error("** OSError exception: {}".format(str(e)))
+            return
+
+        if soc is self.socServer:
+            self.tcpServer = tcp_server
+        else:
+            # closed while starting
+            tcp_server.close()
+
+    async def handle_client(self, reader, writer):
+        """
+        Run client reader and writer tasks until either one ends
+
+        """
+        handler_task = asyncio.current_task()
+        self.tasks.add(handler_task)
+
+        client = RemoteAsyncClient(self, reader, writer)
+        self.inputsAddr[client] = writer.get_extra_info('peername')
+        self.messageQueues[client] = client
+        self.clientWireVersion[client] = 0
+
+        client.tasks = [
+            self.loop.create_task(client.read_frames()),
+            self.loop.create_task(client.write_frames()),
+        ]
+
+        self.send_welcome(client)
+
+        try:
+            done, pending = await asyncio.wait(client.tasks, return_when=asyncio.FIRST_COMPLETED)
+
+            if client in self.inputsAddr and gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
+                for task in done:
+                    if not task.cancelled() and not isinstance(task.exception(), asyncio.IncompleteReadError):
+                        self.logger.error("** Client{} exception: {}".format(
+                            self.inputsAddr[client], str(task.exception())))
+
+                self.logger.info("Connection reset by peer, client {}".format(self.inputsAddr[client]))
+
+        finally:
+            self.clean_up(client)
+
+            await asyncio.gather(*client.tasks, return_exceptions=True)
+            self.tasks.discard(handler_task)
+
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
+                self.logger.info("Server report [{}] connected client(s)".format(len(self.messageQueues)))
+
+    def clean_up(self, client):
+        if client not in self.inputsAddr:
+            # already cleaned up
+            return
+
+        del self.inputsAddr[client]
+        del self.messageQueues[client]
+        self.clientWireVersion.pop(client, None)
+        self.clientCompress.pop(client, None)
+        self.clientGcodeChunks.pop(client, None)
+        self.clientGcodePending.pop(client, None)
+
+        for task in client.tasks:
+            task.cancel()
+
+        if client.frames:
+            # unsent data, client is gone or too slow
+            client.writer.transport.abort()
+        else:
+            client.writer.close()
+
+    def wakeup(self):
+        """
+        Wake up loop waiting for new events
+
+        """
+        loop = self.loop
+
+        if loop is not None and not self.wakeupPending:
+            self.wakeupPending = True
+
+            try:
+                loop.call_soon_threadsafe(self.wakeupEvent.set)
+            except RuntimeError:
+                # loop closed
+                pass
+
+    def write(self, client):
+        """
+        Wake up client writer task
+
+        """
+        client.writeEvent.set()
+
+    async def run_loop(self):
+        """
+        Handle events until exit, clients are served by their own tasks
+
+        """
+        self.wakeupEvent = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+
+        self.open()
+
+        while (not self.endThread) and self.inputs:
+            # clear before handling the queue, new events wake us again
+            self.wakeupEvent.clear()
+            self.wakeupPending = False
+
+            self.process_queue()
+
+            if self.endThread:
+                break
+
+            if self._eventQueue.empty():
+                await self.wakeupEvent.wait()
+            else:
+                # more than one pass of events, let clients run
+                await asyncio.sleep(0)
+
+        self.close()
+
+        # wait for server and client tasks to finish
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def run(self):
+        """
+        Run Worker Thread.
+
+        """
+        # This is the code executing in the new thread.
+        self.endThread = False
+
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
+            self.logger.info("thread start")
+
+        loop = asyncio.new_event_loop()
+
+        try:
+            loop.run_until_complete(self.run_loop())
+        finally:
+            self.loop = None
+            loop.close()
+
+        # exit thread
+        self.wakeupSocRead.close()
+        self.wakeupSocWrite.close()
+
+        if gc.VERBOSE_MASK & gc.VERBOSE_MASK_REMOTEIF_SERVER:
+            self.logger.info("event queue stats {}".format(self.get_event_queue_stats()))
+            self.logger.info("thread exit")
+
+        self.notify_event_listeners(gc.EV_EXIT, "")
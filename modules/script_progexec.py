@@ -23,7 +23,6 @@
 
 ----------------------------------------------------------------------------"""
 import threading
-import time
 
 import modules.config as gc
 
@@ -63,37 +62,41 @@ class ScriptExecuteThread(threading.Thread, gc.EventQueueIf):
 
         """
         # process events from queue
-        if not self._eventQueue.empty():
-            # get item from queue
-            e = self._eventQueue.get()
+        for e in self.get_events():
+            self.processEvent(e)
 
-            self.lastEventID = e.event_id
+    def processEvent(self, e):
+        """
+        Handle single event
 
-            if e.event_id == gc.EV_CMD_EXIT:
-                if self.cmdLineOptions.vverbose:
-                    print("** scriptExecuteThread got event gc.gEV_CMD_EXIT.")
+        """
+        self.lastEventID = e.event_id
 
-                self.endThread = True
-                self.swState = gc.STATE_IDLE
+        if e.event_id == gc.EV_CMD_EXIT:
+            if self.cmdLineOptions.vverbose:
+                print("** scriptExecuteThread got event gc.gEV_CMD_EXIT.")
 
-            elif e.event_id == gc.EV_CMD_RUN:
-                if self.cmdLineOptions.vverbose:
-                    print("** scriptExecuteThread got event gc.gEV_CMD_RUN, swState->gc.gSTATE_RUN")
-                self.swState = gc.STATE_RUN
+            self.endThread = True
+            self.swState = gc.STATE_IDLE
 
-            elif e.event_id == gc.EV_CMD_STOP:
-                if self.cmdLineOptions.vverbose:
-                    print("** scriptExecuteThread got event gc.gEV_CMD_STOP, swState->gc.gSTATE_IDLE")
+        elif e.event_id == gc.EV_CMD_RUN:
+            if self.cmdLineOptions.vverbose:
+                print("** scriptExecuteThread got event gc.gEV_CMD_RUN, swState->gc.gSTATE_RUN")
+            self.swState = gc.STATE_RUN
 
-                self.swState = gc.STATE_IDLE
+        elif e.event_id == gc.EV_CMD_STOP:
+            if self.cmdLineOptions.vverbose:
+                print("** scriptExecuteThread got event gc.gEV_CMD_STOP, swState->gc.gSTATE_IDLE")
 
-            elif e.event_id == gc.EV_CMD_GET_STATUS:
-                if self.cmdLineOptions.vverbose:
-                    print("** scriptExecuteThread got event gc.gEV_CMD_GET_STATUS.")
+            self.swState = gc.STATE_IDLE
 
-            else:
-                if self.cmdLineOptions.vverbose:
-                    print(f"** scriptExecuteThread got unknown event!! [{str(e.event_id)}].")
+        elif e.event_id == gc.EV_CMD_GET_STATUS:
+            if self.cmdLineOptions.vverbose:
+                print("** scriptExecuteThread got event gc.gEV_CMD_GET_STATUS.")
+
+        else:
+            if self.cmdLineOptions.vverbose:
+                print(f"** scriptExecuteThread got unknown event!! [{str(e.event_id)}].")
 
     def tick(self):
         return
@@ -156,7 +159,7 @@ class ScriptExecuteThread(threading.Thread, gc.EventQueueIf):
                 self.processIdleSate()
                 self.swState = gc.STATE_IDLE
 
-            time.sleep(0.01)
+            self.wait_for_event(0.01)
 
         if self.cmdLineOptions.vverbose:
             print("** scriptExecuteThread exit.")
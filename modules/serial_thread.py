@@ -27,10 +27,49 @@ import os
 import serial
 import tty
 import threading
+import selectors
+import collections
 import time
 import logging
 
 import modules.config as gc
+import modules.device_sim as ds
+
+
+class SerialLineFramer(object):
+    """
+    Split received bytes into lines. Each chunk is scanned for new lines
+    once and all complete lines are decoded together, partial lines stay
+    buffered as bytes, new line never shows inside a UTF-8 multi-byte
+    sequence so those are never split. Invalid sequences are replaced.
+
+    """
+
+    def __init__(self, encoding="utf-8"):
+        self.encoding = encoding
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """
+        Add received data, return list of complete lines without the new
+        line character
+
+        """
+        end = data.rfind(b'\n')
+
+        if end < 0:
+            self.buffer += data
+            return []
+
+        data = memoryview(data)
+        self.buffer += data[:end]
+        lines = self.buffer.decode(self.encoding, 'replace').split('\n')
+        self.buffer = bytearray(data[end + 1:])
+
+        return lines
+
+    def reset(self):
+        self.buffer = bytearray()
 
 
 class SerialPortThread(threading.Thread, gc.EventQueueIf):
@@ -52,10 +91,32 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
         self.serialPortName = port_name
         self.serialPortBaud = port_baud
 
-        self.rxBuffer = ""
+        self.rxFramer = SerialLineFramer()
 
         self.swState = gc.STATE_RUN
 
+        # event driven I/O, wait on serial port and wakeup pipe, there is
+        # no select on serial ports on Windows, poll there
+        self.selector = None
+        self.wakeupReadFd = None
+        self.wakeupWriteFd = None
+        self.wakeupPending = False
+
+        if os.name != 'nt':
+            self.wakeupReadFd, self.wakeupWriteFd = os.pipe()
+            os.set_blocking(self.wakeupReadFd, False)
+            os.set_blocking(self.wakeupWriteFd, False)
+
+        # always on counters and timers, time from write to the next
+        # received line
+        self.perf = gc.PerfCounters("serial")
+        self.rxLatency = self.perf.get_timer("write_to_rx")
+        self.txTime = None
+
+        # real-time commands bypass the event queue, latency per command
+        self.realTimeQueue = collections.deque()
+        self.realTimeLatency = dict()
+
         self.logger = logging.getLogger()
 
         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF:
@@ -67,51 +128,156 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
         # start thread
         self.start()
 
+    def add_realtime_data(self, data, discard_queued=False):
+        """
+        Queue real-time command, written ahead of any queued TX data.
+        Optionally discard TX data queued so far (i.e. reset)
+
+        """
+        if discard_queued:
+            with self._eventQueue.mutex:
+                events = [e for e in self._eventQueue.queue if e.event_id != gc.EV_CMD_TXDATA]
+                self._eventQueue.queue.clear()
+                self._eventQueue.queue.extend(events)
+
+        self.realTimeQueue.append((data, time.perf_counter()))
+        self.wakeup()
+
+    def get_realtime_latency(self, data):
+        return self.realTimeLatency.get(data)
+
+    def get_perf_stats(self):
+        """
+        Get performance counters snapshot, safe to call from other threads
+
+        """
+        stats = self.perf.get_stats()
+        stats['queue'] = self.get_event_queue_stats()
+        return stats
+
+    def get_rx_latency(self):
+        return self.rxLatency
+
+    def process_realtime_queue(self):
+        """
+        Write pending real-time commands
+
+        """
+        while self.realTimeQueue:
+            data, request_time = self.realTimeQueue.popleft()
+
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_EV:
+                self.logger.info(f"real-time cmd {data!r}")
+
+            self.write(data)
+
+            latency = self.realTimeLatency.get(data)
+            if latency is None:
+                latency = self.perf.get_timer(f"realtime_to_write {data!r}")
+                self.realTimeLatency[data] = latency
+
+            latency.add(time.perf_counter() - request_time)
+            self.perf.incr('realtime_cmds')
+
+    def wakeup(self):
+        """
+        Wake up thread waiting on I/O
+
+        """
+        if self.wakeupWriteFd is not None and not self.wakeupPending:
+            self.wakeupPending = True
+
+            try:
+                os.write(self.wakeupWriteFd, b'\0')
+            except (BlockingIOError, OSError):
+                # pipe full (thread already awake) or closed
+                pass
+
+        elif self.wakeupWriteFd is None:
+            gc.EventQueueIf.wakeup(self)
+
     def process_queue(self):
         """
-        Event handlers
+        Event handlers, drain all pending events, consecutive TX data events
+        are written to the port in a single write
 
         """
-        # process events from queue
-        if not self._eventQueue.empty():
-            # get item from queue
-            e = self._eventQueue.get()
+        txData = []
+        txQueueTimes = []
 
+        # process events from queue
+        for e in self.get_events():
             if e.event_id == gc.EV_CMD_TXDATA:
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_EV:
                     self.logger.info("EV_CMD_TXDATA")
 
-                self.write(e.data)
+                txData.append(e.data)
+                txQueueTimes.append(e.queueTime)
+                continue
 
-            elif e.event_id == gc.EV_HELLO:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_EV:
-                    self.logger.info(f"EV_HELLO from 0x{id(e.sender):x}")
+            # keep order, data queued before this event goes out first
+            if txData:
+                self.write_queued(txData, txQueueTimes)
+                txData = []
+                txQueueTimes = []
 
-                self.add_event_listener(e.sender)
+            self.process_event(e)
 
-            elif e.event_id == gc.EV_GOOD_BYE:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_EV:
-                    self.logger.info(f"EV_GOOD_BYE from 0x{id(e.sender):x}")
+            if self.endThread:
+                break
 
-                self.remove_event_listener(e.sender)
+        if txData and not self.endThread:
+            self.write_queued(txData, txQueueTimes)
 
-            elif e.event_id == gc.EV_CMD_EXIT:
-                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_EV:
-                    self.logger.info("EV_CMD_EXIT")
+    def write_queued(self, tx_data, queue_times):
+        """
+        Write TX data events in a single write, track enqueue to write time
 
-                self.close()
+        """
+        self.write("".join(tx_data))
 
-                self.endThread = True
+        time_now = time.perf_counter()
+        for queue_time in queue_times:
+            self.perf.add_time('queue_to_write', time_now - queue_time)
 
-            else:
-                # if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_EV:
-                self.logger.error(f"EV_?? got unknown event!! [{str(e.event_id)}]")
+    def process_event(self, e):
+        """
+        Handle non TX data events
+
+        """
+        if e.event_id == gc.EV_HELLO:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_EV:
+                self.logger.info(f"EV_HELLO from 0x{id(e.sender):x}")
+
+            self.add_event_listener(e.sender)
+
+        elif e.event_id == gc.EV_GOOD_BYE:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_EV:
+                self.logger.info(f"EV_GOOD_BYE from 0x{id(e.sender):x}")
+
+            self.remove_event_listener(e.sender)
+
+        elif e.event_id == gc.EV_CMD_EXIT:
+            if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_EV:
+                self.logger.info("EV_CMD_EXIT")
+
+            self.close()
+
+            self.endThread = True
+
+        else:
+            # if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_EV:
+            self.logger.error(f"EV_?? got unknown event!! [{str(e.event_id)}]")
 
     def close(self):
         """
         Close serial port
 
         """
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+
         if self.serialPort is not None:
             if self.serialPort.isOpen():
                 # self.serialPort.flushInput()
@@ -141,6 +307,10 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
                 portName = r"\\.\%s" % (str(port))
 
             try:
+                # simulated device, open its pty instead
+                if ds.is_sim_port(port):
+                    portName = ds.open_sim_port(port, baud)
+
                 self.serialPort = serial.Serial(
                     port=portName,
                     baudrate=baud,
@@ -179,6 +349,11 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
                     serial_fd = self.serialPort.fileno()
                     tty.setraw(serial_fd)
 
+                    if self.wakeupReadFd is not None:
+                        self.selector = selectors.DefaultSelector()
+                        self.selector.register(serial_fd, selectors.EVENT_READ)
+                        self.selector.register(self.wakeupReadFd, selectors.EVENT_READ)
+
                     if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF:
                         msg = f"open serial port [{portName}] at {baud} bps"
                         self.logger.info(msg)
@@ -202,7 +377,7 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
             # sending directly to who created us
             self.notify_event_listeners(gc.EV_ABORT, exMsg)
 
-    def read(self):
+    def read(self, rx_ready=False):
         exFlag = False
         exMsg = ""
         serialData = ""
@@ -210,19 +385,18 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
         try:
             inDataCnt = self.serialPort.inWaiting()
 
+            if rx_ready and inDataCnt == 0:
+                # port reported ready with no data, pyserial raises on
+                # disconnected devices
+                inDataCnt = 1
+
             while inDataCnt > 0 and not exFlag:
 
-                # # read data from port
-                # # Was running with performance issues using readline(), move
-                # # to read() using "".join() as performance is much better
-                # # then "+="
-                # serialData = self.serialPort.readline()
-                # self.rxBuffer += self.serialPort.read(inDataCnt)
-                data = self.serialPort.read(inDataCnt).decode("utf-8")
-                self.rxBuffer = "".join([self.rxBuffer, data])
+                # read data from port, framer returns all complete lines
+                data = self.serialPort.read(inDataCnt)
+                self.perf.incr('rx_bytes', len(data))
 
-                while '\n' in self.rxBuffer:
-                    serialData, self.rxBuffer = self.rxBuffer.split('\n', 1)
+                for serialData in self.rxFramer.feed(data):
 
                     if serialData:
                         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF:
@@ -236,16 +410,18 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
                             elif (gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_STR):
                                 self.logger.info(gc.verbose_data_ascii("<-", serialData))
 
-                        self.notify_event_listeners(gc.EV_RXDATA, f"{serialData}\n")
+                        if self.txTime is not None:
+                            self.rxLatency.add(time.perf_counter() - self.txTime)
+                            self.txTime = None
+
+                        self.perf.incr('rx_lines')
 
-                        # attempt to reduce starvation on other threads
-                        # when serial traffic is constant
-                        time.sleep(0.01)
+                        self.notify_event_listeners(gc.EV_RXDATA, f"{serialData}\n")
 
                 inDataCnt = self.serialPort.inWaiting()
 
         except serial.SerialException as e:
-            exMsg = f"** PySerial exception: {e.message}\n"
+            exMsg = f"** PySerial exception: {str(e)}\n"
             exFlag = True
 
         except OSError as e:
@@ -293,10 +469,16 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
                     elif (gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF_STR):
                         self.logger.info(gc.verbose_data_ascii("->", serialData))
 
-                self.serialPort.write(serialData.encode('utf8'))
+                data = serialData.encode('utf8')
+                self.serialPort.write(data)
+                self.perf.incr('tx_writes')
+                self.perf.incr('tx_bytes', len(data))
+
+                if self.txTime is None:
+                    self.txTime = time.perf_counter()
 
             except serial.SerialException as e:
-                exMsg = f"** PySerial exception: {e.message}\n"
+                exMsg = f"** PySerial exception: {str(e)}\n"
                 exFlag = True
 
             except OSError as e:
@@ -323,6 +505,52 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
                 self.notify_event_listeners(gc.EV_ABORT, exMsg)
                 self.close()
 
+    def wait_for_io(self):
+        """
+        Wait for serial data or new events, return True if serial port
+        has data ready
+
+        """
+        rx_ready = False
+        timeout = None
+
+        if not self._eventQueue.empty() or self.realTimeQueue:
+            timeout = 0
+
+        if self.selector is None:
+            # no event driven I/O (Windows), poll serial port
+            if timeout is None:
+                self.wait_for_event(0.01)
+
+            return rx_ready
+
+        if self.swState == gc.STATE_ABORT:
+            # nothing more to read, only wait for events
+            if self.serialPort.fileno() in self.selector.get_map():
+                self.selector.unregister(self.serialPort.fileno())
+
+        try:
+            ready = self.selector.select(timeout)
+        except (OSError, ValueError):
+            # port closed under us, let the main loop handle it
+            return rx_ready
+
+        for key, mask in ready:
+            if key.fd == self.wakeupReadFd:
+                try:
+                    while os.read(self.wakeupReadFd, 512):
+                        pass
+                except OSError:
+                    pass
+
+                # clear after draining and before handling the queue, a
+                # wakeup() from now on writes again and new events wake us
+                self.wakeupPending = False
+            else:
+                rx_ready = True
+
+        return rx_ready
+
     def run(self):
         """
         Run Worker Thread.
@@ -338,7 +566,14 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
 
         while (not self.endThread) and (self.serialPort is not None):
 
-            # process input queue for new commands or actions
+            # wait for rx data or wakeup from new events
+            rx_ready = self.wait_for_io()
+
+            # real-time commands first, then input queue for new commands
+            # or actions
+            if self.serialPort.isOpen():
+                self.process_realtime_queue()
+
             self.process_queue()
 
             # check if we need to exit now
@@ -347,7 +582,7 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
 
             if self.serialPort.isOpen():
                 if self.swState == gc.STATE_RUN:
-                    self.read()
+                    self.read(rx_ready)
                 elif self.swState == gc.STATE_ABORT:
                     # do nothing, wait to be terminated
                     pass
@@ -373,9 +608,24 @@ class SerialPortThread(threading.Thread, gc.EventQueueIf):
                 # wx.LogMessage(message)
                 break
 
-            time.sleep(0.01)
+        if self.selector is not None:
+            self.selector.close()
+            self.selector = None
+
+        for fd in [self.wakeupReadFd, self.wakeupWriteFd]:
+            if fd is not None:
+                os.close(fd)
+
+        self.wakeupReadFd = None
+        self.wakeupWriteFd = None
 
         if gc.VERBOSE_MASK & gc.VERBOSE_MASK_SERIALIF:
+            self.logger.info(f"event queue stats {self.get_event_queue_stats()}")
+
+            for histogram in list(self.perf.timers.values()):
+                for line in histogram.get_report():
+                    self.logger.info(line)
+
             self.logger.info("thread exit")
 
         self.notify_event_listeners(gc.EV_EXIT, "")
@@ -243,6 +243,23 @@ class gsatMachineStatusPanel(wx.ScrolledWindow):
         self.menu.Append(set_to_value_item)
         self.Bind(wx.EVT_MENU, self.OnSetToValue, id=set_to_value_item_id)
 
+    def UpdatePerfStats(self, perfStats):
+        machif = perfStats.get('machif', {})
+
+        counters = machif.get('counters', {})
+        linesStr = "%d/%d/%d" % (
+            counters.get('lines_sent', 0), counters.get('lines_acked', 0), counters.get('lines_errored', 0))
+
+        if self.linesStatus.GetLabel() != linesStr:
+            self.linesStatus.SetLabel(linesStr)
+
+        timer = machif.get('timers', {}).get('write_to_ack')
+        if timer is not None and timer['count']:
+            latencyStr = "p50 %.1fms p99 %.1fms" % (timer['p50'] * 1000, timer['p99'] * 1000)
+
+            if self.ackLatencyStatus.GetLabel() != latencyStr:
+                self.ackLatencyStatus.SetLabel(latencyStr)
+
     def UpdateUI(self, stateData, statusData=None):
         self.stateData = stateData
 
@@ -491,6 +508,24 @@ class gsatMachineStatusPanel(wx.ScrolledWindow):
         flexGridSizer.Add(st, 0, flag=wx.ALIGN_LEFT)
         flexGridSizer.Add(self.runTimeStatus, 0, flag=wx.ALIGN_LEFT)
 
+        # Add lines sent/acknowledged/errored
+        st = wx.StaticText(self, label="Lines sent/ack/err")
+        st.SetFont(font)
+        self.linesStatus = wx.StaticText(self, label="-/-/-")
+        self.linesStatus.SetForegroundColour(self.machineDataColor)
+        self.linesStatus.SetFont(font)
+        flexGridSizer.Add(st, 0, flag=wx.ALIGN_LEFT)
+        flexGridSizer.Add(self.linesStatus, 0, flag=wx.ALIGN_LEFT)
+
+        # Add write to acknowledge latency
+        st = wx.StaticText(self, label="Write to ack")
+        st.SetFont(font)
+        self.ackLatencyStatus = wx.StaticText(self, label="-")
+        self.ackLatencyStatus.SetForegroundColour(self.machineDataColor)
+        self.ackLatencyStatus.SetFont(font)
+        flexGridSizer.Add(st, 0, flag=wx.ALIGN_LEFT)
+        flexGridSizer.Add(self.ackLatencyStatus, 0, flag=wx.ALIGN_LEFT)
+
     def OnDroLeftUp(self, event):
         eventControl = event.GetEventObject()
         axis = None
@@ -27,6 +27,7 @@ import wx
 from wx.lib import scrolledpanel as scrolled
 import wx.propgrid as pg
 
+import modules.config as gc
 import modules.machif_config as mi
 import images.icons as ico
 
@@ -223,6 +224,20 @@ class gsatMachineSettingsPanel(scrolled.ScrolledPanel):
         self.pg.SetPropertyHelpString(
             prop, "When enabled, If a line contains one of these G-codes it wil be skipped (',' separated)")
 
+        prop = "Enable streaming"
+        self.cbStreaming = self.pg.Append(pg.BoolProperty(
+            prop, value=self.configData.get('/machine/StreamingEnable', False)))
+        self.pg.SetPropertyAttribute(prop, "UseCheckbox", True)
+        self.pg.SetPropertyHelpString(
+            prop, "When enabled, RUN keeps the device input buffer full (character counting) instead of waiting "
+            "for an acknowledge after every line")
+
+        prop = "Status max rate (Hz)"
+        self.scStatusMaxRate = self.pg.Append(pg.IntProperty(
+            prop, value=self.configData.get('/machine/StatusMaxRate', gc.STATUS_MAX_RATE)))
+        self.pg.SetPropertyHelpString(
+            prop, "Max status and output updates per second sent to each UI, 0 sends every update")
+
     def CreateMachIfSpecificCtrls(self):
         """
         Add machif specific config
@@ -351,6 +366,9 @@ class gsatMachineSettingsPanel(scrolled.ScrolledPanel):
         filterGcodeList = ",".join(filterGcodeList)
         self.configData.set('/machine/FilterGcodes', filterGcodeList)
 
+        self.configData.set('/machine/StreamingEnable', self.cbStreaming.GetValue())
+        self.configData.set('/machine/StatusMaxRate', max(0, self.scStatusMaxRate.GetValue()))
+
         self.configData.set('/machine/InitScriptEnable', self.cbInitScript.GetValue())
         self.configData.set('/machine/InitScript', self.tcInitScript.GetValue())
 
@@ -30,7 +30,6 @@ import re
 import time
 import shutil
 import logging
-import hashlib
 import wx
 
 from wx.lib.agw import aui as aui
@@ -51,6 +50,7 @@ import modules.wnd_compvision as compv
 import modules.machif_progexec as mi_progexec
 import modules.remote_client as remote_client
 import modules.remote_server as remote_server
+import modules.remote_server_async as remote_server_async
 import modules.version_info as vinfo
 
 """----------------------------------------------------------------------------
@@ -203,18 +203,30 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
         # start local server
         self.localServer = None
         if self.cmdLineOptions.server:
-            self.localServer = remote_server.RemoteServerThread(None)
+            if gc.CONFIG_DATA.get('/remote/AsyncServer', False):
+                self.localServer = remote_server_async.RemoteServerAsyncThread(None)
+            else:
+                self.localServer = remote_server.RemoteServerThread(None)
 
         self.late_init_timer = wx.Timer(self)
         self.Bind(wx.EVT_TIMER, self.InitLate, self.late_init_timer)
         self.late_init_timer.Start(500, wx.TIMER_ONE_SHOT)
 
+        # request pipeline performance counters while port is open
+        self.perfStatsTimer = wx.Timer(self)
+        self.Bind(wx.EVT_TIMER, self.OnPerfStatsTimer, self.perfStatsTimer)
+        self.perfStatsTimer.Start(int(gc.PERF_STATS_POLL_PERIOD * 1000))
+
         self.Show()
 
     def InitLate(self, event):
         if self.localServer:
             self.RemoteOpen()
 
+    def OnPerfStatsTimer(self, event):
+        if self.stateData.serialPortIsOpen:
+            self.eventForward2Machif(gc.EV_CMD_GET_PERF_STATS)
+
     def InitConfig(self):
         self.displayRuntimeDialog = self.configData.get('/mainApp/DisplayRunTimeDialog')
         self.saveBackupFile = self.configData.get('/mainApp/BackupFile')
@@ -1258,8 +1270,7 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
             self.machineJoggingPanel.UpdateSettings(self.configData)
             self.CV2Panel.UpdateSettings(self.configData)
 
-            if self.machifProgExec is not None and self.remoteClient is None:
-                self.machifProgExec.add_event(gc.EV_CMD_UPDATE_CONFIG)
+            # local machifProgExec gets machine config changes on its own
 
             # re open serial port if open
             if self.stateData.serialPortIsOpen and (
@@ -1306,7 +1317,7 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
                 if len(self.stateData.gcodeFileName):
                     runDict['gcodeFileName'] = self.stateData.gcodeFileName
 
-                h = hashlib.md5(str(self.stateData.gcodeFileLines).encode('utf-8')).hexdigest()
+                h = self.stateData.gcodeFileDigest.update(self.stateData.gcodeFileLines)
                 if self.machifProgExecGcodeMd5 != h:
                     runDict['gcodeLines'] = self.stateData.gcodeFileLines
 
@@ -1367,7 +1378,7 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
                 if len(self.stateData.gcodeFileName):
                     runDict['gcodeFileName'] = self.stateData.gcodeFileName
 
-                h = hashlib.md5(str(self.stateData.gcodeFileLines).encode('utf-8')).hexdigest()
+                h = self.stateData.gcodeFileDigest.update(self.stateData.gcodeFileLines)
                 if self.machifProgExecGcodeMd5 != h:
                     runDict['gcodeLines'] = self.stateData.gcodeFileLines
 
@@ -1665,9 +1676,16 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
             result = dlg.ShowModal()
 
             if result == wx.ID_OK:
+                # only send what changed
+                changes = {}
+                self.configRemoteData.subscribe("/", changes.update)
+
                 dlg.UpdateConfigData()
 
-                self.remoteClient.add_event(gc.EV_CMD_UPDATE_CONFIG, self.configRemoteData)
+                self.configRemoteData.unsubscribe(changes.update)
+
+                if changes:
+                    self.remoteClient.add_event(gc.EV_CMD_UPDATE_CONFIG, changes)
 
             # refresh UIs after settings updates
             self.UpdateUI()
@@ -1802,6 +1820,8 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
 
         self.configData.save()
 
+        self.perfStatsTimer.Stop()
+
         if self.remoteClient is not None:
             self.RemoteClose()
         elif self.machifProgExec is not None:
@@ -2090,7 +2110,7 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
             pass
 
         else:
-            if te.event_id == gc.EV_DATA_STATUS:
+            if te.event_id in [gc.EV_DATA_STATUS, gc.EV_MACHINE_STATE]:
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
                     self.logger.info("EV_DATA_STATUS")
 
@@ -2131,10 +2151,9 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
                     self.logger.info("EV_DATA_OUT")
 
-                self.outputText.AppendText("> %s" % te.data)
-
-                if te.data[-1:] != "\n":
-                    self.outputText.AppendText("\n")
+                # coalesced data can hold several lines
+                for line in te.data.splitlines():
+                    self.outputText.AppendText("> %s\n" % line)
 
             elif te.event_id == gc.EV_PC_UPDATE:
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
@@ -2281,6 +2300,7 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
                 if self.machifProgExec is not None:
                     self.machifProgExec.add_event(gc.EV_CMD_GET_SYSTEM_INFO)
                     self.machifProgExec.add_event(gc.EV_CMD_GET_SW_STATE)
+                    self.machifProgExec.add_event(gc.EV_CMD_GET_MACHINE_STATE)
 
                     if self.configData.get('/remote/AutoGcodeRequest', False):
                         self.machifProgExec.add_event(gc.EV_CMD_GET_GCODE)
@@ -2307,6 +2327,14 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
                 self.configRemoteData = te.data
                 self.machineStatusPanel.UpdateSettings(self.configData, self.configRemoteData)
 
+            elif te.event_id == gc.EV_RMT_CONFIG_CHANGES:
+                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                    self.logger.info("EV_RMT_CONFIG_CHANGES from 0x{:x} {}".format(id(te.sender), te.sender))
+
+                if self.configRemoteData is not None:
+                    self.configRemoteData.update(te.data)
+                    self.machineStatusPanel.UpdateSettings(self.configData, self.configRemoteData)
+
             elif te.event_id == gc.EV_RMT_HELLO:
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
                     self.logger.info("EV_RMT_HELLO from 0x{:x} {}".format(id(te.sender), te.sender))
@@ -2326,15 +2354,20 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
                 self.stateData.swState = te.data
                 self.UpdateUI()
 
+            elif te.event_id == gc.EV_PERF_STATS:
+                if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
+                    self.logger.info("EV_PERF_STATS")
+
+                self.machineStatusPanel.UpdatePerfStats(te.data)
+
             elif te.event_id == gc.EV_GCODE_MD5:
                 if gc.VERBOSE_MASK & gc.VERBOSE_MASK_UI_EV:
                     self.logger.info("EV_GCODE_MD5")
 
                 self.machifProgExecGcodeMd5 = te.data
 
-                h = hashlib.md5(str([]).encode('utf-8')).hexdigest()
-                if h != te.data and self.machifProgExec is not None:
-                    h = hashlib.md5(str(self.stateData.gcodeFileLines).encode('utf-8')).hexdigest()
+                if gc.GCODE_EMPTY_DIGEST != te.data and self.machifProgExec is not None:
+                    h = self.stateData.gcodeFileDigest.update(self.stateData.gcodeFileLines)
                     if h != te.data and self.configData.get('/remote/AutoGcodeRequest', False):
                         self.machifProgExec.add_event(gc.EV_CMD_GET_GCODE)
 
@@ -2394,7 +2427,7 @@ class gsatMainWindow(wx.Frame, gc.EventQueueIf):
                         self.stateData.fileIsOpen = True
                         rawText = self.gcText.GetText()
                         self.stateData.gcodeFileLines = rawText.splitlines(True)
-                        h = hashlib.md5(str(self.stateData.gcodeFileLines).encode('utf-8')).hexdigest()
+                        h = self.stateData.gcodeFileDigest.update(self.stateData.gcodeFileLines)
                         self.machifProgExecGcodeMd5 = h
 
                         if 'gcodePC' in te.data:
@@ -0,0 +1,198 @@
+"""----------------------------------------------------------------------------
+    test_device_sim.py
+
+    Copyright (C) 2020 Wilhelm Duembeg
+
+    This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+    Grbl like GCODE interpreters. With features similar to software debuggers.
+    Features such as breakpoint, change current program counter, inspection
+    and modification of variables.
+
+    gsat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.
+
+    gsat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+
+import time
+
+import pytest
+
+import modules.config as gc
+import modules.device_sim as ds
+import modules.machif_grbl as mi_grbl
+import modules.serial_thread as st
+
+
+def run(device, now, data=b""):
+    """
+    Write data at time now, return device output as text
+
+    """
+    device.write(data, now)
+    return device.read().decode('utf-8')
+
+
+def test_grbl_init_and_ack():
+    grbl = ds.DeviceSim_GRBL(block_time=0.1)
+
+    assert "Grbl 1.1f" in run(grbl, 0)
+    assert run(grbl, 0, b"G1 X10 F1000\n") == "ok\r\n"
+    assert run(grbl, 0.05, b"?") == "<Run|MPos:0.000,0.000,0.000|FS:1000,0>\r\n"
+    assert run(grbl, 0.1, b"?") == "<Idle|MPos:10.000,0.000,0.000|FS:0,0>\r\n"
+
+
+def test_grbl_errors():
+    grbl = ds.DeviceSim_GRBL()
+    grbl.read()
+
+    assert run(grbl, 0, b"G77\n") == "error:20\r\n"
+    assert run(grbl, 0, b"M999\n") == "error:20\r\n"
+    assert run(grbl, 0, b"G1 X\n") == "error:1\r\n"
+    assert run(grbl, 0, b"$999=1\n") == "ok\r\n"
+    assert run(grbl, 0, b"$BAD\n") == "error:3\r\n"
+    assert grbl.errorCount == 4
+
+
+def test_grbl_planner_and_rx_buffer():
+    grbl = ds.DeviceSim_GRBL(block_time=1.0)
+    grbl.read()
+
+    # planner full, the rest waits in the rx buffer, no ack until executed
+    lines = b"".join(b"G1 X%d\n" % i for i in range(20))
+    assert run(grbl, 0, lines).count("ok") == grbl.PLANNER_SIZE
+    assert grbl.rxOverflowCount == 0
+
+    assert run(grbl, 1.0).count("ok") == 1
+    assert run(grbl, 10.0).count("ok") == 4
+
+    # more than the rx buffer holds while the planner is full
+    grbl = ds.DeviceSim_GRBL(block_time=1.0)
+    run(grbl, 0, b"G1 X1\n" * (grbl.PLANNER_SIZE + grbl.RX_BUFFER_SIZE))
+    assert grbl.rxOverflowCount > 0
+
+
+def test_grbl_hold_resume():
+    grbl = ds.DeviceSim_GRBL(block_time=1.0)
+    grbl.read()
+
+    run(grbl, 0, b"G1 X1\nG1 X2\n")
+    assert run(grbl, 0.5, b"!?").startswith("<Hold|")
+
+    # time on hold doesn't count
+    assert run(grbl, 5.0, b"~?").startswith("<Run|MPos:0.000,")
+    assert run(grbl, 6.0, b"?").startswith("<Run|MPos:1.000,")
+    assert run(grbl, 7.0, b"?").startswith("<Idle|MPos:2.000,")
+
+
+def test_grbl_reset_while_moving():
+    grbl = ds.DeviceSim_GRBL(block_time=1.0)
+    grbl.read()
+
+    run(grbl, 0, b"G1 X1\n")
+    out = run(grbl, 0.5, b"\x18")
+    assert "ALARM:3" in out and "Grbl 1.1f" in out
+
+    assert run(grbl, 0.5, b"G1 X1\n") == "error:9\r\n"
+    assert "Unlocked" in run(grbl, 0.5, b"$X\n")
+    assert run(grbl, 0.5, b"G1 X1\n") == "ok\r\n"
+
+
+@pytest.mark.parametrize("name", sorted(ds.SIM_DEVICE_DICT))
+def test_every_line_answered(name):
+    device = ds.SIM_DEVICE_DICT[name](block_time=0.01)
+    device.read()
+
+    lines = [b"G1 X%d F1000\n" % i for i in range(200)] + [b"G77\n"]
+    out = ""
+    now = 0.0
+
+    for line in lines:
+        now += 0.01
+        out += run(device, now, line)
+
+    out += run(device, now + 10)
+    assert device.lineCount == len(lines)
+    assert device.errorCount == 1
+    assert device.rxOverflowCount == 0
+
+    if name in ["tinyg", "g2core"]:
+        assert out.count('"f":[1,') == len(lines)
+    else:
+        assert out.count("ok\r\n") + out.count("error:") == len(lines)
+
+
+def test_grbl_decoded_by_machif():
+    grbl = ds.DeviceSim_GRBL(block_time=0.1)
+    machif = mi_grbl.MachIf_GRBL()
+    framer = st.SerialLineFramer()
+
+    decoded = [machif.decode(line) for line in framer.feed(grbl.read())]
+    assert decoded[-1]['r']['machif'] == machif.getName()
+
+    grbl.write(b"G1 X10 Y5 F600\n", 0)
+    grbl.write(b"?", 0.05)
+    decoded = [machif.decode(line) for line in framer.feed(grbl.read())]
+
+    assert 'r' in decoded[0]
+    assert decoded[1]['sr']['stat'] == "Run"
+
+
+class Listener(gc.EventQueueIf):
+    pass
+
+
+def wait_for_event(listener, event_ids, timeout):
+    end = time.time() + timeout
+
+    while time.time() < end:
+        for e in listener.get_events():
+            if e.event_id in event_ids:
+                return e.event_id
+
+        time.sleep(0.01)
+
+    return None
+
+
+@pytest.mark.parametrize("device", ["grbl", "TinyG", "g2core", "Smoothie"])
+def test_stream_program(config, device):
+    """
+    Stream program to simulated device through the execution thread
+
+    """
+    import modules.machif_progexec as mi_progexec
+
+    config.set('/machine/Device', device)
+    config.set('/machine/Port', "sim:{}?block_time=0.002".format(device))
+    config.set('/machine/StreamingEnable', True)
+
+    listener = Listener()
+    exec_thread = mi_progexec.MachIfExecuteThread(listener)
+
+    try:
+        assert wait_for_event(listener, [gc.EV_SER_PORT_OPEN], 10) == gc.EV_SER_PORT_OPEN
+
+        lines = ["G1 X{} F1000\n".format(i) for i in range(100)]
+        exec_thread.add_event(gc.EV_CMD_RUN, {'gcodeLines': lines, 'gcodePC': 0, 'breakPoints': set()})
+
+        assert wait_for_event(listener, [gc.EV_RUN_END, gc.EV_BRK_PT_STOP], 30) == gc.EV_RUN_END
+
+        # run ends when the last line is sent, every line gets acknowledged
+        end = time.time() + 10
+        while exec_thread.machIfModule.getInputBufferLineCount() and time.time() < end:
+            time.sleep(0.01)
+
+        assert exec_thread.machIfModule.getInputBufferLineCount() == 0
+    finally:
+        exec_thread.add_event(gc.EV_CMD_EXIT)
+        exec_thread.join(10)
@@ -0,0 +1,87 @@
+"""----------------------------------------------------------------------------
+    test_grbl_status.py
+
+    Copyright (C) 2020 Wilhelm Duembeg
+
+    This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+    Grbl like GCODE interpreters. With features similar to software debuggers.
+    Features such as breakpoint, change current program counter, inspection
+    and modification of variables.
+
+    gsat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.
+
+    gsat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+
+import pytest
+
+import modules.machif_grbl as mi_grbl
+
+
+@pytest.fixture
+def grbl():
+    return mi_grbl.MachIf_GRBL()
+
+
+def test_grbl11_status(grbl):
+    sr = grbl.decode("<Run|MPos:12.345,-3.210,-1.000|FS:1200,12000|Ov:100,90,80|A:SF>\r\n")['sr']
+
+    assert sr['stat'] == "Run"
+    assert (sr['posx'], sr['posy'], sr['posz']) == (12.345, -3.21, -1.0)
+    assert (sr['vel'], sr['spe']) == (1200.0, 12000.0)
+    assert sr['ov'] == [100, 90, 80]
+    assert sr['acc'] == "SF"
+    assert grbl.machineStatus == mi_grbl.GRBL_STATE_RUN
+
+
+def test_grbl11_status_wco(grbl):
+    # work position is machine position minus work coordinate offset,
+    # offset is remembered for reports that don't carry it
+    sr = grbl.decode("<Idle|MPos:1.000,2.000,3.000|FS:0,0|WCO:-10.000,-20.000,-5.000>\n")['sr']
+    assert sr['wco'] == [-10.0, -20.0, -5.0]
+    assert (sr['posx'], sr['posy'], sr['posz']) == (11.0, 22.0, 8.0)
+
+    sr = grbl.decode("<Idle|MPos:0.000,0.000,0.000|FS:0,0>\n")['sr']
+    assert 'wco' not in sr
+    assert (sr['posx'], sr['posy'], sr['posz']) == (10.0, 20.0, 5.0)
+
+
+def test_grbl11_status_substate(grbl):
+    sr = grbl.decode("<Hold:0|WPos:1.000,2.000,3.000|Bf:15,128|Ln:42|F:500>\n")['sr']
+
+    assert (sr['stat'], sr['substat']) == ("Hold", 0)
+    assert (sr['posx'], sr['posy'], sr['posz']) == (1.0, 2.0, 3.0)
+    assert sr['bf'] == [15, 128]
+    assert sr['line'] == 42
+    assert sr['vel'] == 500.0
+
+
+def test_grbl09_status(grbl):
+    sr = grbl.decode("<Run,MPos:5.000,6.000,7.000,WPos:1.000,2.000,3.000,Buf:3,RX:20>\n")['sr']
+
+    assert sr['stat'] == "Run"
+    assert (sr['posx'], sr['posy'], sr['posz']) == (1.0, 2.0, 3.0)
+    assert grbl.machineStatus == mi_grbl.GRBL_STATE_RUN
+
+    sr = grbl.decode("<Idle,MPos:5.000,6.000,7.000>\n")['sr']
+    assert sr['stat'] == "Idle"
+    assert (sr['posx'], sr['posy'], sr['posz']) == (5.0, 6.0, 7.0)
+
+
+@pytest.mark.parametrize("line", [
+    "<Idle|MPos:1.000,2.0",
+    "<Idle|MPos:a,b,c>\n",
+    "<Run,MPos:5.000,6.000,7.0.0,WPos:1.000,2.000,3.000>\n",
+])
+def test_malformed_status(grbl, line):
+    assert grbl.decode(line) == {}
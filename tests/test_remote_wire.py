@@ -0,0 +1,181 @@
+"""----------------------------------------------------------------------------
+    test_remote_wire.py
+
+    Copyright (C) 2020 Wilhelm Duembeg
+
+    This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+    Grbl like GCODE interpreters. With features similar to software debuggers.
+    Features such as breakpoint, change current program counter, inspection
+    and modification of variables.
+
+    gsat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.
+
+    gsat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+
+import io
+import os
+import pickle
+
+import pytest
+
+import modules.config as gc
+
+
+STATUS = {
+    'sr': {'stat': 'Run', 'posx': 12.345, 'posy': -3.21, 'posz': 0.1 + 0.2, 'vel': 1200.0,
+           'ib': [127, 35], 'ov': [100, 100, 100], 'line': 2 ** 40, 'acc': None, 'hold': False},
+    'rx_data': "<Run|MPos:12.345,-3.210,-1.000|FS:1200,12000> °",
+}
+
+
+def round_trip(event, wire_version=gc.REMOTE_WIRE_VERSION, min_size=gc.REMOTE_COMPRESS_MIN_SIZE):
+    msg = gc.remote_msg_compress(gc.remote_msg_encode(event, wire_version), min_size)
+    return gc.remote_msg_decode(gc.remote_msg_decompress(msg))
+
+
+def test_binary_round_trip():
+    event = gc.SimpleEvent(gc.EV_DATA_STATUS, STATUS, 1234)
+    msg = gc.remote_msg_encode(event)
+
+    assert msg[0] == gc.REMOTE_WIRE_MAGIC
+    assert gc.get_remote_msg_version(msg) == gc.REMOTE_WIRE_VERSION
+
+    decoded = gc.remote_msg_decode(msg)
+    assert decoded.event_id == gc.EV_DATA_STATUS
+    assert decoded.sender == 1234
+    assert decoded.data == STATUS
+
+
+def test_pickle_for_legacy_peer_and_cold_events():
+    event = gc.SimpleEvent(gc.EV_DATA_STATUS, STATUS)
+    msg = gc.remote_msg_encode(event, wire_version=0)
+    assert gc.get_remote_msg_version(msg) == 0
+    assert gc.remote_msg_decode(msg).data == STATUS
+
+    event = gc.SimpleEvent(gc.EV_CMD_RUN, {'gcodeLines': ["G0 X1\n"], 'breakPoints': set([1, 2])})
+    msg = gc.remote_msg_encode(event)
+    assert gc.get_remote_msg_version(msg) == 0
+    assert gc.remote_msg_decode(msg).data == event.data
+
+
+def test_unsupported_value_falls_back_to_pickle():
+    event = gc.SimpleEvent(gc.EV_DATA_OUT, {'pc': set([1])})
+    msg = gc.remote_msg_encode(event)
+
+    assert gc.get_remote_msg_version(msg) == 0
+    assert gc.remote_msg_decode(msg).data == event.data
+
+
+@pytest.mark.parametrize("wire_version", [0, gc.REMOTE_WIRE_VERSION])
+def test_zlib_round_trip(wire_version):
+    event = gc.SimpleEvent(gc.EV_DATA_OUT, "ok\n" * 2000)
+    msg = gc.remote_msg_compress(gc.remote_msg_encode(event, wire_version))
+
+    assert msg[0] == gc.REMOTE_ZLIB_MAGIC
+    assert round_trip(event, wire_version).data == event.data
+
+
+def test_compress_skips_small_and_incompressible():
+    small = gc.remote_msg_encode(gc.SimpleEvent(gc.EV_DATA_OUT, "ok\n"))
+    assert gc.remote_msg_compress(small) is small
+
+    noise = os.urandom(2048)
+    assert gc.remote_msg_compress(noise, 1) is noise
+    assert gc.remote_msg_compress(noise, 0) is noise
+
+
+def test_decompress_malformed():
+    msg = gc.remote_msg_compress(gc.remote_msg_encode(gc.SimpleEvent(gc.EV_DATA_OUT, "ok\n" * 2000)))
+
+    with pytest.raises(ValueError):
+        gc.remote_msg_decompress(msg[:len(msg) // 2])
+
+    with pytest.raises(ValueError):
+        gc.remote_msg_decompress(bytes([gc.REMOTE_ZLIB_MAGIC]) + b"not zlib data")
+
+
+def test_truncated_frames():
+    msg = gc.remote_msg_encode(gc.SimpleEvent(gc.EV_DATA_STATUS, STATUS, 1))
+
+    for end in range(len(msg)):
+        with pytest.raises(ValueError):
+            gc.remote_msg_decode(msg[:end])
+
+
+def test_malformed_frames():
+    msg = gc.remote_msg_encode(gc.SimpleEvent(gc.EV_DATA_OUT, "ok\n"))
+
+    # trailing data
+    with pytest.raises(ValueError):
+        gc.remote_msg_decode(msg + b"\0")
+
+    # unsupported version
+    with pytest.raises(ValueError):
+        gc.remote_msg_decode(msg[:1] + bytes([gc.REMOTE_WIRE_VERSION + 1]) + msg[2:])
+
+    header = gc.wire_header.pack(gc.REMOTE_WIRE_MAGIC, gc.REMOTE_WIRE_VERSION, gc.EV_DATA_OUT)
+
+    # unknown type tag
+    with pytest.raises(ValueError):
+        gc.remote_msg_decode(header + bytes([gc.WIRE_NONE, 0xFF]))
+
+    # unknown field id
+    with pytest.raises(ValueError):
+        gc.remote_msg_decode(header + bytes([gc.WIRE_NONE, gc.WIRE_DICT, 1, 0, 0xFF, gc.WIRE_NONE]))
+
+    # string length past end of message
+    with pytest.raises(ValueError):
+        gc.remote_msg_decode(header + bytes([gc.WIRE_NONE]) + gc.wire_tag_u32.pack(gc.WIRE_STR32, 1000) + b"ok")
+
+    # nested too deep
+    with pytest.raises(ValueError):
+        gc.remote_msg_decode(header + bytes([gc.WIRE_NONE]) + gc.wire_tag_u16.pack(gc.WIRE_LIST, 1) * 64)
+
+    with pytest.raises(ValueError):
+        gc.remote_msg_decode(b"")
+
+
+def test_magic_detection():
+    assert gc.get_remote_msg_version(b"") == 0
+    assert gc.get_remote_msg_version(bytes([gc.REMOTE_WIRE_MAGIC])) == 0
+    assert gc.get_remote_msg_version(bytes([gc.REMOTE_WIRE_MAGIC, 7])) == 7
+
+    # pickle protocol 2+ starts with PROTO opcode, never the wire magic
+    assert pickle.dumps(gc.SimpleEvent(gc.EV_HELLO, None), protocol=2)[0] != gc.REMOTE_WIRE_MAGIC
+
+    # not compressed data goes through as is
+    msg = gc.remote_msg_encode(gc.SimpleEvent(gc.EV_DATA_OUT, "ok\n"))
+    assert gc.remote_msg_decompress(msg) is msg
+
+
+class Exploit(object):
+    def __reduce__(self):
+        return (print, ("should never run",))
+
+
+def test_unpickler_allow_list():
+    with pytest.raises(ValueError):
+        gc.remote_msg_decode(pickle.dumps(gc.SimpleEvent(gc.EV_DATA_OUT, Exploit()), protocol=5))
+
+    with pytest.raises(pickle.UnpicklingError):
+        gc.RemoteUnpickler(io.BytesIO(pickle.dumps(Exploit(), protocol=5))).load()
+
+    # allowed classes, but not an event
+    with pytest.raises(ValueError):
+        gc.remote_msg_decode(pickle.dumps(set([1, 2]), protocol=5))
+
+    config = gc.ConfigData()
+    config.set('/machine/Port', "sim:grbl")
+    event = gc.remote_msg_decode(pickle.dumps(gc.SimpleEvent(gc.EV_CMD_UPDATE_CONFIG, config), protocol=2))
+    assert event.data.get('/machine/Port') == "sim:grbl"
@@ -0,0 +1,71 @@
+"""----------------------------------------------------------------------------
+    test_serial_framer.py
+
+    Copyright (C) 2020 Wilhelm Duembeg
+
+    This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+    Grbl like GCODE interpreters. With features similar to software debuggers.
+    Features such as breakpoint, change current program counter, inspection
+    and modification of variables.
+
+    gsat is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 2 of the License, or
+    (at your option) any later version.
+
+    gsat is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+
+import modules.serial_thread as st
+
+
+def test_lines_and_partial_line():
+    framer = st.SerialLineFramer()
+
+    assert framer.feed(b"ok\r\nok\r\n<Idle|MPos") == ["ok\r", "ok\r"]
+    assert framer.feed(b":0.000,0.000,0.000>") == []
+    assert framer.feed(b"\r\n") == ["<Idle|MPos:0.000,0.000,0.000>\r"]
+    assert framer.feed(b"\n\n") == ["", ""]
+
+
+def test_utf8_split_across_reads():
+    text = "[MSG:Température 25°C — ok]\n"
+    data = text.encode('utf-8')
+
+    # every split point, including inside multi-byte sequences
+    for split in range(len(data) + 1):
+        framer = st.SerialLineFramer()
+        lines = framer.feed(data[:split]) + framer.feed(data[split:])
+        assert lines == [text.rstrip('\n')]
+
+
+def test_utf8_byte_by_byte():
+    text = "ok\n°°°\nöäü\n"
+    framer = st.SerialLineFramer()
+    lines = []
+
+    for b in text.encode('utf-8'):
+        lines += framer.feed(bytes([b]))
+
+    assert lines == ["ok", "°°°", "öäü"]
+
+
+def test_invalid_utf8_replaced():
+    framer = st.SerialLineFramer()
+
+    assert framer.feed(b"ok\xff\n") == ["ok�"]
+
+
+def test_reset_drops_partial_line():
+    framer = st.SerialLineFramer()
+
+    assert framer.feed(b"Grbl 1.1f [") == []
+    framer.reset()
+    assert framer.feed(b"ok\n") == ["ok"]
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+"""----------------------------------------------------------------------------
+   grbl_decode_bench.py:
+
+   Copyright (C) 2020 Wilhelm Duembeg
+
+   This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+   Grbl like GCODE interpreters. With features similar to software debuggers.
+   Features such as breakpoint, change current program counter, inspection
+   and modification of variables.
+
+   gsat is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 2 of the License, or
+   (at your option) any later version.
+
+   gsat is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.config as gc  # noqa: E402
+import modules.machif_grbl as mi_grbl  # noqa: E402
+
+__appname__ = "gsat grbl decode benchmark"
+
+__description__ = \
+    "decodes recorded grbl traffic with the machine interface decoder and " \
+    "with the previous regex decoder and reports time per line"
+
+__version_info__ = (1, 0, 0)
+__version__ = 'v%i.%i.%i' % __version_info__
+__revision__ = __version__
+
+# grbl 1.1f session, connect and settings dump
+RECORDED_SESSION_HEAD = [
+    "Grbl 1.1f ['$' for help]\n",
+    "[VER:1.1f.20170801:]\n",
+    "[OPT:V,15,128]\n",
+    "ok\n",
+    "$0=10\n",
+    "$1=25\n",
+    "$10=1\n",
+    "$100=250.000\n",
+    "$101=250.000\n",
+    "$102=250.000\n",
+    "$110=500.000\n",
+    "ok\n",
+    "<Idle|MPos:0.000,0.000,0.000|FS:0,0|WCO:-10.000,-20.000,-5.000>\n",
+]
+
+# grbl 1.1f session, job streaming with status query every 200ms
+RECORDED_SESSION_BODY = [
+    "ok\n",
+    "ok\n",
+    "ok\n",
+    "<Run|MPos:12.345,-3.210,-1.000|FS:1200,12000|Ov:100,100,100|A:S>\n",
+    "ok\n",
+    "ok\n",
+    "ok\n",
+    "ok\n",
+    "<Run|MPos:14.005,-3.870,-1.000|FS:1200,12000>\n",
+    "ok\n",
+    "ok\n",
+    "ok\n",
+    "ok\n",
+    "<Run|MPos:16.113,-4.250,-1.000|Bf:12,87|Ln:1042|FS:1200,12000|WCO:-10.000,-20.000,-5.000>\n",
+    "ok\n",
+    "ok\n",
+    "ok\n",
+    "ok\n",
+    "<Hold:1|MPos:17.400,-4.500,-1.000|FS:300,12000|Pn:P>\n",
+    "ok\n",
+    "error:20\n",
+    "ok\n",
+    "ok\n",
+    "<Run|MPos:18.000,-4.800,-1.000|FS:1200,12000|Ov:110,100,100>\n",
+]
+
+
+class MachIf_GRBL_Regex(mi_grbl.MachIf_GRBL):
+    """
+    Previous grbl decoder, runs every regex on each line, kept here as
+    the benchmark baseline (logging removed)
+
+    """
+
+    reGrblVersion = re.compile(r'\[VER:(.*):.*\]')
+    reGrblInitStr = re.compile(r'(Grbl\s*(.*)\s*\[.*\])')
+    reGrblMachineStatus = re.compile(r'<(\w+)[:]{0,1}[\d]*[,\|].*[W|M]Pos:(.+)\|FS:(\d+),(\d+)')
+    reGrblAxes = re.compile(r'([+-]{0,1}\d+\.\d+),')
+    reGrblMachineAck = re.compile(r'^ok\s$')
+    reGrblMachineError = re.compile(r'^error:(\d+)\s$')
+    reGrblAlarm = re.compile(r'ALARM:(\d+)')
+    reGrblConfig = re.compile(r'^\$(\d+)=\d+.*\s*')
+
+    def decode(self, data):
+        dataDict = {}
+
+        status = self.reGrblMachineStatus.match(data)
+        if status is not None:
+            statusData = status.groups()
+            sr = {}
+
+            bufferPart = 1
+
+            if (self._inputBufferSize >= bufferPart):
+                self._inputBufferSize = self._inputBufferSize - bufferPart
+            else:
+                bufferPart = 0
+
+            sr['stat'] = statusData[0]
+            sr['vel'] = float(statusData[2])
+
+            axes = self.reGrblAxes.findall('%s,' % statusData[1])
+            if len(axes):
+
+                for i in range(len(axes)):
+                    sr['pos%s' % self.axes_list[i]] = float(axes[i])
+
+            dataDict['sr'] = sr
+
+            decodedStatus = self.stat_dict.get(statusData[0], mi_grbl.GRBL_STATE_UNKNOWN)
+
+            self.machineStatus = decodedStatus
+
+            sr['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
+
+        ack = self.reGrblMachineAck.search(data)
+        if ack is not None:
+            bufferPart = 0
+
+            if len(self._inputBufferPart) > 0:
+                bufferPart = self._inputBufferPart.pop(0)
+
+            self._inputBufferSize = self._inputBufferSize - bufferPart
+
+            r = {}
+            dataDict['r'] = r
+            dataDict['f'] = [0, 0, bufferPart]
+            dataDict['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
+
+        alarm = self.reGrblAlarm.search(data)
+        if alarm is not None:
+            if 'sr' in dataDict:
+                sr = dataDict.get('sr')
+            else:
+                sr = {}
+
+            sr['stat'] = "Alarm"
+            sr['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
+
+            dataDict['sr'] = sr
+
+            alarm_code = alarm.group(1).strip()
+            if alarm_code.isdigit():
+                alarm_code = int(alarm_code)
+                alarm_str = "[MSG: %s]\n" % (mi_grbl.GRBL_ALARM_CODE_2_STR_DICT.get(alarm_code, "Unknown"))
+                dataDict['rx_data_info'] = alarm_str
+
+        error = self.reGrblMachineError.search(data)
+        if error is not None:
+            bufferPart = 0
+
+            if len(self._inputBufferPart) > 0:
+                bufferPart = self._inputBufferPart.pop(0)
+
+            self._inputBufferSize = self._inputBufferSize - bufferPart
+
+            if 'r' not in dataDict:
+                r = {}
+                dataDict['r'] = r
+
+            error_code = error.group(1).strip()
+            if error_code.isdigit():
+                error_code = int(error_code)
+                err_str = "[MSG: %s]\n" % (mi_grbl.GRBL_ERROR_CODE_2_STR_DICT.get(error_code, "Unknown"))
+                dataDict['rx_data_info'] = err_str
+            else:
+                error_code = -1
+
+            dataDict['f'] = [0, error_code, bufferPart, error_code]
+            dataDict['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
+
+        version = self.reGrblVersion.match(data)
+        if version is not None:
+            if 'r' not in dataDict:
+                r = {}
+                dataDict['r'] = r
+
+            dataDict['r']['fb'] = version.group(1)
+            dataDict['r']['machif'] = self.getName()
+            dataDict['f'] = [0, 0, 0]
+            dataDict['ib'] = [self._inputBufferMaxSize, self._inputBufferSize]
+            self.systemInfo = data
+
+        initStr = self.reGrblInitStr.match(data)
+        if initStr is not None:
+            self.initStringDetectFlag = True
+
+            if 'r' not in dataDict:
+                r = {}
+                dataDict['r'] = r
+
+            dataDict['r']['init'] = initStr.group(1).strip()
+            dataDict['r']['machif'] = self.getName()
+
+        config = self.reGrblConfig.match(data)
+        if config is not None:
+            data_len = len(data)
+            fill = 20 - data_len
+            dataDict['rx_data_info'] = "%s%s\n" % (' '*fill, mi_grbl.GRBL_CONFIG_2_STR_DICT.get(int(config.group(1)), ""))
+
+        return dataDict
+
+
+def get_cli_params():
+    """
+    define, retrieve and error check command line interface (cli) params
+
+    """
+    parser = argparse.ArgumentParser(description=__description__)
+
+    parser.add_argument(
+        '-V', '--version',
+        action='version',
+        version=f"{sys.argv[0]} {__revision__} ({__appname__})")
+
+    parser.add_argument(
+        "-f", "--file",
+        dest="file",
+        default=None,
+        help="recorded grbl rx traffic, one line per response (default is a built in grbl 1.1f session)")
+
+    parser.add_argument(
+        "-n", "--lines",
+        dest="lines",
+        type=int,
+        default=100000,
+        help="lines to decode per pass, recording is repeated as needed")
+
+    parser.add_argument(
+        "-r", "--repeat",
+        dest="repeat",
+        type=int,
+        default=5,
+        help="passes per decoder, best pass is reported")
+
+    return parser.parse_args()
+
+
+def get_traffic(options):
+    if options.file is None:
+        head = RECORDED_SESSION_HEAD
+        body = RECORDED_SESSION_BODY
+    else:
+        with open(options.file) as f:
+            head = []
+            body = [f"{line.strip()}\n" for line in f if line.strip()]
+
+    traffic = list(head)
+    while len(traffic) < options.lines:
+        traffic.extend(body)
+
+    return traffic[:options.lines]
+
+
+def run_decoder(decoder, traffic):
+    """
+    Decode all lines, input buffer bookkeeping is primed (in device sized
+    chunks) so every acknowledge finds a line to release
+
+    """
+    chunks = [traffic[i:i + 64] for i in range(0, len(traffic), 64)]
+    decode = decoder.decode
+    timeStart = time.perf_counter()
+
+    for chunk in chunks:
+        decoder._inputBufferPart = [1] * 64
+        decoder._inputBufferSize = 64
+
+        for line in chunk:
+            decode(line)
+
+    return time.perf_counter() - timeStart
+
+
+def check_decoders(traffic, decoder, baseline):
+    """
+    Count lines where acknowledge, error and state results differ
+
+    """
+    mismatches = 0
+
+    for line in traffic:
+        for d in [decoder, baseline]:
+            d._inputBufferPart = [1]
+            d._inputBufferSize = 1
+
+        a = decoder.decode(line)
+        b = baseline.decode(line)
+
+        if (a.get('f'), a.get('r'), a.get('sr', {}).get('stat')) != \
+           (b.get('f'), b.get('r'), b.get('sr', {}).get('stat')):
+            mismatches += 1
+
+    return mismatches
+
+
+def main():
+    gc.init_config(None, None, None)
+
+    options = get_cli_params()
+    traffic = get_traffic(options)
+
+    decoder = mi_grbl.MachIf_GRBL()
+    baseline = MachIf_GRBL_Regex()
+
+    def get_usec_per_line(lines):
+        usec = {}
+        for name, d in [('regex', baseline), ('dispatch', decoder)]:
+            usec[name] = 1000000 * min(run_decoder(d, lines) for i in range(options.repeat)) / len(lines)
+        return usec
+
+    usec = get_usec_per_line(traffic)
+    report = {
+        'lines': len(traffic),
+        'regex_usec_per_line': round(usec['regex'], 3),
+        'dispatch_usec_per_line': round(usec['dispatch'], 3),
+        'speedup': round(usec['regex'] / usec['dispatch'], 2),
+        'mismatches': check_decoders(traffic, decoder, baseline),
+        'by_first_char': {},
+    }
+
+    # break down by response kind
+    for lead in sorted(set(line[:1] for line in traffic)):
+        lines = [line for line in traffic if line[:1] == lead]
+        usec = get_usec_per_line(lines)
+        report['by_first_char'][lead] = {
+            'lines': len(lines),
+            'regex_usec_per_line': round(usec['regex'], 3),
+            'dispatch_usec_per_line': round(usec['dispatch'], 3),
+        }
+
+    print(json.dumps(report, indent=2))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
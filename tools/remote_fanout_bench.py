@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""----------------------------------------------------------------------------
+   remote_fanout_bench.py:
+
+   Copyright (C) 2020 Wilhelm Duembeg
+
+   This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+   Grbl like GCODE interpreters. With features similar to software debuggers.
+   Features such as breakpoint, change current program counter, inspection
+   and modification of variables.
+
+   gsat is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 2 of the License, or
+   (at your option) any later version.
+
+   gsat is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.config as gc  # noqa: E402
+import modules.remote_server as remote_server  # noqa: E402
+import modules.remote_server_async as remote_server_async  # noqa: E402
+
+__appname__ = "gsat remote fan-out benchmark"
+
+__description__ = \
+    "streams status through the remote server to many clients and reports " \
+    "the time from status queued at the server to status decoded by each client"
+
+__version_info__ = (1, 0, 0)
+__version__ = 'v%i.%i.%i' % __version_info__
+__revision__ = __version__
+
+SERVERS = {
+    'select': remote_server.RemoteServerThread,
+    'asyncio': remote_server_async.RemoteServerAsyncThread,
+}
+
+
+def get_cli_params():
+    """
+    define, retrieve and error check command line interface (cli) params
+
+    """
+    parser = argparse.ArgumentParser(description=__description__)
+
+    parser.add_argument(
+        '-V', '--version',
+        action='version',
+        version=f"{sys.argv[0]} {__revision__} ({__appname__})")
+
+    parser.add_argument(
+        "-s", "--server",
+        dest="server",
+        choices=sorted(SERVERS.keys()) + ['all'],
+        default='all',
+        help="remote server implementation (default is all)")
+
+    parser.add_argument(
+        "-c", "--clients",
+        dest="clients",
+        default="1,10,50",
+        help="connected client counts, comma separated")
+
+    parser.add_argument(
+        "-r", "--rate",
+        dest="rate",
+        type=float,
+        default=200,
+        help="status messages per second")
+
+    parser.add_argument(
+        "-t", "--time",
+        dest="time",
+        type=float,
+        default=3,
+        help="seconds of status per run")
+
+    parser.add_argument(
+        "-p", "--port",
+        dest="port",
+        type=int,
+        default=61811,
+        help="server TCP port")
+
+    return parser.parse_args()
+
+
+def get_frame(event):
+    msg_data = gc.remote_msg_encode(event, 0)
+    return "{:{header_size}}".format(len(msg_data), header_size=gc.SOCK_HEADER_SIZE).encode('utf-8') + msg_data
+
+
+class BenchClient(object):
+    """
+    Minimal remote client, reads status and records latency
+
+    """
+
+    def __init__(self, send_times):
+        self.sendTimes = send_times
+        self.latency = []
+        self.lastVersion = -1
+        self.ready = asyncio.Event()
+
+    async def run(self, port, last_version):
+        reader, writer = await asyncio.open_connection('localhost', port)
+
+        hello = {'wire': gc.REMOTE_WIRE_VERSION, 'gcodeChunks': False, 'zlib': False}
+        writer.write(get_frame(gc.SimpleEvent(gc.EV_RMT_HELLO, hello, 0)))
+
+        try:
+            while self.lastVersion < last_version[0]:
+                msg_header = await reader.readexactly(gc.SOCK_HEADER_SIZE)
+                msg = await reader.readexactly(int(msg_header.decode('utf-8')))
+                time_now = time.perf_counter()
+                e = gc.remote_msg_decode(gc.remote_msg_decompress(msg))
+
+                if e.event_id == gc.EV_RMT_HELLO and isinstance(e.data, dict):
+                    self.ready.set()
+
+                elif e.event_id == gc.EV_DATA_STATUS:
+                    self.lastVersion = e.data['ver']
+                    self.latency.append(time_now - self.sendTimes[self.lastVersion])
+        finally:
+            writer.close()
+
+
+def send_status(server, send_times, last_version, rate, seconds):
+    """
+    Queue status at the server the way the exec thread does
+
+    """
+    count = int(rate * seconds)
+    time_start = time.perf_counter()
+
+    for i in range(count):
+        time_next = time_start + i / rate
+        time_wait = time_next - time.perf_counter()
+        if time_wait > 0:
+            time.sleep(time_wait)
+
+        if i == count - 1:
+            last_version[0] = i
+
+        status = {'stat': "Run", 'posx': i % 1000 / 10, 'posy': 12.5, 'posz': -1.0, 'vel': 1200.0, 'ver': i}
+        send_times[i] = time.perf_counter()
+        server.add_event(gc.EV_DATA_STATUS, status)
+
+
+def get_percentile(samples, percentile):
+    return samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+
+
+async def run_clients(server, options, client_count):
+    send_times = {}
+    last_version = [sys.maxsize]
+    clients = [BenchClient(send_times) for i in range(client_count)]
+    tasks = [asyncio.ensure_future(c.run(options.port, last_version)) for c in clients]
+
+    await asyncio.wait_for(asyncio.gather(*[c.ready.wait() for c in clients]), 10)
+
+    sender = threading.Thread(
+        target=send_status, args=(server, send_times, last_version, options.rate, options.time))
+    sender.start()
+
+    done, pending = await asyncio.wait(tasks, timeout=options.time + 10)
+    sender.join()
+
+    for task in pending:
+        task.cancel()
+
+    latency = sorted(sample for c in clients for sample in c.latency)
+    report = {
+        'clients': client_count,
+        'clients_done': len(done),
+        'sent': len(send_times),
+        'received_per_client': round(len(latency) / client_count, 1),
+        'latency_ms': {
+            'p50': round(get_percentile(latency, 50) * 1000, 3),
+            'p90': round(get_percentile(latency, 90) * 1000, 3),
+            'p99': round(get_percentile(latency, 99) * 1000, 3),
+            'max': round(latency[-1] * 1000, 3),
+        },
+    }
+
+    return report
+
+
+def wait_for_port(port):
+    for i in range(100):
+        try:
+            socket.create_connection(('localhost', port)).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+def main():
+    gc.init_config(None, None, None)
+
+    options = get_cli_params()
+    gc.CONFIG_DATA.set('/remote/TcpPort', options.port)
+
+    servers = sorted(SERVERS.keys()) if options.server == 'all' else [options.server]
+    report = {'rate': options.rate, 'time': options.time, 'runs': []}
+
+    for name in servers:
+        for client_count in [int(c) for c in options.clients.split(',')]:
+            server = SERVERS[name](None)
+            wait_for_port(options.port)
+
+            run = {'server': name}
+            run.update(asyncio.run(run_clients(server, options, client_count)))
+            report['runs'].append(run)
+
+            server.add_event(gc.EV_CMD_EXIT, None, -1)
+            server.join()
+
+    print(json.dumps(report, indent=2))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""----------------------------------------------------------------------------
+   remote_wire_bench.py:
+
+   Copyright (C) 2020 Wilhelm Duembeg
+
+   This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+   Grbl like GCODE interpreters. With features similar to software debuggers.
+   Features such as breakpoint, change current program counter, inspection
+   and modification of variables.
+
+   gsat is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 2 of the License, or
+   (at your option) any later version.
+
+   gsat is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+
+import os
+import sys
+import json
+import time
+import pickle
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.config as gc  # noqa: E402
+
+__appname__ = "gsat remote wire benchmark"
+
+__description__ = \
+    "encodes and decodes typical remote server messages with the binary " \
+    "wire format and with pickle and reports bytes and time per message"
+
+__version_info__ = (1, 0, 0)
+__version__ = 'v%i.%i.%i' % __version_info__
+__revision__ = __version__
+
+# sender is id() of the server, a 64 bit value
+SENDER = 0x7F3A5C2E1B40
+
+# messages as seen while streaming a job to grbl, status change-sets from
+# the exec thread (coalesced), echoed lines, program counter and state
+RECORDED_MESSAGES = [
+    (gc.EV_DATA_OUT, "G1 X12.345 Y-3.210 F1200\n"),
+    (gc.EV_DATA_STATUS, {'rx_data': "ok\n", 'pc': 1041, 'prcnt': "41.64%", 'ver': 5120}),
+    (gc.EV_DATA_STATUS, {
+        'posx': 12.345, 'posy': -3.21, 'vel': 1200.0, 'ib': [128, 97], 'ver': 5121}),
+    (gc.EV_DATA_OUT, "G1 X14.005 Y-3.870\nG1 X16.113 Y-4.250\n"),
+    (gc.EV_DATA_STATUS, {'rx_data': "ok\nok\n", 'pc': 1043, 'prcnt': "41.72%", 'ver': 5122}),
+    (gc.EV_DATA_STATUS, {
+        'posx': 16.113, 'posy': -4.25, 'ib': [128, 86], 'wco': [-10.0, -20.0, -5.0], 'ver': 5123}),
+    (gc.EV_PC_UPDATE, 1043),
+    (gc.EV_DATA_STATUS, {'stat': "Hold", 'vel': 300.0, 'posx': 17.4, 'posy': -4.5, 'ver': 5124}),
+    (gc.EV_SW_STATE, gc.STATE_PAUSE),
+    (gc.EV_DATA_IN, "[MSG: Feed hold]\n"),
+    (gc.EV_SW_STATE, gc.STATE_RUN),
+    (gc.EV_DATA_STATUS, {'stat': "Run", 'vel': 1200.0, 'rtime': "00:12:41", 'ver': 5125}),
+]
+
+
+def get_cli_params():
+    """
+    define, retrieve and error check command line interface (cli) params
+
+    """
+    parser = argparse.ArgumentParser(description=__description__)
+
+    parser.add_argument(
+        '-V', '--version',
+        action='version',
+        version=f"{sys.argv[0]} {__revision__} ({__appname__})")
+
+    parser.add_argument(
+        "-n", "--messages",
+        dest="messages",
+        type=int,
+        default=100000,
+        help="messages per pass, recording is repeated as needed")
+
+    parser.add_argument(
+        "-r", "--repeat",
+        dest="repeat",
+        type=int,
+        default=5,
+        help="passes per format, best pass is reported")
+
+    return parser.parse_args()
+
+
+def get_usec_per_msg(func, items, repeat):
+    best = None
+
+    for i in range(repeat):
+        time_start = time.perf_counter()
+
+        for item in items:
+            func(item)
+
+        elapsed = time.perf_counter() - time_start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return round(1000000 * best / len(items), 3)
+
+
+def get_format_report(events, encode, decode, repeat):
+    payloads = [encode(e) for e in events]
+
+    return {
+        'bytes_per_msg': round(sum(len(p) for p in payloads) / len(payloads) + gc.SOCK_HEADER_SIZE, 1),
+        'encode_usec_per_msg': get_usec_per_msg(encode, events, repeat),
+        'decode_usec_per_msg': get_usec_per_msg(decode, payloads, repeat),
+    }
+
+
+def check_round_trip(events):
+    """
+    Count messages that don't decode to what was encoded
+
+    """
+    mismatches = 0
+
+    for e in events:
+        d = gc.remote_msg_decode(gc.remote_msg_encode(e))
+
+        if (d.event_id, d.data, d.sender) != (e.event_id, e.data, e.sender):
+            mismatches += 1
+
+    return mismatches
+
+
+def main():
+    options = get_cli_params()
+
+    events = [gc.SimpleEvent(event_id, data, SENDER) for event_id, data in RECORDED_MESSAGES]
+
+    def pickle_encode(e):
+        return pickle.dumps(e, protocol=5)
+
+    formats = [
+        ('pickle', pickle_encode, pickle.loads),
+        ('binary', gc.remote_msg_encode, gc.remote_msg_decode),
+    ]
+
+    report = {
+        'wire_version': gc.REMOTE_WIRE_VERSION,
+        'messages': options.messages,
+        'mismatches': check_round_trip(events),
+    }
+
+    stream = (events * (options.messages // len(events) + 1))[:options.messages]
+    for name, encode, decode in formats:
+        report[name] = get_format_report(stream, encode, decode, options.repeat)
+
+    report['by_event'] = {}
+
+    # break down by event type
+    for event_id in sorted(set(e.event_id for e in events)):
+        subset = [e for e in events if e.event_id == event_id]
+        subset = (subset * (options.messages // len(events) // len(subset) + 1))
+
+        report['by_event'][event_id] = {
+            name: get_format_report(subset, encode, decode, options.repeat) for name, encode, decode in formats}
+
+    print(json.dumps(report, indent=2))
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
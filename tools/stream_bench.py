@@ -0,0 +1,427 @@
+#!/usr/bin/env python
+"""----------------------------------------------------------------------------
+   stream_bench.py:
+
+   Copyright (C) 2020 Wilhelm Duembeg
+
+   This file is part of gsat. gsat is a cross-platform GCODE debug/step for
+   Grbl like GCODE interpreters. With features similar to software debuggers.
+   Features such as breakpoint, change current program counter, inspection
+   and modification of variables.
+
+   gsat is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 2 of the License, or
+   (at your option) any later version.
+
+   gsat is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with gsat.  If not, see <http://www.gnu.org/licenses/>.
+
+----------------------------------------------------------------------------"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import platform
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import modules.config as gc  # noqa: E402
+import modules.version_info as vinfo  # noqa: E402
+
+__appname__ = "gsat streaming benchmark"
+
+__description__ = \
+    "runs synthetic gcode through the machine interface exec thread " \
+    "against simulated devices and reports streaming throughput"
+
+__version_info__ = (1, 0, 0)
+__version__ = 'v%i.%i.%i' % __version_info__
+__revision__ = __version__
+
+CORPUS_LIST = ["dense", "arcs", "cam", "large"]
+CORPUS_DEFAULT = "dense,arcs,cam"
+MODE_LIST = ["stream", "ack"]
+
+
+def get_cli_params():
+    """
+    define, retrieve and error check command line interface (cli) params
+
+    """
+    import modules.machif_config as mc
+
+    parser = argparse.ArgumentParser(description=__description__)
+
+    parser.add_argument(
+        '-V', '--version',
+        action='version',
+        version=f"{sys.argv[0]} {__revision__} ({__appname__})")
+
+    parser.add_argument(
+        "-d", "--devices",
+        dest="devices",
+        default=",".join(mc.MACHIF_LIST),
+        help=f"devices separated by ',' options are {mc.MACHIF_LIST}")
+
+    parser.add_argument(
+        "-c", "--corpus",
+        dest="corpus",
+        default=CORPUS_DEFAULT,
+        help=f"corpora separated by ',' options are {CORPUS_LIST}, \"large\" "
+             f"is 1M lines, line count can be set per corpus i.e. dense:20000")
+
+    parser.add_argument(
+        "-m", "--modes",
+        dest="modes",
+        default=",".join(MODE_LIST),
+        help=f"send modes separated by ',' options are {MODE_LIST}, \"ack\" "
+             "waits for each line acknowledge")
+
+    parser.add_argument(
+        "-n", "--lines",
+        dest="lines",
+        type=int,
+        default=5000,
+        help="lines per corpus, \"large\" is not affected (default %(default)s)")
+
+    parser.add_argument(
+        "-b", "--baud",
+        dest="baud",
+        type=int,
+        default=115200,
+        help="simulated serial baud rate (default %(default)s)")
+
+    parser.add_argument(
+        "--block-time",
+        dest="block_time",
+        type=float,
+        default=0.0,
+        help="simulated device planner block time in seconds, 0 measures "
+             "the host and serial path only (default %(default)s)")
+
+    parser.add_argument(
+        "-t", "--timeout",
+        dest="timeout",
+        type=float,
+        default=1800,
+        help="max time per run in seconds (default %(default)s)")
+
+    parser.add_argument(
+        "-o", "--outfile",
+        dest="outfile",
+        default=None,
+        help="JSON results file name (optional, if missing will use stdout)",
+        metavar="FILE")
+
+    parser.add_argument(
+        "--baseline",
+        dest="baseline",
+        default=None,
+        help="JSON results from a previous run, exit with error if lines/s "
+             "for any run drops more than --tolerance",
+        metavar="FILE")
+
+    parser.add_argument(
+        "--tolerance",
+        dest="tolerance",
+        type=float,
+        default=10.0,
+        help="allowed lines/s drop against baseline in percent "
+             "(default %(default)s)")
+
+    options = parser.parse_args()
+
+    options.devices = [d.strip() for d in options.devices.split(',') if d.strip()]
+    for device in options.devices:
+        if device not in mc.MACHIF_LIST:
+            parser.error(f"unknown device [{device}]")
+
+    options.modes = [m.strip() for m in options.modes.split(',') if m.strip()]
+    for mode in options.modes:
+        if mode not in MODE_LIST:
+            parser.error(f"unknown mode [{mode}]")
+
+    corpus_list = []
+    for corpus in options.corpus.split(','):
+        name, _, lines = corpus.strip().partition(':')
+
+        if name not in CORPUS_LIST:
+            parser.error(f"unknown corpus [{name}]")
+
+        if lines:
+            lines = int(lines)
+        elif name == "large":
+            lines = 1000000
+        else:
+            lines = options.lines
+
+        corpus_list.append((name, lines))
+
+    options.corpus = corpus_list
+
+    return options
+
+
+def gen_corpus(name, line_count):
+    """
+    Synthetic gcode corpus, deterministic for a given name and line count
+
+    dense: short G1 segments, typical of 3D surfacing/engraving
+    arcs: long G2/G3 lines with I/J offsets
+    cam: CAM post output, line numbers, comment lines and trailing comments
+    large: dense at 1M lines
+
+    """
+    lines = ["G21", "G90", "G1 F1500"]
+
+    if name in ["dense", "large"]:
+        for i in range(line_count - len(lines)):
+            a = i * 0.01
+            lines.append("G1 X%.3f Y%.3f" % (10 * math.cos(a), 10 * math.sin(a)))
+
+    elif name == "arcs":
+        for i in range(line_count - len(lines)):
+            r = 5 + (i % 50) * 0.5
+            cmd = "G2" if i % 2 else "G3"
+            lines.append("%s X%.4f Y%.4f Z%.4f I%.4f J%.4f F1200" % (
+                cmd, r * math.cos(i), r * math.sin(i), -0.1 * (i % 10), -r / 2, r / 3))
+
+    elif name == "cam":
+        for i in range(line_count - len(lines)):
+            n = (i + 1) * 10
+            if i % 5 == 0:
+                lines.append(f"(operation {i // 5}, contour pass, tool T1 D=3.175 CR=0. - ZMIN=-1. - flat end mill)")
+            elif i % 5 == 1:
+                lines.append(f"; segment {i}, feed per tooth 0.05 mm")
+            else:
+                lines.append("N%d G1 X%.3f Y%.3f (cut %d)" % (n, 0.1 * (i % 300), 0.2 * (i % 150), i))
+
+    return lines[:line_count]
+
+
+class BenchListener(gc.EventQueueIf):
+    """
+    Collect exec thread events for one run
+
+    """
+
+    def __init__(self):
+        gc.EventQueueIf.__init__(self)
+
+        self.fillSum = 0.0
+        self.fillCount = 0
+        self.fillMax = 0.0
+        self.errorCount = 0
+
+    def wait_for(self, event_ids, timeout):
+        """
+        Process events until one of event ids is received, returns event
+        or None on timeout
+
+        """
+        deadline = time.monotonic() + timeout
+
+        while time.monotonic() < deadline:
+            self.wait_for_event(min(0.5, max(0, deadline - time.monotonic())))
+
+            for e in self.get_events():
+                if e.event_id == gc.EV_DATA_STATUS:
+                    self.process_status(e.data)
+
+                if e.event_id in event_ids:
+                    return e
+
+        return None
+
+    def process_status(self, data):
+        ib = data.get('ib')
+
+        if ib is None and isinstance(data.get('sr'), dict):
+            ib = data['sr'].get('ib')
+
+        if ib and ib[0]:
+            fill = float(ib[1]) / ib[0]
+            self.fillSum += fill
+            self.fillCount += 1
+            self.fillMax = max(self.fillMax, fill)
+
+        f = data.get('f')
+        if f and len(f) > 1 and f[1]:
+            self.errorCount += 1
+
+
+def run_bench(device, corpus, line_count, mode, options):
+    """
+    Run one corpus through exec thread RUN, returns result dict
+
+    """
+    import modules.device_sim as ds
+    import modules.machif_progexec as mpe
+
+    port = f"{ds.SIM_PORT_PREFIX}{device.lower()}?block_time={options.block_time}"
+
+    gc.CONFIG_DATA.set('/machine/Device', device)
+    gc.CONFIG_DATA.set('/machine/Port', port)
+    gc.CONFIG_DATA.set('/machine/Baud', str(options.baud))
+    gc.CONFIG_DATA.set('/machine/StreamingEnable', mode == "stream")
+    gc.CONFIG_DATA.set('/machine/FilterGcodesEnable', False)
+    gc.CONFIG_DATA.set('/machine/InitScriptEnable', False)
+
+    lines = gen_corpus(corpus, line_count)
+    program = mpe.GcodeProgram(lines)
+    txBytes = sum(len(program.getSendData(i)) for i in range(len(program)))
+    txLines = sum(1 for i in range(len(program)) if program.getSendData(i))
+
+    result = {
+        'device': device,
+        'corpus': corpus,
+        'mode': mode,
+        'lines': len(lines),
+        'tx_lines': txLines,
+        'tx_bytes': txBytes,
+        'baud': options.baud,
+        'block_time': options.block_time,
+    }
+
+    listener = BenchListener()
+    execThread = mpe.MachIfExecuteThread(listener)
+
+    try:
+        # wait for device to come up, then let post init commands settle
+        listener.wait_for([gc.EV_DEVICE_DETECTED], 5)
+        listener.wait_for([], 0.5)
+
+        simThread = ds.get_sim_thread(port)
+        if simThread is None:
+            result['error'] = "simulated device did not start"
+            return result
+
+        simCpuStart = simThread.cpuTime
+        cpuStart = time.process_time()
+        timeStart = time.perf_counter()
+
+        execThread.add_event(gc.EV_CMD_RUN, {
+            'gcodeLines': lines, 'gcodePC': 0, 'breakPoints': set()})
+
+        e = listener.wait_for([gc.EV_RUN_END, gc.EV_ABORT], options.timeout)
+
+        elapsed = time.perf_counter() - timeStart
+        hostCpu = (time.process_time() - cpuStart) - (simThread.cpuTime - simCpuStart)
+
+        if e is None:
+            result['error'] = "timeout"
+        elif e.event_id == gc.EV_ABORT:
+            result['error'] = f"abort: {str(e.data).strip()}"
+
+        result.update({
+            'time': round(elapsed, 4),
+            'lines_per_sec': round(txLines / elapsed, 1),
+            'bytes_per_sec': round(txBytes / elapsed, 1),
+            'serial_utilization_prcnt': round(100 * txBytes * 10 / elapsed / options.baud, 2),
+            'buffer_fill_avg_prcnt': round(100 * listener.fillSum / max(1, listener.fillCount), 2),
+            'buffer_fill_max_prcnt': round(100 * listener.fillMax, 2),
+            'host_cpu_prcnt': round(100 * hostCpu / elapsed, 2),
+            'host_usec_per_line': round(1e6 * hostCpu / max(1, txLines), 2),
+            'device_errors': simThread.device.errorCount,
+            'device_rx_overflows': simThread.device.rxOverflowCount,
+        })
+
+    finally:
+        execThread.add_event(gc.EV_CMD_EXIT)
+        execThread.join(5)
+        ds.close_sim_ports()
+
+    return result
+
+
+def check_baseline(results, baseline_file, tolerance):
+    """
+    Compare lines/s against baseline results, returns list of regressions
+
+    """
+    with open(baseline_file) as f:
+        baseline = json.load(f)
+
+    baselineDict = dict()
+    for r in baseline.get('results', []):
+        baselineDict[(r['device'], r['corpus'], r['mode'], r['lines'])] = r
+
+    regressions = []
+    for r in results:
+        b = baselineDict.get((r['device'], r['corpus'], r['mode'], r['lines']))
+
+        if b is None or 'lines_per_sec' not in b or 'lines_per_sec' not in r:
+            continue
+
+        drop = 100 * (b['lines_per_sec'] - r['lines_per_sec']) / b['lines_per_sec']
+        if drop > tolerance:
+            regressions.append(
+                f"{r['device']} {r['corpus']} {r['mode']}: {r['lines_per_sec']} lines/s, "
+                f"baseline {b['lines_per_sec']} lines/s ({drop:.1f}% drop)")
+
+    return regressions
+
+
+def main():
+    gc.init_config(None, None, None)
+
+    options = get_cli_params()
+    results = []
+
+    for device in options.devices:
+        for corpus, line_count in options.corpus:
+            for mode in options.modes:
+                r = run_bench(device, corpus, line_count, mode, options)
+                results.append(r)
+
+                sys.stderr.write(
+                    f"{device:>8} {corpus:>6} {mode:>6} {r['lines']:>8} lines "
+                    f"{r.get('lines_per_sec', 0):>9.1f} lines/s "
+                    f"{r.get('serial_utilization_prcnt', 0):>6.2f}% serial "
+                    f"{r.get('buffer_fill_avg_prcnt', 0):>6.2f}% buffer "
+                    f"{r.get('host_usec_per_line', 0):>8.1f} us/line "
+                    f"{r.get('error', '')}\n")
+
+    report = {
+        'gsat_version': vinfo.__version__,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+
+    reportStr = json.dumps(report, indent=2)
+
+    if options.outfile is None:
+        print(reportStr)
+    else:
+        with open(options.outfile, 'w') as f:
+            f.write(reportStr)
+            f.write("\n")
+
+    rc = 0
+    if any('error' in r for r in results):
+        rc = 2
+
+    if options.baseline is not None:
+        regressions = check_baseline(results, options.baseline, options.tolerance)
+
+        for regression in regressions:
+            sys.stderr.write(f"regression, {regression}\n")
+
+        if regressions:
+            rc = 1
+
+    return rc
+
+
+if __name__ == '__main__':
+    sys.exit(main())